@@ -8,8 +8,13 @@ from rest_framework import status
 from rest_framework.authtoken.models import Token
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from apps.core.serializers import SchoolSerializer
-from rest_framework.permissions import IsAuthenticated
+from apps.core.async_utils import authenticate_request, fan_out
+from apps.core.models import School, Subject
+from apps.core.serializers import SchoolSerializer, SubjectSerializer
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views import View
 
 class UserListCreateAPIView(generics.ListCreateAPIView):
     queryset = User.objects.all()
@@ -39,12 +44,49 @@ class LoginView(APIView):
             }, status=status.HTTP_200_OK)
         return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
-class DashboardView(APIView):
-    permission_classes = [IsAuthenticated]  # Only authenticated users can access this endpoint.
+class DashboardView(View):
+    """
+    The user's school with its years and subjects.
 
-    def get(self, request, format=None):
-        user = request.user
-        if not user.school:
-            return Response({"error": "User not associated with any school."}, status=status.HTTP_400_BAD_REQUEST)
-        serializer = SchoolSerializer(user.school)
-        return Response(serializer.data)
+    Async: the school, its years and its subjects are loaded concurrently
+    and then serialized exactly like ``SchoolSerializer``. ``?fields=``
+    limits the top-level fields; leaving out ``years`` skips those queries.
+    """
+
+    async def get(self, request, format=None):
+        user = await authenticate_request(request)
+        if user is None:
+            return JsonResponse({"detail": "Invalid or missing token."}, status=status.HTTP_401_UNAUTHORIZED)
+        if not user.school_id:
+            return JsonResponse({"error": "User not associated with any school."}, status=status.HTTP_400_BAD_REQUEST)
+
+        fields = [name.strip() for name in request.GET.get('fields', '').split(',') if name.strip()] or None
+        with_years = fields is None or 'years' in fields
+        school, school_years, subjects = await fan_out(
+            lambda: School.objects.select_related('region', 'school_type').get(pk=user.school_id),
+            lambda: list(School.years.through.objects.filter(school_id=user.school_id).select_related('year')) if with_years else [],
+            lambda: list(Subject.objects.filter(school_id=user.school_id)
+                .prefetch_related(*SubjectSerializer.get_prefetch_lookups())) if with_years else [],
+        )
+
+        def serialize():
+            serializer = SchoolSerializer(school, fields=fields)
+            # Years are assembled below from the prefetched rows.
+            serializer.fields.pop('years', None)
+            data = serializer.data
+            if with_years:
+                subjects_by_year = {}
+                for subject in subjects:
+                    subjects_by_year.setdefault(subject.year_id, []).append(subject)
+                data['years'] = [
+                    {
+                        "id": link.year.id,
+                        "name": link.year.name,
+                        "division": link.year.division,
+                        "subjects": SubjectSerializer(subjects_by_year.get(link.year_id, []), many=True).data,
+                    }
+                    for link in school_years
+                ]
+            return data
+
+        return JsonResponse(await sync_to_async(serialize)(), encoder=DjangoJSONEncoder)
@@ -7,3 +7,17 @@ class CoreConfig(AppConfig):
 
     def ready(self):
         import apps.core.signals
+
+        from django.conf import settings
+        from django.db.backends.signals import connection_created
+
+        if settings.SLOW_QUERY_LOG:
+            from .slow_queries import install
+            connection_created.connect(install, dispatch_uid='slow_query_log')
+        if settings.METRICS_ENABLED:
+            from .metrics import install as install_metrics
+            connection_created.connect(install_metrics, dispatch_uid='metrics')
+        if settings.TRACING_ENABLED:
+            from . import tracing
+            tracing.install_hooks()
+            connection_created.connect(tracing.install, dispatch_uid='tracing')
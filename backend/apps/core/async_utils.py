@@ -0,0 +1,86 @@
+# core/async_utils.py
+"""
+Helpers for the plain async Django views that serve aggregate endpoints.
+
+DRF views are synchronous, so the async views authenticate tokens
+themselves and use ``fan_out`` to run their independent queries at the
+same time.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+
+async def authenticate_request(request, allow_query_token=False):
+    """
+    Resolve the token from ``Authorization: Token <key>`` to an active
+    user. Returns ``None`` when the credentials are missing or invalid.
+
+    ``allow_query_token`` also accepts ``?token=``, for clients that cannot
+    send headers; query strings end up in access logs, so only endpoints
+    that need it opt in.
+    """
+    key = None
+    auth_header = request.headers.get('Authorization', '').split()
+    if len(auth_header) == 2 and auth_header[0] == 'Token':
+        key = auth_header[1]
+    if not key and allow_query_token:
+        key = request.GET.get('token')
+    if not key:
+        return None
+    try:
+        user, _ = await sync_to_async(TokenAuthentication().authenticate_credentials)(key)
+    except AuthenticationFailed:
+        return None
+    return user
+
+
+def release_connections():
+    """
+    Hand the calling thread's database connections back to the pool (or
+    close them) now rather than on ``request_finished``.
+
+    Under ASGI that signal fires once the response body has been sent, so
+    a streaming response would otherwise hold its connection for as long
+    as the client listens. Connections inside a transaction are kept.
+    """
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close()
+
+
+def _run_on_own_connection(func):
+    try:
+        return func()
+    finally:
+        # Worker threads outlive the request, so apply the same
+        # CONN_MAX_AGE housekeeping Django does at the end of a request.
+        close_old_connections()
+
+
+async def fan_out(*funcs):
+    """
+    Run independent ORM callables concurrently and return their results in order.
+
+    Django's async ORM funnels every query through one thread per request,
+    so each callable gets a thread of its own (and therefore a database
+    connection of its own) instead. Setting ``AGGREGATE_QUERY_FAN_OUT`` to
+    ``False`` runs them one after another on the request's connection,
+    which is what test cases wrapped in a transaction need.
+
+    At most ``AGGREGATE_QUERY_CONCURRENCY`` callables run at once, so a
+    request never holds more than that many pooled connections besides its own.
+    """
+    if not getattr(settings, 'AGGREGATE_QUERY_FAN_OUT', True):
+        return [await sync_to_async(func)() for func in funcs]
+    limit = asyncio.Semaphore(max(1, getattr(settings, 'AGGREGATE_QUERY_CONCURRENCY', 2)))
+
+    async def run(func):
+        async with limit:
+            return await sync_to_async(_run_on_own_connection, thread_sensitive=False)(func)
+
+    return await asyncio.gather(*(run(func) for func in funcs))
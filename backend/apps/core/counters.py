@@ -0,0 +1,168 @@
+# core/counters.py
+"""
+Denormalized content counters on ``Subject`` and ``School``.
+
+``learning_situation_count``, ``module_count``, ``planning_unit_count``
+and ``file_count`` (attachments in ``Module.files``) are adjusted by the
+signal handlers in ``signals.py`` whenever a learning situation, module
+or planning unit is created, deleted, moved to another subject or has
+its files changed. The adjustment runs in the same transaction as the
+write: deletes are atomic in Django and the counted models save inside
+``transaction.atomic`` (``CountedContentMixin``).
+
+Writes that skip signals (``bulk_create``, ``QuerySet.update``, raw SQL)
+leave the counters behind; ``manage.py reconcile_counters`` recomputes
+them with ``reconcile()``.
+
+Subject counters are served in the cached year tree (``/years/``), and
+``QuerySet.update`` sends no ``post_save``, so every change to them bumps
+the school's ``years:<school_id>`` reference catalog once the transaction
+commits. Other schools keep their cached trees.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Count, F, Func, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import ContentCounters, LearningSituation, Module, PlanningUnit, School, Subject
+from .reference_cache import reference_cache, school_catalog
+
+COUNTER_FIELDS = ContentCounters.COUNTER_FIELDS
+MODEL_COUNTERS = {
+    LearningSituation: 'learning_situation_count',
+    Module: 'module_count',
+    PlanningUnit: 'planning_unit_count',
+}
+
+# What a counted row contributes: its subject, its school (None for
+# planning units, whose school is the subject's) and its number of files
+# (None when ``files`` was not loaded).
+CountedState = namedtuple('CountedState', 'subject_id school_id files')
+
+
+def file_count(files):
+    return len(files) if isinstance(files, list) else 0
+
+
+def state(instance):
+    """The counters ``instance`` contributes to, without loading deferred fields."""
+    values = instance.__dict__
+    if isinstance(instance, Module):
+        files = file_count(values['files']) if 'files' in values else None
+    else:
+        files = 0
+    return CountedState(values.get('subject_id'), values.get('school_id'), files)
+
+
+def apply(model, old, new):
+    """Move ``model``'s contribution from state ``old`` to ``new`` (either may be None)."""
+    if old is not None and new is not None and None in (old.files, new.files):
+        # ``files`` was not loaded, so the save did not change it either.
+        old, new = old._replace(files=0), new._replace(files=0)
+    old = old and old._replace(files=old.files or 0)
+    new = new and new._replace(files=new.files or 0)
+    if old == new:
+        return
+
+    field = MODEL_COUNTERS[model]
+    subject_deltas, school_deltas = {}, {}
+    for counted, sign in ((old, -1), (new, 1)):
+        if counted is None or counted.subject_id is None:
+            continue
+        school = ('pk', counted.school_id) if counted.school_id else ('subjects', counted.subject_id)
+        for deltas in (subject_deltas.setdefault(counted.subject_id, {}), school_deltas.setdefault(school, {})):
+            deltas[field] = deltas.get(field, 0) + sign
+            deltas['file_count'] = deltas.get('file_count', 0) + sign * counted.files
+
+    # Subjects before schools, each in key order, so concurrent writers
+    # take the row locks in the same order.
+    for subject_id, deltas in sorted(subject_deltas.items(), key=lambda item: str(item[0])):
+        _update(Subject.objects.filter(pk=subject_id), deltas)
+    for (lookup, value), deltas in sorted(school_deltas.items(), key=lambda item: str(item[0][1])):
+        _update(School.objects.filter(**{lookup: value}), deltas)
+
+    school_ids = {value for lookup, value in school_deltas if lookup == 'pk'}
+    subject_ids = [value for lookup, value in school_deltas if lookup == 'subjects']
+    if subject_ids:
+        school_ids.update(Subject.objects.filter(pk__in=subject_ids).values_list('school_id', flat=True))
+    _bump_years(school_ids)
+
+
+def _bump_years(school_ids):
+    for school_id in school_ids:
+        # After commit, so no other process caches pre-commit counts under the new version.
+        transaction.on_commit(lambda school_id=school_id: reference_cache.bump(school_catalog('years', school_id)))
+
+
+def _update(queryset, deltas):
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if changes:
+        queryset.update(**changes)
+
+
+def _count(queryset, column):
+    return Coalesce(Subquery(
+        queryset.values(column).annotate(total=Count('pk')).values('total'), output_field=IntegerField(),
+    ), Value(0))
+
+
+class JSONArrayLength(Func):
+    """Length of a jsonb array; 0 for NULL and non-array values."""
+    template = "CASE WHEN jsonb_typeof(%(expressions)s) = 'array' THEN jsonb_array_length(%(expressions)s) ELSE 0 END"
+    output_field = IntegerField()
+
+
+def _files(queryset, column):
+    return Coalesce(Subquery(
+        queryset.values(column).annotate(total=Sum(JSONArrayLength('files'))).values('total'),
+        output_field=IntegerField(),
+    ), Value(0))
+
+
+def subject_counts():
+    return {
+        'learning_situation_count': _count(LearningSituation.objects.filter(subject=OuterRef('pk')), 'subject'),
+        'module_count': _count(Module.objects.filter(subject=OuterRef('pk')), 'subject'),
+        'planning_unit_count': _count(PlanningUnit.objects.filter(subject=OuterRef('pk')), 'subject'),
+        'file_count': _files(Module.objects.filter(subject=OuterRef('pk')), 'subject'),
+    }
+
+
+def school_counts():
+    return {
+        'learning_situation_count': _count(LearningSituation.objects.filter(school=OuterRef('pk')), 'school'),
+        'module_count': _count(Module.objects.filter(school=OuterRef('pk')), 'school'),
+        'planning_unit_count': _count(PlanningUnit.objects.filter(subject__school=OuterRef('pk')), 'subject__school'),
+        'file_count': _files(Module.objects.filter(school=OuterRef('pk')), 'school'),
+    }
+
+
+def _stale():
+    """Rows whose stored counters differ from ``counts`` (annotated as ``actual_<field>``)."""
+    stale = Q()
+    for field in COUNTER_FIELDS:
+        stale |= ~Q(**{field: F(f'actual_{field}')})
+    return stale
+
+
+def reconcile(school_ids, dry_run=False):
+    """
+    Recompute the counters of ``school_ids`` and their subjects.
+
+    Returns the number of subjects and schools whose counters were wrong.
+    Only those rows are rewritten, with one UPDATE per table.
+    """
+    result = {}
+    for model, counts in ((Subject, subject_counts()), (School, school_counts())):
+        rows = model.objects.filter(**{'school_id__in' if model is Subject else 'pk__in': school_ids})
+        stale = dict(
+            rows.annotate(**{f'actual_{field}': expression for field, expression in counts.items()})
+            .filter(_stale()).values_list('pk', 'school_id' if model is Subject else 'pk')
+        )
+        if stale and not dry_run:
+            model.objects.filter(pk__in=list(stale)).update(**counts)
+            if model is Subject:
+                _bump_years(set(stale.values()))
+        result[model._meta.model_name] = len(stale)
+    return result
@@ -0,0 +1,97 @@
+# core/coverage.py
+"""
+Competence coverage, computed the same way as the frontend's
+``CompetenceCoverage`` component: a competence is addressed when a module
+lists it in ``specific_competences`` and a criterion is covered when a
+module selects it in ``selected_criteria``.
+"""
+
+
+def coverage_status(addressed, total_criteria, covered_count):
+    if not addressed:
+        return 'not_covered', 0
+    if total_criteria == 0:
+        return 'fully_covered', 100
+    if covered_count == 0:
+        return 'not_covered', 0
+    if covered_count == total_criteria:
+        return 'fully_covered', 100
+    return 'partially_covered', covered_count / total_criteria * 100
+
+
+def count_coverage(modules):
+    """
+    Count, for ``modules``, the modules addressing each competence and the
+    modules selecting each ``(competence, criterion)``. Modules are plain
+    dicts or objects exposing ``specific_competences`` and
+    ``selected_criteria``.
+    """
+    module_counts = {}
+    criterion_counts = {}
+    for module in modules:
+        module_competences = {str(value) for value in _get(module, 'specific_competences') or []}
+        selected = _get(module, 'selected_criteria') or {}
+        for competence_id in module_competences:
+            module_counts[competence_id] = module_counts.get(competence_id, 0) + 1
+            for criterion_id in set(selected.get(competence_id) or []):
+                key = (competence_id, str(criterion_id))
+                criterion_counts[key] = criterion_counts.get(key, 0) + 1
+    return module_counts, criterion_counts
+
+
+def coverage_report(competences, module_counts, criterion_counts):
+    """The coverage report for ``competences`` given the counts from ``count_coverage``."""
+    competence_rows = []
+    for competence in competences:
+        competence_id = str(competence.id)
+        criteria = competence.evaluation_criteria or []
+        criteria_rows = [
+            {
+                'id': criterion.get('id'),
+                'code': criterion.get('code'),
+                'description': criterion.get('description'),
+                'module_count': criterion_counts.get((competence_id, str(criterion.get('id'))), 0),
+            }
+            for criterion in criteria
+        ]
+        covered_count = sum(1 for row in criteria_rows if row['module_count'])
+        addressed = competence_id in module_counts
+        coverage, percentage = coverage_status(addressed, len(criteria_rows), covered_count)
+        competence_rows.append({
+            'id': competence_id,
+            'code': competence.code,
+            'description': competence.description,
+            'module_count': module_counts.get(competence_id, 0),
+            'total_criteria': len(criteria_rows),
+            'covered_count': covered_count,
+            'coverage_percentage': percentage,
+            'coverage_status': coverage,
+            'criteria': criteria_rows,
+        })
+    return {'competences': competence_rows, 'stats': coverage_stats(competence_rows)}
+
+
+def coverage_stats(competence_rows):
+    total_criteria = sum(row['total_criteria'] for row in competence_rows)
+    total_covered = sum(row['covered_count'] for row in competence_rows)
+    return {
+        'total_competences': len(competence_rows),
+        'fully_covered_competences': sum(1 for row in competence_rows if row['coverage_status'] == 'fully_covered'),
+        'partially_covered_competences': sum(1 for row in competence_rows if row['coverage_status'] == 'partially_covered'),
+        'uncovered_competences': sum(1 for row in competence_rows if row['coverage_status'] == 'not_covered'),
+        'total_criteria': total_criteria,
+        'total_covered_criteria': total_covered,
+        'overall_coverage_percentage': total_covered / total_criteria * 100 if total_criteria else 0,
+    }
+
+
+def compute_coverage(competences, modules):
+    """
+    Build the coverage report for ``competences`` given the ``modules`` that
+    are in use.
+    """
+    return coverage_report(competences, *count_coverage(modules))
+
+
+def _get(module, name):
+    return module.get(name) if isinstance(module, dict) else getattr(module, name)
@@ -0,0 +1,120 @@
+# core/coverage_summary.py
+"""
+School-wide competence coverage summary (``CoverageSummary``).
+
+For every subject the table holds, per competence and per criterion, how
+many of the modules used in the subject's learning situations address or
+select it: the same counts ``coverage.count_coverage`` computes in
+Python, aggregated in SQL.
+
+The signal handlers in ``signals.py`` rebuild the rows of the affected
+subjects inside the transaction of the change: when a module's
+``specific_competences`` or ``selected_criteria`` are saved, when a
+module joins or leaves a learning situation, and when a learning
+situation or module is deleted or a learning situation moves to another
+subject. A subject's rows are rebuilt as a whole with one DELETE and one
+INSERT ... SELECT over its few dozen modules.
+
+``refresh_schools`` is the fallback for changes that skip signals (bulk
+imports, ``QuerySet.update``). Like ``REFRESH MATERIALIZED VIEW
+CONCURRENTLY`` it never blocks readers: each batch is rebuilt in a
+transaction and readers keep seeing the old rows until it commits. Run it
+with ``manage.py refresh_coverage_summary``.
+"""
+from django.db import connections, router
+
+from .models import CoverageSummary, LearningSituation, Module, Subject
+
+REBUILD_SQL = """
+WITH used AS (
+    SELECT DISTINCT ls.subject_id, m.id AS module_id, m.specific_competences, m.selected_criteria
+    FROM {situation} ls
+    JOIN {situation_modules} lm ON lm.learningsituation_id = ls.id
+    JOIN {module} m ON m.id = lm.module_id
+    WHERE ls.subject_id = ANY(%(subjects)s::uuid[])
+),
+addressed AS (
+    SELECT DISTINCT used.subject_id, used.module_id, competence.id AS competence_id, used.selected_criteria
+    FROM used CROSS JOIN LATERAL unnest(used.specific_competences) AS competence(id)
+),
+counts AS (
+    SELECT subject_id, competence_id, '' AS criterion_id, count(*) AS module_count
+    FROM addressed
+    GROUP BY subject_id, competence_id
+    UNION ALL
+    SELECT addressed.subject_id, addressed.competence_id, criterion.id, count(DISTINCT addressed.module_id)
+    FROM addressed CROSS JOIN LATERAL jsonb_array_elements_text(
+        CASE WHEN jsonb_typeof(addressed.selected_criteria -> addressed.competence_id::text) = 'array'
+             THEN addressed.selected_criteria -> addressed.competence_id::text
+             ELSE '[]'::jsonb END
+    ) AS criterion(id)
+    GROUP BY addressed.subject_id, addressed.competence_id, criterion.id
+)
+INSERT INTO {summary} (school_id, subject_id, year_id, competence_id, criterion_id, module_count)
+SELECT subject.school_id, counts.subject_id, subject.year_id, counts.competence_id, counts.criterion_id,
+       counts.module_count
+FROM counts JOIN {subject} subject ON subject.id = counts.subject_id
+"""
+
+
+def _tables():
+    return {
+        'situation': LearningSituation._meta.db_table,
+        'situation_modules': LearningSituation.modules.through._meta.db_table,
+        'module': Module._meta.db_table,
+        'summary': CoverageSummary._meta.db_table,
+        'subject': Subject._meta.db_table,
+    }
+
+
+def rebuild_subjects(subject_ids):
+    """Rebuild the summary rows of ``subject_ids``; call inside a transaction."""
+    subject_ids = sorted({str(subject_id) for subject_id in subject_ids if subject_id})
+    if not subject_ids:
+        return
+    using = router.db_for_write(CoverageSummary)
+    tables = _tables()
+    with connections[using].cursor() as cursor:
+        # Serialize rebuilds of the same subject; the order avoids deadlocks.
+        cursor.execute(
+            f"SELECT id FROM {tables['subject']} WHERE id = ANY(%s::uuid[]) ORDER BY id FOR NO KEY UPDATE",
+            [subject_ids],
+        )
+        cursor.execute(f"DELETE FROM {tables['summary']} WHERE subject_id = ANY(%s::uuid[])", [subject_ids])
+        cursor.execute(REBUILD_SQL.format(**tables), {'subjects': subject_ids})
+
+
+NOT_LOADED = object()
+
+
+def module_state(instance):
+    """
+    Copies of the coverage fields of a module as loaded, so that changes
+    made to them in place still show up on save; ``NOT_LOADED`` for
+    deferred fields.
+    """
+    values = instance.__dict__
+    competences = values.get('specific_competences', NOT_LOADED)
+    criteria = values.get('selected_criteria', NOT_LOADED)
+    if isinstance(competences, list):
+        competences = list(competences)
+    if isinstance(criteria, dict):
+        criteria = {key: list(value) if isinstance(value, list) else value for key, value in criteria.items()}
+    return competences, criteria
+
+
+def subjects_using_module(module_id):
+    return set(
+        LearningSituation.objects.filter(modules=module_id).values_list('subject_id', flat=True).distinct()
+    )
+
+
+def subjects_of_situations(situation_ids):
+    return set(
+        LearningSituation.objects.filter(pk__in=situation_ids).values_list('subject_id', flat=True).distinct()
+    )
+
+
+def refresh_schools(school_ids):
+    """Rebuild the summary of every subject of ``school_ids``; call inside a transaction."""
+    rebuild_subjects(Subject.objects.filter(school_id__in=school_ids).values_list('pk', flat=True))
@@ -0,0 +1,37 @@
+# core/db_routers.py
+"""
+Read-replica routing.
+
+Reads go to a replica only while ``ReplicaRoutingMiddleware`` has marked the
+current request as replica-safe: a GET/HEAD/OPTIONS request from a client
+that has not written anything within ``REPLICA_PIN_SECONDS``. Everything
+else, including management commands and background work, uses ``default``.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not use_replica.get():
+            return 'default'
+        aliases = replica_aliases()
+        return random.choice(aliases) if aliases else 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
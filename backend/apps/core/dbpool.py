@@ -0,0 +1,27 @@
+# core/dbpool.py
+from django.db import connections
+
+
+def pool_stats():
+    """
+    Usage counters of this process's connection pools, keyed by database alias.
+
+    Every worker process holds its own pools, so the numbers describe the
+    process that runs this call only; with several workers, the totals are
+    the sum over all of them and one sample is not representative.
+
+    ``requests_wait_ms`` and ``usage_ms`` are cumulative, so averages are
+    derived from them and ``requests_num``. Aliases without a pool are
+    left out.
+    """
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is None:
+            continue
+        counters = pool.get_stats()
+        requests = counters.get('requests_num', 0)
+        counters['avg_wait_ms'] = counters.get('requests_wait_ms', 0) / requests if requests else 0
+        counters['avg_usage_ms'] = counters.get('usage_ms', 0) / requests if requests else 0
+        stats[alias] = counters
+    return stats
@@ -0,0 +1,212 @@
+# core/duplicates.py
+"""
+Near-duplicate module detection with MinHash and locality-sensitive
+hashing.
+
+A module is described by the set of 5-character shingles of its title
+and description (lowercased, accents and punctuation removed) plus one
+token per specific competence. Its ``NUM_PERM``-value MinHash signature
+is built with one-permutation hashing (see ``minhash``), linear in the
+number of shingles; two signatures agree at a position with probability
+equal to the Jaccard similarity of the sets, so the fraction of agreeing
+positions estimates it.
+
+The signature is cut into ``BANDS`` bands of ``ROWS`` values and each
+band is hashed into a bucket key, stored in ``ModuleSignature.bands``
+with a GIN index. Modules sharing any key are candidates: pairs with
+similarity ``s`` become candidates with probability
+``1 - (1 - s**ROWS)**BANDS``, about 0.92 at 0.7 and over 0.99 at 0.8,
+while dissimilar modules rarely meet. Only candidates have their
+signatures compared, so nothing is ever compared all-pairs.
+
+Signatures are recomputed by the ``post_save`` handler in ``signals.py``
+when a module's title, description or competences may have changed.
+Modules written without signals (``seed_synthetic``, imports) get theirs
+from ``manage.py find_duplicate_modules``.
+"""
+import hashlib
+import random
+import re
+import struct
+import unicodedata
+
+from django.db import connections
+
+from .models import Module, ModuleSignature
+
+NUM_PERM = 120
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+DEFAULT_THRESHOLD = 0.7
+
+_MASK = (1 << 32) - 1
+# Bins probed, in order, to fill an empty bin (optimal densification).
+_PROBES = [random.Random(position).sample(range(NUM_PERM), NUM_PERM) for position in range(NUM_PERM)]
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    return ' '.join(re.findall(r'\w+', text))
+
+
+def features(title, description, competences):
+    """The set a module's signature is computed over."""
+    text = ' '.join(part for part in (normalize(title), normalize(description)) if part)
+    tokens = {text[start:start + SHINGLE_SIZE] for start in range(max(len(text) - SHINGLE_SIZE + 1, 1))} if text else set()
+    tokens.update(f'competence:{competence_id}' for competence_id in competences or ())
+    return tokens
+
+
+def minhash(tokens):
+    """
+    One-permutation MinHash: every token is hashed once, the high half of
+    the hash picks one of ``NUM_PERM`` bins and the bin keeps the smallest
+    low half. Empty bins copy the first non-empty bin of their probe
+    sequence, which keeps agreeing positions an unbiased Jaccard estimate.
+    """
+    if not tokens:
+        return None
+    bins = [None] * NUM_PERM
+    for token in tokens:
+        value = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'little')
+        position, value = (value >> 32) % NUM_PERM, value & _MASK
+        if bins[position] is None or value < bins[position]:
+            bins[position] = value
+    signature = list(bins)
+    for position, value in enumerate(bins):
+        if value is None:
+            signature[position] = next(bins[probe] for probe in _PROBES[position] if bins[probe] is not None)
+    return signature
+
+
+def band_keys(signature):
+    """One signed 64-bit bucket key per band, including the band number."""
+    keys = []
+    for band in range(BANDS):
+        values = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(struct.pack(f'<H{ROWS}Q', band, *values), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for a, b in zip(first, second) if a == b) / NUM_PERM
+
+
+def signature_for(module):
+    return minhash(features(module.title, module.description, module.specific_competences))
+
+
+def update_signatures(modules, batch_size=1000):
+    """Compute and store the signatures of ``modules`` (iterable of ``Module``)."""
+    rows, empty = [], []
+    for module in modules:
+        signature = signature_for(module)
+        if signature is None:
+            empty.append(module.pk)
+        else:
+            rows.append(ModuleSignature(module_id=module.pk, signature=signature, bands=band_keys(signature)))
+        if len(rows) >= batch_size:
+            _store(rows)
+            rows = []
+    _store(rows)
+    if empty:
+        ModuleSignature.objects.filter(module_id__in=empty).delete()
+
+
+def _store(rows):
+    if rows:
+        ModuleSignature.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['module'], update_fields=['signature', 'bands'],
+        )
+
+
+def library(scope, school_id, region_id):
+    """Signatures of the modules in the school or region library."""
+    signatures = ModuleSignature.objects.all()
+    if scope == 'region':
+        return signatures.filter(module__school__region_id=region_id)
+    return signatures.filter(module__school_id=school_id)
+
+
+def similar_to(signature, signatures, threshold=DEFAULT_THRESHOLD, exclude=None):
+    """``(module_id, similarity)`` of ``signatures`` sharing a band with ``signature``, most similar first."""
+    candidates = signatures.filter(bands__overlap=band_keys(signature))
+    if exclude is not None:
+        candidates = candidates.exclude(module_id=exclude)
+    matches = []
+    for module_id, other in candidates.values_list('module_id', 'signature'):
+        score = similarity(signature, other)
+        if score >= threshold:
+            matches.append((module_id, score))
+    matches.sort(key=lambda match: (-match[1], str(match[0])))
+    return matches
+
+
+def duplicate_groups(signatures, threshold=DEFAULT_THRESHOLD):
+    """
+    Groups of near-duplicate modules among ``signatures``: the connected
+    components of the candidate pairs (modules sharing a bucket) whose
+    estimated similarity reaches ``threshold``. Returns
+    ``[(module_ids, best_similarity)]``, largest groups first.
+    """
+    subquery, params = signatures.values('module_id').query.sql_with_params()
+    table = ModuleSignature._meta.db_table
+    with connections[signatures.db].cursor() as cursor:
+        cursor.execute(
+            f"SELECT array_agg(s.module_id) FROM {table} s CROSS JOIN LATERAL unnest(s.bands) AS bucket(key) "
+            f"WHERE s.module_id IN ({subquery}) GROUP BY bucket.key HAVING count(*) > 1",
+            params,
+        )
+        buckets = [members for members, in cursor.fetchall()]
+
+    # Only modules that share a bucket with another are loaded.
+    loaded = {}
+    wanted = list({module_id for members in buckets for module_id in members})
+    for offset in range(0, len(wanted), 5000):
+        loaded.update(
+            ModuleSignature.objects.using(signatures.db).filter(module_id__in=wanted[offset:offset + 5000])
+            .values_list('module_id', 'signature')
+        )
+
+    parent = {module_id: module_id for module_id in loaded}
+
+    def find(module_id):
+        while parent[module_id] != module_id:
+            parent[module_id] = parent[parent[module_id]]
+            module_id = parent[module_id]
+        return module_id
+
+    # Within a bucket, compare each module with one representative of every
+    # group met so far, so buckets of exact copies stay linear.
+    best = {}
+    for members in buckets:
+        representatives = []
+        for module_id in members:
+            for representative in representatives:
+                score = similarity(loaded[module_id], loaded[representative])
+                if score >= threshold:
+                    first, second = find(representative), find(module_id)
+                    if first != second:
+                        parent[second] = first
+                        best[first] = max(best.get(first, 0), best.pop(second, 0))
+                    best[first] = max(best.get(first, 0), score)
+                    break
+            else:
+                representatives.append(module_id)
+
+    groups = {}
+    for module_id in loaded:
+        groups.setdefault(find(module_id), []).append(module_id)
+    result = [(sorted(members, key=str), best[root]) for root, members in groups.items() if len(members) > 1]
+    result.sort(key=lambda group: (-len(group[0]), -group[1], str(group[0][0])))
+    return result
+
+
+def missing_signatures(modules=None):
+    """Modules (of ``modules``, default all) that have no signature yet."""
+    modules = Module.objects.all() if modules is None else modules
+    return modules.filter(signature__isnull=True)
@@ -0,0 +1,165 @@
+# core/events.py
+"""
+Change events pushed to planners over server-sent events.
+
+Model signals publish compact events such as::
+
+    {"model": "module", "action": "saved", "id": "<uuid>",
+     "school": "<uuid>", "subject": "<uuid>"}
+
+to two channels, ``school:<id>`` and ``school:<id>:subject:<id>``. Clients
+subscribe through ``/api/core/events/`` (see ``change_event_stream`` in
+``views.py``), which must be served by the ASGI application.
+
+The broker is chosen with the ``EVENTS_BROKER`` setting. ``InProcessBroker``
+only reaches clients connected to the same process; ``PostgresBroker`` relays
+events between workers with LISTEN/NOTIFY on the existing database.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def channels_for(school_id, subject_id=None):
+    channels = [f'school:{school_id}']
+    if subject_id:
+        channels.append(f'school:{school_id}:subject:{subject_id}')
+    return channels
+
+
+class InProcessBroker:
+    """Fan events out to subscribers living in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channel):
+        """Register an asyncio queue for ``channel``; call from the event loop."""
+        queue = asyncio.Queue(maxsize=getattr(settings, 'EVENTS_QUEUE_SIZE', 100))
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(channel, set())
+            subscribers.difference_update({entry for entry in subscribers if entry[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(channel, None)
+
+    def publish(self, channels, event):
+        self.deliver(channels, event)
+
+    def deliver(self, channels, event):
+        with self._lock:
+            targets = [entry for channel in channels for entry in self._subscribers.get(channel, ())]
+        for loop, queue in targets:
+            loop.call_soon_threadsafe(self._put, queue, event)
+
+    @staticmethod
+    def _put(queue, event):
+        # A client that stopped reading loses events rather than memory.
+        if not queue.full():
+            queue.put_nowait(event)
+
+
+class PostgresBroker(InProcessBroker):
+    """
+    Share events between worker processes through Postgres NOTIFY.
+
+    Each process runs one listener thread on a dedicated connection and
+    hands received events to its local subscribers; ``stop`` ends it.
+    """
+    notify_channel = 'sofia_change_events'
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+        self._stopping = threading.Event()
+
+    def subscribe(self, channel):
+        self._ensure_listener()
+        return super().subscribe(channel)
+
+    def publish(self, channels, event):
+        payload = json.dumps({'channels': channels, 'event': event})
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.notify_channel, payload])
+
+    def stop(self):
+        """Stop the listener thread and close its connection."""
+        self._stopping.set()
+        if self._listener is not None:
+            self._listener.join()
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._stopping.clear()
+                self._listener = threading.Thread(target=self._listen, name='events-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        import psycopg
+
+        params = connection.get_connection_params()
+        params.pop('cursor_factory', None)
+        try:
+            with psycopg.connect(**params, autocommit=True) as conn:
+                conn.execute(f'LISTEN {self.notify_channel}')
+                while not self._stopping.is_set():
+                    # Wake up every second to notice ``stop``.
+                    for notification in conn.notifies(timeout=1):
+                        try:
+                            message = json.loads(notification.payload)
+                            self.deliver(message['channels'], message['event'])
+                        except (ValueError, KeyError):
+                            logger.warning('Ignoring malformed change event: %s', notification.payload)
+        except Exception:
+            logger.exception('Change event listener stopped')
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            broker_class = import_string(
+                getattr(settings, 'EVENTS_BROKER', 'apps.core.events.InProcessBroker')
+            )
+            _broker = broker_class()
+        return _broker
+
+
+def publish_change(model, action, object_id, school_id, subject_id=None):
+    """Publish a change event once the current transaction commits."""
+    if not school_id:
+        return
+    event = {
+        'model': model,
+        'action': action,
+        'id': str(object_id),
+        'school': str(school_id),
+        'subject': str(subject_id) if subject_id else None,
+    }
+    channels = channels_for(school_id, subject_id)
+
+    def send():
+        try:
+            get_broker().publish(channels, event)
+        except Exception:
+            # Push is best effort; never fail the write that triggered it.
+            logger.exception('Could not publish change event')
+
+    transaction.on_commit(send)
@@ -0,0 +1,51 @@
+# core/management/commands/allocate_planning_units.py
+"""
+Assign dates to the planning units of whole schools (see
+``apps/core/unit_allocation.py``):
+
+    python manage.py allocate_planning_units
+    python manage.py allocate_planning_units --school <uuid> --dry-run
+
+Every subject of a school is allocated in its current or next calendar
+and the school's dates are written in one transaction with a single bulk
+update. ``--dry-run`` only reports how many units would change.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.core.models import School
+from apps.core.unit_allocation import allocate_school
+
+
+class Command(BaseCommand):
+    help = 'Assign start and end dates to planning units from sessions, terms and non-teaching days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--school', action='append', help='Only this school (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Compute the dates without saving them')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        schools = School.objects.order_by('pk')
+        if options['school']:
+            schools = schools.filter(pk__in=options['school'])
+        school_ids = list(schools.values_list('pk', flat=True))
+
+        allocated = unallocated = skipped = 0
+        for number, school_id in enumerate(school_ids, 1):
+            calendar, units = allocate_school(school_id, dry_run=options['dry_run'])
+            if calendar is None:
+                skipped += 1
+                continue
+            missing = sum(1 for unit in units if unit['start_date'] is None)
+            allocated += len(units) - missing
+            unallocated += missing
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{number}/{len(school_ids)} schools, {len(units)} units in {calendar}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Computed" if options["dry_run"] else "Allocated"} dates for {allocated} planning units of '
+            f'{len(school_ids) - skipped} schools in {time.monotonic() - started:.1f}s; '
+            f'{unallocated} did not fit in the calendar, {skipped} schools have no calendar.'
+        ))
@@ -0,0 +1,275 @@
+# core/management/commands/benchmark_endpoints.py
+"""
+Measure latency, query count and response size of the main API flows.
+
+Requests go through Django's test client in this process, so the numbers
+cover the full middleware, view and serializer stack without network
+noise, and every query is counted, including those issued from the
+worker threads of the async aggregate views. Run it against a
+``seed_synthetic`` database and keep the JSON to compare commits:
+
+    python manage.py seed_synthetic --schools 50
+    python manage.py benchmark_endpoints --output before.json
+    ... change something ...
+    python manage.py benchmark_endpoints --output after.json --compare before.json
+
+Everything runs inside a transaction that is rolled back at the end, so
+the write endpoints leave the dataset unchanged. The benchmark user is
+granted the core model permissions for the duration of that transaction;
+uploaded files are written to a temporary directory.
+"""
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from rest_framework.authtoken.models import Token
+
+from apps.accounts.models import User
+from apps.core.models import PlanningUnit, ScheduledLearningSituation, Subject
+
+
+class QueryCounter:
+    """Count queries on every connection, in every thread, while active."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def _attach(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        for conn in connections.all(initialized_only=True):
+            self._attach(connection=conn)
+        connection_created.connect(self._attach)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self._attach)
+        for conn in connections.all(initialized_only=True):
+            if self in conn.execute_wrappers:
+                conn.execute_wrappers.remove(self)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the main API endpoints in-process and write the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='User to benchmark as (default: the first teacher with a school)')
+        parser.add_argument('--password', default='synthetic', help='Password used for the login endpoint')
+        parser.add_argument('--subject', help="Subject used by the subject endpoints (default: the first one "
+                                              "of the user's school with learning situations)")
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per endpoint')
+        parser.add_argument('--upload-size', type=int, default=256 * 1024, help='Bytes per uploaded file')
+        parser.add_argument('--only', action='append', help='Run only this endpoint (repeatable)')
+        parser.add_argument('--output', help='Write the JSON here instead of stdout')
+        parser.add_argument('--compare', help='Earlier output to compare against')
+        parser.add_argument('--max-regression', type=float,
+                            help='With --compare, fail if any p95 grew by more than this many percent')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['username'])
+        subject = self.get_subject(user, options['subject'])
+        # Created outside the rolled back transaction: the async views
+        # authenticate on their own connections.
+        token, _ = Token.objects.get_or_create(user=user)
+
+        results = {}
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        ):
+            with transaction.atomic():
+                user.user_permissions.add(*Permission.objects.filter(content_type__app_label='core'))
+                for name, request in self.get_endpoints(user, subject, options).items():
+                    if options['only'] and name not in options['only']:
+                        continue
+                    results[name] = self.measure(Client(HTTP_AUTHORIZATION=f'Token {token.key}'), request, options)
+                    self.stderr.write(
+                        f"{name}: p50 {results[name]['p50_ms']} ms, p95 {results[name]['p95_ms']} ms, "
+                        f"{results[name]['queries']} queries, {results[name]['bytes']} bytes"
+                    )
+                transaction.set_rollback(True)
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'settings': os.environ.get('DJANGO_SETTINGS_MODULE'),
+                'debug': settings.DEBUG,
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'user': user.username,
+                'subject': str(subject.id),
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+            },
+            'endpoints': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            self.compare(report, options['compare'], options['max_regression'])
+
+    def get_user(self, username):
+        users = User.objects.filter(school__isnull=False)
+        if username:
+            user = users.filter(username=username).first()
+        else:
+            user = users.filter(role=User.Roles.TEACHER).order_by('username').first()
+        if user is None:
+            raise CommandError('No user with a school found; seed data with seed_synthetic or pass --username.')
+        return user
+
+    def get_subject(self, user, subject_id):
+        subjects = Subject.objects.filter(school_id=user.school_id)
+        if subject_id:
+            subject = subjects.filter(id=subject_id).first()
+        else:
+            subject = subjects.filter(learning_situations__isnull=False).order_by('name', 'id').first()
+        if subject is None:
+            raise CommandError("No subject with learning situations found in the user's school.")
+        return subject
+
+    def get_endpoints(self, user, subject, options):
+        """Map each endpoint name to a callable that makes one request."""
+        situation = subject.learning_situations.order_by('id').first()
+        module = subject.modules.order_by('id').first()
+        if module is None or situation is None:
+            raise CommandError('The subject needs at least one module and one learning situation.')
+        units = list(
+            PlanningUnit.objects.filter(subject=subject)
+            .values('unit_number', 'learning_situation', 'start_date', 'end_date', 'title', 'notes')
+        )
+        for unit in units:
+            unit['learning_situation'] = str(unit['learning_situation']) if unit['learning_situation'] else None
+            unit['start_date'] = unit['start_date'].isoformat() if unit['start_date'] else None
+            unit['end_date'] = unit['end_date'].isoformat() if unit['end_date'] else None
+        scheduled = list(
+            ScheduledLearningSituation.objects.filter(learning_situation__school_id=user.school_id)
+            .values_list('term_id', 'id')
+        )
+        term_id = scheduled[0][0] if scheduled else None
+        new_order = [str(pk) for term, pk in scheduled if term == term_id][::-1]
+        upload = os.urandom(options['upload_size'])
+
+        return {
+            'login': lambda c: c.post(
+                '/api/auth/login/', {'username': user.username, 'password': options['password']},
+                content_type='application/json',
+            ),
+            'dashboard': lambda c: c.get('/api/auth/dashboard/'),
+            'years': lambda c: c.get('/api/core/years/'),
+            'learning_situations': lambda c: c.get(f'/api/core/learning-situations/?subject={subject.id}'),
+            'learning_situation_detail': lambda c: c.get(f'/api/core/learning-situations/{situation.id}/'),
+            'modules': lambda c: c.get(f'/api/core/modules/?subject={subject.id}'),
+            'module_detail': lambda c: c.get(f'/api/core/modules/{module.id}/'),
+            'competences': lambda c: c.get(
+                f'/api/core/specific-competences/?subject={subject.id}&year={subject.year_id}'
+            ),
+            'planning_units_bulk_update': lambda c: c.post(
+                '/api/core/planning-units/bulk-update/', {'subject': str(subject.id), 'units': units},
+                content_type='application/json',
+            ),
+            'scheduled_reorder': lambda c: c.post(
+                '/api/core/scheduled-situations/reorder/', {'term_id': str(term_id), 'new_order': new_order},
+                content_type='application/json',
+            ),
+            'file_upload': lambda c: c.post(
+                '/api/core/file-upload/',
+                {'file': SimpleUploadedFile('benchmark.pdf', upload, content_type='application/pdf')},
+            ),
+        }
+
+    def measure(self, client, request, options):
+        latencies, queries, sizes, statuses = [], [], [], {}
+        first_ms = None
+        # Views print debugging output; keep it out of the timings and the report.
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for i in range(options['warmup'] + options['iterations']):
+                with QueryCounter() as counter:
+                    started = time.perf_counter()
+                    response = request(client)
+                    elapsed = time.perf_counter() - started
+                if first_ms is None:
+                    first_ms = round(elapsed * 1000, 2)
+                if i < options['warmup']:
+                    continue
+                latencies.append(elapsed)
+                queries.append(counter.count)
+                sizes.append(len(response.content))
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        return {
+            'requests': len(latencies),
+            'errors': sum(count for code, count in statuses.items() if code >= 400),
+            'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+            'first_ms': first_ms,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+            'max_ms': round(max(latencies) * 1000, 2),
+            'queries': statistics.median_low(queries),
+            'max_queries': max(queries),
+            'bytes': statistics.median_low(sizes),
+        }
+
+    def compare(self, report, path, max_regression):
+        with open(path) as handle:
+            baseline = json.load(handle)
+        regressions = []
+        self.stderr.write(f"\nCompared with {baseline['meta'].get('commit') or path}:")
+        for name, current in report['endpoints'].items():
+            previous = baseline['endpoints'].get(name)
+            if not previous:
+                continue
+            change = (current['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] * 100 if previous['p95_ms'] else 0
+            self.stderr.write(
+                f"  {name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms ({change:+.1f}%), "
+                f"queries {previous['queries']} -> {current['queries']}, "
+                f"bytes {previous['bytes']} -> {current['bytes']}"
+            )
+            if max_regression is not None and change > max_regression:
+                regressions.append(name)
+        if regressions:
+            raise CommandError(f"p95 regressed by more than {max_regression}% for: {', '.join(regressions)}")
@@ -0,0 +1,84 @@
+# core/management/commands/find_duplicate_modules.py
+"""
+Report groups of near-duplicate modules (see ``apps/core/duplicates.py``).
+
+Modules without a signature (created by ``seed_synthetic`` or other bulk
+writes) get one first; ``--rebuild`` recomputes every signature in scope,
+e.g. after changing the shingling:
+
+    python manage.py find_duplicate_modules --school <uuid>
+    python manage.py find_duplicate_modules --region <uuid> --threshold 0.8 --json
+
+Groups are found through the LSH buckets, so the report never compares
+all pairs of modules.
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from apps.core import duplicates
+from apps.core.models import Module, ModuleSignature
+
+SIGNATURE_FIELDS = ('id', 'title', 'description', 'specific_competences')
+
+
+class Command(BaseCommand):
+    help = 'Report groups of near-duplicate modules.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--school', action='append', help='Only modules of this school (repeatable)')
+        parser.add_argument('--region', help='Only modules of schools in this region')
+        parser.add_argument('--threshold', type=float, default=duplicates.DEFAULT_THRESHOLD,
+                            help='Minimum estimated similarity (default %(default)s)')
+        parser.add_argument('--rebuild', action='store_true', help='Recompute every signature in scope first')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Signatures written per transaction')
+        parser.add_argument('--json', action='store_true', help='Print the groups as JSON')
+
+    def handle(self, *args, **options):
+        if not 0 < options['threshold'] <= 1:
+            raise CommandError('--threshold must be in (0, 1]')
+        started = time.monotonic()
+        modules = Module.objects.order_by('pk')
+        if options['school']:
+            modules = modules.filter(school_id__in=options['school'])
+        if options['region']:
+            modules = modules.filter(school__region_id=options['region'])
+
+        pending = modules if options['rebuild'] else duplicates.missing_signatures(modules)
+        pending_ids = list(pending.values_list('pk', flat=True))
+        batch_size = max(1, options['batch_size'])
+        for offset in range(0, len(pending_ids), batch_size):
+            with transaction.atomic():
+                duplicates.update_signatures(
+                    Module.objects.filter(pk__in=pending_ids[offset:offset + batch_size]).only(*SIGNATURE_FIELDS),
+                    batch_size,
+                )
+            if options['verbosity'] > 1:
+                self.stderr.write(f'{min(offset + batch_size, len(pending_ids))}/{len(pending_ids)} signatures')
+
+        groups = duplicates.duplicate_groups(
+            ModuleSignature.objects.filter(module__in=modules.values('pk')), options['threshold'],
+        )
+        titles = dict(
+            Module.objects.filter(pk__in=[module_id for members, _ in groups for module_id in members])
+            .values_list('pk', 'title')
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps([
+                {'similarity': score, 'modules': [{'id': module_id, 'title': titles[module_id]} for module_id in members]}
+                for members, score in groups
+            ], cls=DjangoJSONEncoder, indent=2))
+            return
+
+        for members, score in groups:
+            self.stdout.write(f'{len(members)} modules, similarity up to {score:.2f}:')
+            for module_id in members:
+                self.stdout.write(f'  {module_id}  {titles[module_id]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(groups)} groups covering {sum(len(members) for members, _ in groups)} modules '
+            f'({len(pending_ids)} signatures computed, {time.monotonic() - started:.1f}s).'
+        ))
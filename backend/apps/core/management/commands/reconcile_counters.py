@@ -0,0 +1,54 @@
+# core/management/commands/reconcile_counters.py
+"""
+Recompute the content counters of schools and subjects (see
+``apps/core/counters.py``) from the underlying tables.
+
+The signal handlers keep the counters current; run this after writes
+that bypass them (bulk imports, ``QuerySet.update``, manual SQL) or on a
+schedule to repair drift:
+
+    python manage.py reconcile_counters --dry-run
+    python manage.py reconcile_counters --school <uuid>
+
+Schools are processed in batches, each in its own transaction with one
+comparison query and at most one UPDATE per table, so locks are short.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.core.counters import reconcile
+from apps.core.models import School
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized content counters on schools and subjects.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--school', action='append', help='Only this school (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Schools per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Report stale rows without fixing them')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        schools = School.objects.order_by('pk')
+        if options['school']:
+            schools = schools.filter(pk__in=options['school'])
+        school_ids = list(schools.values_list('pk', flat=True))
+
+        totals = {'subject': 0, 'school': 0}
+        batch_size = max(1, options['batch_size'])
+        for offset in range(0, len(school_ids), batch_size):
+            with transaction.atomic():
+                stale = reconcile(school_ids[offset:offset + batch_size], dry_run=options['dry_run'])
+            for model, count in stale.items():
+                totals[model] += count
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{min(offset + batch_size, len(school_ids))}/{len(school_ids)} schools')
+
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} stale counters on {totals['subject']} subjects and {totals['school']} schools "
+            f"({len(school_ids)} schools checked in {time.monotonic() - started:.1f}s)."
+        ))
@@ -0,0 +1,49 @@
+# core/management/commands/refresh_coverage_summary.py
+"""
+Rebuild the school-wide coverage summary (see
+``apps/core/coverage_summary.py``) from modules and learning situations.
+
+The signal handlers keep the summary current; run this after creating
+the table, after writes that bypass them (bulk imports,
+``QuerySet.update``, manual SQL) or on a schedule to repair drift:
+
+    python manage.py refresh_coverage_summary
+    python manage.py refresh_coverage_summary --school <uuid>
+
+Schools are rebuilt in batches, each in its own transaction. Readers keep
+seeing the previous rows of a batch until its transaction commits, so the
+endpoint never waits for a refresh.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.core.coverage_summary import refresh_schools
+from apps.core.models import School
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the school-wide competence coverage summary.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--school', action='append', help='Only this school (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=20, help='Schools per transaction')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        schools = School.objects.order_by('pk')
+        if options['school']:
+            schools = schools.filter(pk__in=options['school'])
+        school_ids = list(schools.values_list('pk', flat=True))
+
+        batch_size = max(1, options['batch_size'])
+        for offset in range(0, len(school_ids), batch_size):
+            with transaction.atomic():
+                refresh_schools(school_ids[offset:offset + batch_size])
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{min(offset + batch_size, len(school_ids))}/{len(school_ids)} schools')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the coverage summary of {len(school_ids)} schools in {time.monotonic() - started:.1f}s.'
+        ))
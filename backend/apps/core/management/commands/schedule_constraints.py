@@ -0,0 +1,78 @@
+# core/management/commands/schedule_constraints.py
+"""
+Add or drop the optional exclusion constraints that make the database
+refuse overlapping schedules (see ``CONSTRAINTS`` in
+``apps/core/schedule_conflicts.py``):
+
+    python manage.py schedule_constraints
+    python manage.py schedule_constraints --enable planning_units
+    python manage.py schedule_constraints --disable scheduled_situations
+
+Without options it lists the constraints, whether they are enabled and
+how many overlapping pairs the data holds. A constraint is only added
+when there are none; fix them first with the help of the schedule
+conflicts endpoint. The constraints need the ``btree_gist`` extension,
+which is created if the server has it.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+
+from apps.core.schedule_conflicts import CONSTRAINTS, constraint_violations
+
+
+class Command(BaseCommand):
+    help = 'Add or drop the exclusion constraints against overlapping schedules.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--enable', action='append', default=[], choices=sorted(CONSTRAINTS),
+                            help='Add this constraint (repeatable)')
+        parser.add_argument('--disable', action='append', default=[], choices=sorted(CONSTRAINTS),
+                            help='Drop this constraint (repeatable)')
+
+    def handle(self, *args, **options):
+        for name in options['disable']:
+            model, constraint = CONSTRAINTS[name]
+            if self._enabled(name):
+                with connections[router.db_for_write(model)].schema_editor() as editor:
+                    editor.remove_constraint(model, constraint)
+            self.stdout.write(self.style.SUCCESS(f'Dropped {constraint.name}.'))
+
+        for name in options['enable']:
+            model, constraint = CONSTRAINTS[name]
+            if self._enabled(name):
+                self.stdout.write(f'{constraint.name} is already enabled.')
+                continue
+            using = router.db_for_write(model)
+            with transaction.atomic(using=using):
+                self._require_btree_gist(using)
+                violations = constraint_violations(name, using)
+                if violations:
+                    raise CommandError(
+                        f'Cannot add {constraint.name}: {violations} overlapping pairs of {model._meta.verbose_name_plural}.'
+                    )
+                with connections[using].schema_editor(atomic=False) as editor:
+                    editor.add_constraint(model, constraint)
+            self.stdout.write(self.style.SUCCESS(f'Added {constraint.name}.'))
+
+        if not options['enable'] and not options['disable']:
+            for name, (model, constraint) in sorted(CONSTRAINTS.items()):
+                state = 'enabled' if self._enabled(name) else 'disabled'
+                self.stdout.write(
+                    f'{name} ({constraint.name}): {state}, {constraint_violations(name)} overlapping pairs'
+                )
+
+    def _enabled(self, name):
+        model, constraint = CONSTRAINTS[name]
+        with connections[router.db_for_write(model)].cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_constraint WHERE conname = %s AND conrelid = %s::regclass',
+                [constraint.name, model._meta.db_table],
+            )
+            return cursor.fetchone() is not None
+
+    def _require_btree_gist(self, using):
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'btree_gist'")
+            if cursor.fetchone() is None:
+                raise CommandError('The btree_gist extension is not available on this database server.')
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
@@ -0,0 +1,337 @@
+# core/management/commands/seed_synthetic.py
+"""
+Generate a synthetic dataset for load and scale testing.
+
+Regions, years and the school type are created up front; each school and
+everything below it (teachers, subjects, competences, modules, learning
+situations, planning units, calendar, terms and schedules) is generated
+by a worker process and written with batched ``bulk_create`` inside one
+transaction per school. Every row, including primary keys, comes from a
+random generator seeded with ``--seed`` and the school number, so the
+same options always produce the same data regardless of ``--workers``.
+
+    python manage.py seed_synthetic --schools 200 --workers 8 --seed 42
+
+The command only adds rows; seeding twice with the same seed fails on the
+duplicate keys.
+"""
+import multiprocessing
+import random
+import time
+import uuid
+from datetime import date, timedelta
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.accounts.models import User
+from apps.core.models import (
+    LearningSituation, Module, PlanningUnit, Region, ScheduledLearningSituation, School,
+    SchoolCalendar, SchoolType, SpecificCompetences, Subject, Term, Year,
+)
+from apps.core.counters import reconcile as reconcile_counters
+from apps.core.coverage_summary import refresh_schools as refresh_coverage_summary
+from apps.core.reference_cache import reference_cache
+
+SUBJECT_NAMES = [
+    'Mathematics', 'Spanish Language', 'English', 'Biology and Geology', 'Physics and Chemistry',
+    'Geography and History', 'Physical Education', 'Music', 'Visual Arts', 'Technology',
+    'French', 'Philosophy', 'Economics', 'Latin', 'Computer Science',
+]
+WORDS = [
+    'energy', 'ecosystems', 'fractions', 'narrative', 'climate', 'geometry', 'citizenship', 'rhythm',
+    'cells', 'probability', 'poetry', 'motion', 'renaissance', 'circuits', 'nutrition', 'algebra',
+    'debate', 'maps', 'water', 'statistics', 'theatre', 'recycling', 'forces', 'migration',
+]
+FILE_TYPES = [
+    ('pdf', 'application/pdf'),
+    ('docx', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    ('png', 'image/png'),
+    ('pptx', 'application/vnd.openxmlformats-officedocument.presentationml.presentation'),
+]
+
+
+def make_uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def phrase(rng, words=3):
+    return ' '.join(rng.sample(WORDS, words)).capitalize()
+
+
+def academic_terms(start_year):
+    # Same terms as the calendar created for new schools in models.py.
+    return [
+        ('First Term', date(start_year, 9, 1), date(start_year, 12, 22)),
+        ('Second Term', date(start_year + 1, 1, 8), date(start_year + 1, 3, 31)),
+        ('Third Term', date(start_year + 1, 4, 1), date(start_year + 1, 6, 30)),
+    ]
+
+
+def seed_school(task):
+    """Build and insert one school; runs in a worker process."""
+    index, options, shared = task
+    rng = random.Random(f"{options['seed']}:{index}")
+    batch_size = options['batch_size']
+    start_year = options['academic_year']
+    terms_spec = academic_terms(start_year)
+    year_start, year_end = terms_spec[0][1], terms_spec[-1][2]
+    span = (year_end - year_start).days
+
+    def random_date(start=year_start, days=span):
+        return start + timedelta(days=rng.randrange(max(days, 1)))
+
+    school = School(
+        id=make_uuid(rng),
+        name=f"Synthetic School {options['seed']}-{index}",
+        region_id=shared['region_ids'][index % len(shared['region_ids'])],
+        school_type_id=shared['school_type_id'],
+        address=f'{rng.randint(1, 200)} {phrase(rng, 2)} Street',
+    )
+    teachers = [
+        User(
+            username=f"synthetic-{options['seed']}-{index}-{i}",
+            password=shared['password'],
+            role=User.Roles.TEACHER,
+            school_id=school.id,
+            first_name=phrase(rng, 1),
+            last_name=phrase(rng, 1),
+        )
+        for i in range(options['teachers'])
+    ]
+
+    rows = {model: [] for model in (
+        Subject, Subject.teaching_staff.through, SpecificCompetences, Subject.specific_competences.through,
+        Module, Module.teaching_staff.through, LearningSituation, LearningSituation.modules.through,
+        LearningSituation.specific_competences.through, LearningSituation.teaching_staff.through,
+        PlanningUnit, SchoolCalendar, Term, ScheduledLearningSituation,
+    )}
+
+    calendar = SchoolCalendar(
+        id=make_uuid(rng), school_id=school.id, academic_year=f'{start_year}-{start_year + 1}',
+        start_date=year_start, end_date=year_end,
+    )
+    rows[SchoolCalendar].append(calendar)
+    terms = [
+        Term(id=make_uuid(rng), calendar_id=calendar.id, name=name, start_date=start, end_date=end)
+        for name, start, end in terms_spec
+    ]
+    rows[Term].extend(terms)
+
+    # Teachers get their ids on insert, so staff links are built from indexes first.
+    staff_links = []
+    schedule_order = {term.id: 0 for term in terms}
+    for year_id in shared['year_ids']:
+        for s in range(options['subjects_per_year']):
+            subject = Subject(
+                id=make_uuid(rng), name=SUBJECT_NAMES[s % len(SUBJECT_NAMES)], description=phrase(rng),
+                year_id=year_id, region_id=school.region_id, school_id=school.id,
+            )
+            rows[Subject].append(subject)
+            subject_staff = rng.sample(range(len(teachers)), min(len(teachers), rng.randint(1, 2)))
+            staff_links.append((Subject.teaching_staff.through, 'subject_id', subject.id, subject_staff))
+
+            competences = []
+            for c in range(options['competences_per_subject']):
+                competence = SpecificCompetences(
+                    id=make_uuid(rng), region_id=school.region_id, subject_id=subject.id, year_id=year_id,
+                    code=f'CE{c + 1}', description=phrase(rng, 5),
+                    evaluation_criteria=[
+                        {'id': str(make_uuid(rng)), 'code': f'{c + 1}.{k + 1}', 'description': phrase(rng, 6)}
+                        for k in range(options['criteria_per_competence'])
+                    ],
+                )
+                competences.append(competence)
+                rows[Subject.specific_competences.through].append(
+                    Subject.specific_competences.through(subject_id=subject.id, specificcompetences_id=competence.id)
+                )
+            rows[SpecificCompetences].extend(competences)
+
+            modules = []
+            for m in range(options['modules_per_subject']):
+                start = random_date()
+                chosen = rng.sample(competences, min(len(competences), rng.randint(1, 3)))
+                module = Module(
+                    id=make_uuid(rng), year_id=year_id, school_id=school.id, subject_id=subject.id,
+                    title=f'{phrase(rng)} {m + 1}', description=phrase(rng, 8),
+                    date_start=start, date_end=start + timedelta(days=rng.randint(5, 20)),
+                    session_length=rng.choice([1, 1.5, 2, 2.5]), evaluable=rng.random() < 0.6,
+                    specific_competences=[competence.id for competence in chosen],
+                    selected_criteria={
+                        str(competence.id): [
+                            criterion['id'] for criterion in rng.sample(
+                                competence.evaluation_criteria,
+                                rng.randint(1, len(competence.evaluation_criteria)),
+                            )
+                        ]
+                        for competence in chosen if competence.evaluation_criteria
+                    },
+                    basic_knowledge=[make_uuid(rng) for _ in range(rng.randint(0, 3))],
+                    content=[make_uuid(rng) for _ in range(rng.randint(0, 3))],
+                    files=[
+                        {
+                            'url': f'/media/uploads/{start.year}/{start.month}/{make_uuid(rng)}.{ext}',
+                            'name': f'{phrase(rng, 2)}.{ext}',
+                            'size': rng.randint(20_000, 5_000_000),
+                            'type': content_type,
+                        }
+                        for ext, content_type in (rng.choice(FILE_TYPES) for _ in range(rng.randint(0, 3)))
+                    ],
+                )
+                modules.append(module)
+                staff_links.append((Module.teaching_staff.through, 'module_id', module.id, subject_staff))
+            rows[Module].extend(modules)
+
+            situations = []
+            for n in range(options['situations_per_subject']):
+                start = random_date()
+                situation = LearningSituation(
+                    id=make_uuid(rng), year_id=year_id, region_id=school.region_id, school_id=school.id,
+                    subject_id=subject.id, title=f'{phrase(rng)} project', description=phrase(rng, 10),
+                    date_start=start, date_end=start + timedelta(days=rng.randint(14, 45)),
+                )
+                situations.append(situation)
+                linked = rng.sample(modules, min(len(modules), rng.randint(2, 4)))
+                rows[LearningSituation.modules.through].extend(
+                    LearningSituation.modules.through(learningsituation_id=situation.id, module_id=module.id)
+                    for module in linked
+                )
+                rows[LearningSituation.specific_competences.through].extend(
+                    LearningSituation.specific_competences.through(
+                        learningsituation_id=situation.id, specificcompetences_id=competence_id,
+                    )
+                    for competence_id in sorted({cid for module in linked for cid in module.specific_competences})
+                )
+                staff_links.append(
+                    (LearningSituation.teaching_staff.through, 'learningsituation_id', situation.id, subject_staff)
+                )
+                term = next((t for t in terms if t.start_date <= start <= t.end_date), terms[-1])
+                rows[ScheduledLearningSituation].append(ScheduledLearningSituation(
+                    id=make_uuid(rng), learning_situation_id=situation.id, term_id=term.id,
+                    start_date=situation.date_start, end_date=situation.date_end, order=schedule_order[term.id],
+                ))
+                schedule_order[term.id] += 1
+            rows[LearningSituation].extend(situations)
+
+            placed = sorted(situations, key=lambda situation: situation.date_start)
+            for u in range(options['units_per_subject']):
+                situation = placed[u] if u < len(placed) else None
+                rows[PlanningUnit].append(PlanningUnit(
+                    id=make_uuid(rng), subject_id=subject.id, unit_number=u + 1,
+                    learning_situation_id=situation.id if situation else None,
+                    start_date=situation.date_start if situation else None,
+                    end_date=situation.date_end if situation else None,
+                ))
+
+    counts = {}
+    with transaction.atomic():
+        School.objects.bulk_create([school])
+        User.objects.bulk_create(teachers, batch_size=batch_size)
+        rows[School.years.through] = [
+            School.years.through(school_id=school.id, year_id=year_id) for year_id in shared['year_ids']
+        ]
+        rows[School.teaching_staff.through] = [
+            School.teaching_staff.through(school_id=school.id, user_id=teacher.pk) for teacher in teachers
+        ]
+        rows[User.groups.through] = [
+            User.groups.through(user_id=teacher.pk, group_id=shared['teachers_group_id']) for teacher in teachers
+        ]
+        for through, field, object_id, staff in staff_links:
+            rows[through].extend(through(**{field: object_id, 'user_id': teachers[i].pk}) for i in staff)
+        for model, objects in rows.items():
+            model.objects.bulk_create(objects, batch_size=batch_size)
+            counts[model._meta.label] = len(objects)
+        # bulk_create skips the signals that maintain the content counters
+        # and the coverage summary.
+        reconcile_counters([school.id])
+        refresh_coverage_summary([school.id])
+    counts['core.School'] = 1
+    counts['accounts.User'] = len(teachers)
+    return counts
+
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic synthetic dataset for load and scale testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1, help='Random seed; the same seed gives the same data')
+        parser.add_argument('--regions', type=int, default=3)
+        parser.add_argument('--schools', type=int, default=50)
+        parser.add_argument('--years', type=int, default=6)
+        parser.add_argument('--teachers', type=int, default=20, help='Teachers per school')
+        parser.add_argument('--subjects-per-year', type=int, default=8)
+        parser.add_argument('--competences-per-subject', type=int, default=6)
+        parser.add_argument('--criteria-per-competence', type=int, default=4)
+        parser.add_argument('--modules-per-subject', type=int, default=30)
+        parser.add_argument('--situations-per-subject', type=int, default=10)
+        parser.add_argument('--units-per-subject', type=int, default=15)
+        parser.add_argument('--academic-year', type=int, default=date.today().year,
+                            help='Calendar year in which the academic year starts')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per INSERT')
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                            help='Worker processes; 1 runs in this process')
+        parser.add_argument('--password', default='synthetic', help='Password for every generated teacher')
+
+    def handle(self, *args, **options):
+        if options['schools'] < 1 or options['regions'] < 1 or options['years'] < 1:
+            raise CommandError('--schools, --regions and --years must be at least 1.')
+        if options['teachers'] < 1:
+            raise CommandError('--teachers must be at least 1.')
+
+        started = time.monotonic()
+        rng = random.Random(options['seed'])
+        seed = options['seed']
+        with transaction.atomic():
+            regions = Region.objects.bulk_create([
+                Region(id=make_uuid(rng), name=f'Synthetic Region {seed}-{i}') for i in range(options['regions'])
+            ])
+            years = Year.objects.bulk_create([
+                Year(id=make_uuid(rng), name=f'Synthetic Year {seed}-{i + 1}') for i in range(options['years'])
+            ])
+            school_type = SchoolType.objects.create(id=make_uuid(rng), name=f'Synthetic {seed}')
+            school_type.default_years.set(years)
+            teachers_group, _ = Group.objects.get_or_create(name='Teachers')
+
+        shared = {
+            'region_ids': [region.id for region in regions],
+            'year_ids': [year.id for year in years],
+            'school_type_id': school_type.id,
+            'teachers_group_id': teachers_group.id,
+            'password': make_password(options['password']),
+        }
+        worker_options = {key: options[key] for key in (
+            'seed', 'teachers', 'subjects_per_year', 'competences_per_subject', 'criteria_per_competence',
+            'modules_per_subject', 'situations_per_subject', 'units_per_subject', 'academic_year', 'batch_size',
+        )}
+        tasks = [(index, worker_options, shared) for index in range(options['schools'])]
+        totals = {}
+
+        def collect(counts, done):
+            for label, count in counts.items():
+                totals[label] = totals.get(label, 0) + count
+            if options['verbosity'] > 1 or done == len(tasks):
+                self.stdout.write(f'{done}/{len(tasks)} schools, {sum(totals.values())} rows')
+
+        workers = max(1, min(options['workers'], len(tasks)))
+        if workers == 1:
+            for done, task in enumerate(tasks, start=1):
+                collect(seed_school(task), done)
+        else:
+            # Spawned workers set Django up from scratch, so they never inherit the
+            # parent's connections or connection pool.
+            with multiprocessing.get_context('spawn').Pool(workers, initializer=django.setup) as pool:
+                for done, counts in enumerate(pool.imap_unordered(seed_school, tasks), start=1):
+                    collect(counts, done)
+
+        # bulk_create skips the signals that normally invalidate cached catalogs.
+        for catalog in ('regions', 'years', 'competences'):
+            reference_cache.bump(catalog)
+
+        for label in sorted(totals):
+            self.stdout.write(f'  {label}: {totals[label]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {sum(totals.values())} rows in {time.monotonic() - started:.1f}s (seed {seed}).'
+        ))
@@ -0,0 +1,119 @@
+# core/metrics.py
+"""
+Prometheus metrics, served from ``/metrics`` (see ``MetricsAPIView``).
+
+- ``sofia_http_requests_total`` / ``sofia_http_request_duration_seconds``:
+  requests and latency per URL name, method and status
+  (``MetricsMiddleware``).
+- ``sofia_db_queries_total`` / ``sofia_db_query_duration_seconds_total``:
+  queries and time spent in them per view and database alias, counted by
+  an execute wrapper on every connection.
+- ``sofia_cache_requests_total``: reference cache lookups by layer and
+  result.
+- ``sofia_upload_size_bytes``: sizes of files stored by ``FileUploadView``.
+- ``sofia_db_pool``: connection pool counters of each worker as of its
+  last request.
+
+Under gunicorn every worker is a separate process. ``gunicorn.conf.py``
+points ``PROMETHEUS_MULTIPROC_DIR`` at a shared directory, where each
+worker keeps its values in memory-mapped files; ``/metrics`` adds up all
+of them, whichever worker answers the scrape. Without the variable
+(runserver, tests) the values of the current process are served.
+"""
+import hmac
+import json
+import os
+import time
+
+from django.conf import settings
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from rest_framework.permissions import BasePermission
+from rest_framework.renderers import BaseRenderer
+
+from .dbpool import pool_stats
+from .slow_queries import current_view
+
+UNRESOLVED = '<unresolved>'
+
+HTTP_REQUESTS = Counter(
+    'sofia_http_requests', 'HTTP requests by URL name, method and status.', ['view', 'method', 'status'],
+)
+HTTP_LATENCY = Histogram(
+    'sofia_http_request_duration_seconds', 'HTTP request latency by URL name and method.', ['view', 'method'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Counter('sofia_db_queries', 'SQL queries by view and database alias.', ['view', 'alias'])
+DB_QUERY_TIME = Counter(
+    'sofia_db_query_duration_seconds', 'Time spent in SQL queries by view and database alias.', ['view', 'alias'],
+)
+CACHE_REQUESTS = Counter(
+    'sofia_cache_requests', 'Cache lookups by cache, layer and result (hit or miss).', ['cache', 'layer', 'result'],
+)
+UPLOAD_SIZE = Histogram(
+    'sofia_upload_size_bytes', 'Sizes of files stored by the upload endpoint.',
+    buckets=(16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 10 * 1024 * 1024),
+)
+DB_POOL = Gauge(
+    'sofia_db_pool', 'Connection pool counters of each worker as of its last request.', ['alias', 'stat'],
+    multiprocess_mode='livesum',
+)
+POOL_STATS = ('pool_size', 'pool_available', 'requests_waiting', 'requests_num', 'requests_wait_ms')
+
+
+def query_counter(execute, sql, params, many, context):
+    """Execute wrapper counting queries and their time for the current view."""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        labels = (current_view.get() or UNRESOLVED, context['connection'].alias)
+        DB_QUERIES.labels(*labels).inc()
+        DB_QUERY_TIME.labels(*labels).inc(time.perf_counter() - started)
+
+
+def install(connection, **kwargs):
+    """``connection_created`` receiver adding ``query_counter`` once."""
+    if query_counter not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, query_counter)
+
+
+def record_cache(cache, layer, hit):
+    CACHE_REQUESTS.labels(cache, layer, 'hit' if hit else 'miss').inc()
+
+
+def record_pool_stats():
+    for alias, counters in pool_stats().items():
+        for stat in POOL_STATS:
+            DB_POOL.labels(alias, stat).set(counters.get(stat, 0))
+
+
+def exposition():
+    """All metrics in the Prometheus text format, summed over workers in multiprocess mode."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+class HasMetricsToken(BasePermission):
+    """Accept ``Authorization: Bearer <METRICS_TOKEN>`` when a token is configured."""
+
+    def has_permission(self, request, view):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        keyword, _, credential = request.headers.get('Authorization', '').partition(' ')
+        return bool(token) and keyword == 'Bearer' and hmac.compare_digest(credential.encode(), token.encode())
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+    content_type = CONTENT_TYPE_LATEST
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        return json.dumps(data).encode()
+
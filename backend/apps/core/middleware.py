@@ -0,0 +1,325 @@
+# core/middleware.py
+import hashlib
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics, tracing
+from .db_routers import replica_aliases, use_replica
+from .profiling import RequestProfile
+from .slow_queries import current_view
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class AsyncCapableMiddleware:
+    """
+    Base for middleware that runs in the mode of the handler it wraps.
+
+    Django switches between sync and async around every middleware that
+    can't, which under ASGI costs a thread hop on the way in and another
+    on the way out. Subclasses start ``__call__`` with
+    ``if self.async_mode: return self.__acall__(request)`` and implement
+    ``__acall__``. ``process_view`` must not block: in async mode it is
+    called inline instead of in a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            if hasattr(self, 'process_view'):
+                self.process_view = self._inline(self.process_view)
+
+    @staticmethod
+    def _inline(method):
+        async def inline(*args):
+            return method(*args)
+        return inline
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Count requests and their latency per URL name (see ``metrics.py``).
+
+    Kept first in ``MIDDLEWARE`` so the latency covers the whole stack.
+    Requests that match no URL share a single ``<unresolved>`` label.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def record(request, response, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match and match.view_name else metrics.UNRESOLVED
+        metrics.HTTP_REQUESTS.labels(view, request.method, response.status_code).inc()
+        metrics.HTTP_LATENCY.labels(view, request.method).observe(elapsed)
+        metrics.record_pool_stats()
+
+
+class TracingMiddleware(AsyncCapableMiddleware):
+    """
+    Trace sampled requests (see ``tracing.py``) and return the trace id in
+    the ``traceparent`` and ``X-Trace-Id`` headers.
+
+    Placed near the top of ``MIDDLEWARE``; the time between this middleware
+    and the view is reported as the ``middleware`` span.
+    """
+
+    def __init__(self, get_response):
+        if not settings.TRACING_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        root = tracing.start_trace(request)
+        if root is None:
+            return self.get_response(request)
+        request.trace_view_started_ns = None
+        token = tracing.current_span.set(root)
+        try:
+            response = self.get_response(request)
+        except Exception as exc:
+            root.error = f'{type(exc).__name__}: {exc}'[:200]
+            raise
+        else:
+            self.tag_response(root, response)
+        finally:
+            tracing.current_span.reset(token)
+            self.finish(root, request)
+        return response
+
+    async def __acall__(self, request):
+        root = tracing.start_trace(request)
+        if root is None:
+            return await self.get_response(request)
+        request.trace_view_started_ns = None
+        token = tracing.current_span.set(root)
+        try:
+            response = await self.get_response(request)
+        except Exception as exc:
+            root.error = f'{type(exc).__name__}: {exc}'[:200]
+            raise
+        else:
+            self.tag_response(root, response)
+        finally:
+            tracing.current_span.reset(token)
+            self.finish(root, request)
+        return response
+
+    @staticmethod
+    def tag_response(root, response):
+        root.attributes['http.status_code'] = response.status_code
+        response['traceparent'] = root.traceparent()
+        response['X-Trace-Id'] = root.trace.trace_id
+
+    @staticmethod
+    def finish(root, request):
+        match = request.resolver_match
+        if match and match.route:
+            root.name = f'{request.method} {match.route}'
+            root.attributes['http.route'] = match.route
+        tracing.finish_trace(root, request.trace_view_started_ns)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, 'trace_view_started_ns'):
+            request.trace_view_started_ns = time.time_ns()
+
+
+class ReplicaRoutingMiddleware(AsyncCapableMiddleware):
+    """
+    Send safe requests to read replicas, except for clients that wrote
+    recently.
+
+    A successful unsafe request pins the client (its API token, or its
+    session for the admin) to the primary for ``REPLICA_PIN_SECONDS`` so
+    the next reads see the write even if the replicas lag behind. Pins are
+    kept in the default cache, which must be shared between worker
+    processes for the pin to follow the client across workers.
+    """
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not replica_aliases():
+            return self.get_response(request)
+
+        client_key = self.client_key(request)
+        pinned = client_key is not None and cache.get(client_key, 0) > time.time()
+        token = use_replica.set(request.method in SAFE_METHODS and not pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica.reset(token)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400 and client_key:
+            window = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+            cache.set(client_key, time.time() + window, timeout=window)
+        return response
+
+    async def __acall__(self, request):
+        if not replica_aliases():
+            return await self.get_response(request)
+
+        client_key = self.client_key(request)
+        pinned = client_key is not None and await cache.aget(client_key, 0) > time.time()
+        token = use_replica.set(request.method in SAFE_METHODS and not pinned)
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_replica.reset(token)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400 and client_key:
+            window = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+            await cache.aset(client_key, time.time() + window, timeout=window)
+        return response
+
+    @staticmethod
+    def client_key(request):
+        credential = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not credential:
+            return None
+        return 'replica-pin:' + hashlib.sha256(credential.encode()).hexdigest()
+
+
+class ProfilingMiddleware(AsyncCapableMiddleware):
+    """
+    Profile a request when a staff user asks for it with ``?__profile=1``
+    or an ``X-Profile: 1`` header.
+
+    The report (top functions, SQL with timings and call sites, serializer
+    time per field, see ``profiling.py``) is stored in the default cache
+    for ``PROFILE_REPORT_TIMEOUT`` seconds and its id returned in the
+    ``X-Profile-Id`` header; fetch it from ``/api/core/profiles/<id>/``.
+    ``?__profile=inline`` returns the report instead of the response.
+
+    Only code running on the request's thread shows up in the function
+    profile; queries from ``fan_out`` worker threads are still recorded.
+    Requests without the flag only pay for the two lookups below. Under
+    ASGI a flagged request is profiled from a thread, and the sync views
+    it reaches run on that same thread.
+    """
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        mode = self.requested_mode(request)
+        if not mode:
+            return self.get_response(request)
+        return self.run_profiled(request, mode, self.get_response)
+
+    async def __acall__(self, request):
+        mode = self.requested_mode(request)
+        if not mode:
+            return await self.get_response(request)
+        return await sync_to_async(self.run_profiled)(request, mode, async_to_sync(self.get_response))
+
+    @staticmethod
+    def requested_mode(request):
+        return request.GET.get('__profile') or request.headers.get('X-Profile')
+
+    def run_profiled(self, request, mode, get_response):
+        if not self.is_staff(request):
+            return get_response(request)
+        profile = RequestProfile(request)
+        response = profile.run(get_response, request)
+        report = profile.report(response.status_code)
+        if mode == 'inline':
+            return JsonResponse(report)
+        cache.set(f'profile:{profile.id}', report, timeout=getattr(settings, 'PROFILE_REPORT_TIMEOUT', 3600))
+        response['X-Profile-Id'] = profile.id
+        return response
+
+    @staticmethod
+    def is_staff(request):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            try:
+                user, _ = TokenAuthentication().authenticate(request) or (None, None)
+            except AuthenticationFailed:
+                return False
+        return bool(user and user.is_staff)
+
+
+class ViewNameMiddleware(AsyncCapableMiddleware):
+    """Expose the resolved view name to database instrumentation through ``current_view``."""
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        try:
+            return self.get_response(request)
+        finally:
+            current_view.set(None)
+
+    async def __acall__(self, request):
+        try:
+            return await self.get_response(request)
+        finally:
+            current_view.set(None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        current_view.set(match.view_name if match and match.view_name else view_func.__name__)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise with an async path (WhiteNoise's own middleware is sync
+    only, which would put every ASGI request through a thread around it).
+
+    Other requests only pay for a dictionary lookup; files are served
+    from a thread. With ``WHITENOISE_AUTOREFRESH`` (the default under
+    ``DEBUG``) the lookup touches the file system and moves to a thread too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
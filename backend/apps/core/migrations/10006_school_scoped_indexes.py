@@ -0,0 +1,35 @@
+# Generated by Django 5.2.2 on 2026-10-19 06:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '10005_alter_specificcompetences_evaluation_criteria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='learningsituation',
+            index=models.Index(fields=['school', 'subject', 'date_start'], name='ls_school_subject_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='learningsituation',
+            index=models.Index(fields=['school', 'year', 'date_start'], name='ls_school_year_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='module',
+            index=models.Index(fields=['school', 'subject', 'date_start'], name='mod_school_subject_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='module',
+            index=models.Index(fields=['school', 'year', 'date_start'], name='mod_school_year_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subject',
+            index=models.Index(fields=['school', 'year'], name='subject_school_year_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.2 on 2026-10-19 06:22
+
+from django.db import migrations, models
+
+FILES = "CASE WHEN jsonb_typeof(m.files) = 'array' THEN jsonb_array_length(m.files) ELSE 0 END"
+
+BACKFILL = f"""
+UPDATE core_subject s SET
+    learning_situation_count = (SELECT count(*) FROM core_learningsituation ls WHERE ls.subject_id = s.id),
+    module_count = (SELECT count(*) FROM core_module m WHERE m.subject_id = s.id),
+    planning_unit_count = (SELECT count(*) FROM core_planningunit pu WHERE pu.subject_id = s.id),
+    file_count = (SELECT coalesce(sum({FILES}), 0) FROM core_module m WHERE m.subject_id = s.id);
+UPDATE core_school sc SET
+    learning_situation_count = (SELECT count(*) FROM core_learningsituation ls WHERE ls.school_id = sc.id),
+    module_count = (SELECT count(*) FROM core_module m WHERE m.school_id = sc.id),
+    planning_unit_count = (
+        SELECT count(*) FROM core_planningunit pu JOIN core_subject s ON s.id = pu.subject_id WHERE s.school_id = sc.id
+    ),
+    file_count = (SELECT coalesce(sum({FILES}), 0) FROM core_module m WHERE m.school_id = sc.id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '10006_school_scoped_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='school',
+            name='file_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='school',
+            name='learning_situation_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='school',
+            name='module_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='school',
+            name='planning_unit_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='file_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='learning_situation_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='module_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='planning_unit_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
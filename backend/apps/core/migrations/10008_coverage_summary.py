@@ -0,0 +1,60 @@
+# Generated by Django 5.2.2 on 2026-10-19 06:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BACKFILL = """
+WITH used AS (
+    SELECT DISTINCT ls.subject_id, m.id AS module_id, m.specific_competences, m.selected_criteria
+    FROM core_learningsituation ls
+    JOIN core_learningsituation_modules lm ON lm.learningsituation_id = ls.id
+    JOIN core_module m ON m.id = lm.module_id
+),
+addressed AS (
+    SELECT DISTINCT used.subject_id, used.module_id, competence.id AS competence_id, used.selected_criteria
+    FROM used CROSS JOIN LATERAL unnest(used.specific_competences) AS competence(id)
+),
+counts AS (
+    SELECT subject_id, competence_id, '' AS criterion_id, count(*) AS module_count
+    FROM addressed
+    GROUP BY subject_id, competence_id
+    UNION ALL
+    SELECT addressed.subject_id, addressed.competence_id, criterion.id, count(DISTINCT addressed.module_id)
+    FROM addressed CROSS JOIN LATERAL jsonb_array_elements_text(
+        CASE WHEN jsonb_typeof(addressed.selected_criteria -> addressed.competence_id::text) = 'array'
+             THEN addressed.selected_criteria -> addressed.competence_id::text
+             ELSE '[]'::jsonb END
+    ) AS criterion(id)
+    GROUP BY addressed.subject_id, addressed.competence_id, criterion.id
+)
+INSERT INTO core_coveragesummary (school_id, subject_id, year_id, competence_id, criterion_id, module_count)
+SELECT s.school_id, counts.subject_id, s.year_id, counts.competence_id, counts.criterion_id, counts.module_count
+FROM counts JOIN core_subject s ON s.id = counts.subject_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '10007_content_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoverageSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('competence_id', models.UUIDField()),
+                ('criterion_id', models.CharField(blank=True, default='', max_length=255)),
+                ('module_count', models.IntegerField()),
+                ('school', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.school')),
+                ('subject', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='coverage_summary', to='core.subject')),
+                ('year', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.year')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['school', 'year'], name='coverage_school_year_idx')],
+                'constraints': [models.UniqueConstraint(fields=('subject', 'competence_id', 'criterion_id'), name='coverage_summary_unique')],
+            },
+        ),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.2 on 2026-10-19 06:31
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '10008_coverage_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='module',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['specific_competences'], name='mod_competences_gin'),
+        ),
+    ]
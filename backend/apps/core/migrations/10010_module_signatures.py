@@ -0,0 +1,27 @@
+# Generated by Django 5.2.2 on 2026-10-19 06:40
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '10009_module_competences_gin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModuleSignature',
+            fields=[
+                ('module', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='core.module')),
+                ('signature', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None)),
+                ('bands', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None)),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['bands'], name='module_signature_bands_gin')],
+            },
+        ),
+    ]
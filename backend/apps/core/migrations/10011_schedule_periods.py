@@ -0,0 +1,34 @@
+# Generated by Django 5.2.2 on 2026-10-19 06:45
+
+import django.contrib.postgres.fields.ranges
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '10010_module_signatures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='module',
+            name='period',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(('date_end__isnull', False), ('date_start__isnull', False), ('date_start__lte', models.F('date_end'))), then=models.Func(models.F('date_start'), models.F('date_end'), models.Value('[]'), function='daterange', output_field=django.contrib.postgres.fields.ranges.DateRangeField())), output_field=django.contrib.postgres.fields.ranges.DateRangeField()), output_field=django.contrib.postgres.fields.ranges.DateRangeField()),
+        ),
+        migrations.AddField(
+            model_name='planningunit',
+            name='period',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(('end_date__isnull', False), ('start_date__isnull', False), ('start_date__lte', models.F('end_date'))), then=models.Func(models.F('start_date'), models.F('end_date'), models.Value('[]'), function='daterange', output_field=django.contrib.postgres.fields.ranges.DateRangeField())), output_field=django.contrib.postgres.fields.ranges.DateRangeField()), output_field=django.contrib.postgres.fields.ranges.DateRangeField()),
+        ),
+        migrations.AddField(
+            model_name='scheduledlearningsituation',
+            name='period',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(('end_date__isnull', False), ('start_date__isnull', False), ('start_date__lte', models.F('end_date'))), then=models.Func(models.F('start_date'), models.F('end_date'), models.Value('[]'), function='daterange', output_field=django.contrib.postgres.fields.ranges.DateRangeField())), output_field=django.contrib.postgres.fields.ranges.DateRangeField()), output_field=django.contrib.postgres.fields.ranges.DateRangeField()),
+        ),
+        migrations.AddField(
+            model_name='term',
+            name='period',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(('end_date__isnull', False), ('start_date__isnull', False), ('start_date__lte', models.F('end_date'))), then=models.Func(models.F('start_date'), models.F('end_date'), models.Value('[]'), function='daterange', output_field=django.contrib.postgres.fields.ranges.DateRangeField())), output_field=django.contrib.postgres.fields.ranges.DateRangeField()), output_field=django.contrib.postgres.fields.ranges.DateRangeField()),
+        ),
+    ]
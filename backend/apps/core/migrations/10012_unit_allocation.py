@@ -0,0 +1,34 @@
+# Generated by Django 5.2.2 on 2026-10-19 06:51
+
+import django.core.validators
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '10011_schedule_periods'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subject',
+            name='weekly_sessions',
+            field=models.PositiveSmallIntegerField(default=3, help_text='Class sessions per week, used to allocate planning unit dates', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.CreateModel(
+            name='NonTeachingDay',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='non_teaching_days', to='core.schoolcalendar')),
+            ],
+            options={
+                'ordering': ['calendar', 'date'],
+                'unique_together': {('calendar', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,198 @@
+# core/mixins.py
+import uuid
+from urllib.parse import urlencode
+
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.response import Response
+
+from apps.accounts.models import User
+from .models import LearningSituation, Module, PlanningUnit, School, SchoolCalendar, Subject, Term
+from .reference_cache import reference_cache
+
+
+def parse_list_param(request, name):
+    """Split a comma separated query parameter into a list of non-empty values."""
+    value = request.query_params.get(name, '')
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class DynamicFieldsViewMixin:
+    """
+    Pass ``?fields=`` and ``?expand=`` through to serializers using
+    ``DynamicFieldsMixin`` and prefetch only the relations the selected
+    fields and expansions render.
+
+    Only read requests are shaped; writes always use the full serializer so
+    that primary-key fields stay writable.
+    """
+
+    def shapes_response(self):
+        return self.request.method in SAFE_METHODS
+
+    def get_requested_fields(self):
+        if not self.shapes_response():
+            return None
+        return parse_list_param(self.request, 'fields') or None
+
+    def get_requested_expand(self):
+        if not self.shapes_response():
+            return None
+        return parse_list_param(self.request, 'expand') or None
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_requested_fields())
+        kwargs.setdefault('expand', self.get_requested_expand())
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        lookups = serializer_class.get_prefetch_lookups(
+            self.get_requested_expand(), fields=self.get_requested_fields(),
+        )
+        return queryset.prefetch_related(*lookups) if lookups else queryset
+
+
+class SchoolScopedMixin:
+    """
+    Limit a view's queryset to the requesting user's school.
+
+    ``school_lookup`` is the path from the model to the school id, e.g.
+    ``'subject__school_id'``; views can override ``get_scope_filter`` for
+    anything else. Superusers are not scoped and users without a school
+    see nothing. Applied in ``filter_queryset`` so it also covers
+    ``get_object`` and views that build their own ``get_queryset``.
+
+    Writes are scoped too: the primary-key fields of the serializer only
+    accept rows of the user's school for the models in
+    ``related_school_lookups`` (the path from each to the school id), so
+    another school's pk fails validation like a missing one. Shared
+    catalogs (years, regions, competences) are not restricted.
+    """
+    school_lookup = 'school_id'
+    related_school_lookups = {
+        School: 'pk',
+        Subject: 'school_id',
+        LearningSituation: 'school_id',
+        Module: 'school_id',
+        PlanningUnit: 'subject__school_id',
+        SchoolCalendar: 'school_id',
+        Term: 'calendar__school_id',
+        User: 'school_id',
+    }
+
+    def get_scope_filter(self, school_id):
+        return {self.school_lookup: school_id}
+
+    def get_scope_key(self):
+        """What ``filter_queryset`` lets the user see, for cache keys: ``'all'`` or the school id."""
+        user = self.request.user
+        return 'all' if user.is_superuser else str(getattr(user, 'school_id', None))
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        user = self.request.user
+        if user.is_superuser:
+            return queryset
+        school_id = getattr(user, 'school_id', None)
+        if school_id is None:
+            return queryset.none()
+        return queryset.filter(**self.get_scope_filter(school_id))
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        user = self.request.user
+        if self.request.method in SAFE_METHODS or user.is_superuser:
+            return serializer
+        school_id = getattr(user, 'school_id', None)
+        for field in getattr(serializer, 'fields', {}).values():
+            relation = getattr(field, 'child_relation', field)
+            queryset = getattr(relation, 'queryset', None)
+            lookup = queryset is not None and self.related_school_lookups.get(queryset.model)
+            if lookup:
+                relation.queryset = queryset.filter(**{lookup: school_id})
+        return serializer
+
+
+class FetchByIdsMixin:
+    """
+    Let list endpoints return specific rows with ``?ids=<uuid>,<uuid>``.
+
+    The rows come back in request order from a single query, together with
+    the ids that were not found (or are not visible through the view's
+    queryset)::
+
+        {"results": [...], "missing": ["<uuid>"]}
+    """
+    max_fetch_ids = 1000
+
+    def list(self, request, *args, **kwargs):
+        if 'ids' in request.query_params:
+            return self.fetch_by_ids(parse_list_param(request, 'ids'))
+        return super().list(request, *args, **kwargs)
+
+    def fetch_by_ids(self, ids):
+        if len(ids) > self.max_fetch_ids:
+            return Response(
+                {"error": f"At most {self.max_fetch_ids} ids can be fetched at once"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            ids = list(dict.fromkeys(uuid.UUID(str(value)) for value in ids))
+        except ValueError:
+            return Response({"error": "ids must be UUIDs"}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.filter_queryset(self.get_queryset()).filter(pk__in=ids)
+        found = {obj.pk: obj for obj in queryset}
+        serializer = self.get_serializer([found[pk] for pk in ids if pk in found], many=True)
+        return Response({
+            'results': serializer.data,
+            'missing': [str(pk) for pk in ids if pk not in found],
+        })
+
+
+class FetchByIdsPostMixin:
+    """
+    POST variant of ``FetchByIdsMixin`` for id lists too long for a URL.
+
+    Expects ``{"ids": [...]}``. Mixed into a list view, it replaces that
+    view's create handler; fetching only needs read access.
+    """
+    http_method_names = ['post', 'options']
+    permission_classes = [IsAuthenticated]
+
+    def shapes_response(self):
+        return True
+
+    def post(self, request, *args, **kwargs):
+        ids = request.data.get('ids')
+        if not isinstance(ids, list):
+            return Response({"error": "ids must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+        return self.fetch_by_ids(ids)
+
+
+class ReferenceCacheMixin:
+    """
+    Serve list GETs of a reference catalog from ``reference_cache``.
+
+    Responses are cached per catalog version and query string; only
+    successful responses are stored.
+    """
+    reference_catalog = None
+
+    def get_reference_catalog(self):
+        return self.reference_catalog
+
+    def get_reference_cache_key(self):
+        return urlencode(sorted(self.request.query_params.lists()), doseq=True)
+
+    def list(self, request, *args, **kwargs):
+        catalog, key = self.get_reference_catalog(), self.get_reference_cache_key()
+        data = reference_cache.get(catalog, key)
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            reference_cache.set(catalog, key, response.data)
+        return response
@@ -1,6 +1,8 @@
 import uuid
-from django.db import models
-from django.contrib.postgres.fields import ArrayField
+from django.core.validators import MinValueValidator
+from django.db import models, router, transaction
+from django.contrib.postgres.fields import ArrayField, DateRangeField
+from django.contrib.postgres.indexes import GinIndex
 from django.conf import settings
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -10,6 +12,30 @@ from dateutil.relativedelta import relativedelta
 # For the teaching staff, we'll reference the custom user model.
 User = settings.AUTH_USER_MODEL
 
+
+def date_range(start, end):
+    """
+    Inclusive ``daterange`` of the date fields ``start`` and ``end``, kept
+    by Postgres as a stored generated column. NULL unless both dates are set
+    and ``start`` is not after ``end``, so a half-planned item is never an
+    unbounded range. Read by the schedule conflict report
+    (``schedule_conflicts.py``).
+    """
+    period = models.Func(
+        models.F(start), models.F(end), models.Value('[]'), function='daterange', output_field=DateRangeField(),
+    )
+    return models.GeneratedField(
+        expression=models.Case(
+            models.When(
+                models.Q(**{f'{start}__isnull': False, f'{end}__isnull': False, f'{start}__lte': models.F(end)}),
+                then=period,
+            ),
+            output_field=DateRangeField(),
+        ),
+        output_field=DateRangeField(),
+        db_persist=True,
+    )
+
 # Set Global entities
 class Region(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -82,7 +108,37 @@ class SchoolType(models.Model):
         return self.name
 
 
-class School(models.Model):
+class ContentCounters(models.Model):
+    """
+    Content counters of a school or subject, maintained by
+    ``counters.py``. A regular ``save()`` leaves them alone so it can't
+    overwrite concurrent increments with the values it loaded.
+    """
+    COUNTER_FIELDS = ('learning_situation_count', 'module_count', 'planning_unit_count', 'file_count')
+
+    learning_situation_count = models.IntegerField(default=0, editable=False)
+    module_count = models.IntegerField(default=0, editable=False)
+    planning_unit_count = models.IntegerField(default=0, editable=False)
+    file_count = models.IntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        # An insert writes the counters' defaults; only updates leave them out.
+        if not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred
+                ]
+            kwargs['update_fields'] = [name for name in update_fields if name not in self.COUNTER_FIELDS]
+        super().save(*args, **kwargs)
+
+
+class School(ContentCounters):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255)
     teaching_staff = models.ManyToManyField(User, related_name='schools', blank=True,)
@@ -95,7 +151,20 @@ class School(models.Model):
     def __str__(self):
         return self.name
 
-class Subject(models.Model):
+
+class CountedContentMixin:
+    """
+    Save inside a transaction, so the counter updates made by the post_save
+    handler (see ``counters.py``) commit or roll back with the row.
+    """
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+
+class Subject(ContentCounters):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255)
     description = models.CharField(max_length=255)
@@ -116,12 +185,22 @@ class Subject(models.Model):
     school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='subjects')
     teaching_staff = models.ManyToManyField(User, related_name='subjects', blank=True)
     specific_competences = models.ManyToManyField(SpecificCompetences, related_name='subjects', blank=True)
+    weekly_sessions = models.PositiveSmallIntegerField(
+        default=3,
+        validators=[MinValueValidator(1)],
+        help_text="Class sessions per week, used to allocate planning unit dates"
+    )
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['school', 'year'], name='subject_school_year_idx'),
+        ]
+
     def __str__(self):
         return f"Subject {self.name} - {self.school}"
 
 
-class LearningSituation(models.Model):
+class LearningSituation(CountedContentMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     year = models.ForeignKey(
         Year,
@@ -145,12 +224,19 @@ class LearningSituation(models.Model):
     date_end = models.DateField(null=True, blank=True)
     specific_competences = models.ManyToManyField(SpecificCompetences, related_name='learning_situations', blank=True)
     modules = models.ManyToManyField('Module', related_name='learning_situations', blank=True)
+
+    class Meta:
+        # Every list is scoped to one school, so lead with it.
+        indexes = [
+            models.Index(fields=['school', 'subject', 'date_start'], name='ls_school_subject_start_idx'),
+            models.Index(fields=['school', 'year', 'date_start'], name='ls_school_year_start_idx'),
+        ]
     
     def __str__(self):
         return self.title
 
 
-class Module(models.Model):
+class Module(CountedContentMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     year = models.ForeignKey(Year, on_delete=models.CASCADE, related_name='modules')
     school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='modules')
@@ -204,6 +290,15 @@ class Module(models.Model):
         default=list,
         help_text="List of file attachments with metadata"
     )
+    period = date_range('date_start', 'date_end')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['school', 'subject', 'date_start'], name='mod_school_subject_start_idx'),
+            models.Index(fields=['school', 'year', 'date_start'], name='mod_school_year_start_idx'),
+            # Candidate lookup of the coverage recommender (``specific_competences__overlap``).
+            GinIndex(fields=['specific_competences'], name='mod_competences_gin'),
+        ]
     
     def __str__(self):
         return self.title
@@ -224,10 +319,25 @@ class Term(models.Model):
     name = models.CharField(max_length=255)  # e.g., "First Term", "Second Term"
     start_date = models.DateField()
     end_date = models.DateField()
+    period = date_range('start_date', 'end_date')
     
     def __str__(self):
         return f"{self.calendar.academic_year} - {self.name}"
 
+class NonTeachingDay(models.Model):
+    """A weekday without classes (holiday, school event) of a calendar."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    calendar = models.ForeignKey(SchoolCalendar, on_delete=models.CASCADE, related_name='non_teaching_days')
+    date = models.DateField()
+    name = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        unique_together = ['calendar', 'date']
+        ordering = ['calendar', 'date']
+
+    def __str__(self):
+        return f"{self.date} {self.name}".strip()
+
 class ScheduledLearningSituation(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     learning_situation = models.ForeignKey(LearningSituation, on_delete=models.CASCADE, related_name='schedules')
@@ -235,6 +345,7 @@ class ScheduledLearningSituation(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
     order = models.IntegerField(default=0)  # For ordering within the term
+    period = date_range('start_date', 'end_date')
     
     class Meta:
         ordering = ['term', 'order', 'start_date']
@@ -283,7 +394,7 @@ def create_school_calendar(sender, instance, created, **kwargs):
         )
 
 # Add this new model for Planning Units
-class PlanningUnit(models.Model):
+class PlanningUnit(CountedContentMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='planning_units')
     unit_number = models.IntegerField(help_text="The sequence number of this unit in the plan")
@@ -299,6 +410,7 @@ class PlanningUnit(models.Model):
     title = models.CharField(max_length=255, blank=True, null=True, 
                            help_text="Optional custom title for this unit")
     notes = models.TextField(blank=True, null=True)
+    period = date_range('start_date', 'end_date')
     
     class Meta:
         unique_together = ['subject', 'unit_number']
@@ -306,3 +418,50 @@ class PlanningUnit(models.Model):
     
     def __str__(self):
         return f"Unit {self.unit_number}: {self.subject.name} - {self.learning_situation.title if self.learning_situation else 'Empty'}"
+
+
+class CoverageSummary(models.Model):
+    """
+    Number of modules, among those used in a subject's learning situations,
+    that address a competence (``criterion_id`` empty) or select one of its
+    criteria. Maintained by ``coverage_summary.py``; read by the school
+    coverage endpoint.
+    """
+    # school and subject are covered by the index and the unique constraint below.
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='+', db_index=False)
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='coverage_summary', db_index=False)
+    year = models.ForeignKey(Year, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    competence_id = models.UUIDField()
+    criterion_id = models.CharField(max_length=255, blank=True, default='')
+    module_count = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['subject', 'competence_id', 'criterion_id'], name='coverage_summary_unique',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['school', 'year'], name='coverage_school_year_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject_id} {self.competence_id} {self.criterion_id or '*'}: {self.module_count}"
+
+
+class ModuleSignature(models.Model):
+    """
+    MinHash signature of a module's text and competences and its LSH
+    bucket keys, for near-duplicate detection (see ``duplicates.py``).
+    """
+    module = models.OneToOneField(Module, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    signature = ArrayField(models.BigIntegerField())
+    bands = ArrayField(models.BigIntegerField())
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['bands'], name='module_signature_bands_gin'),
+        ]
+
+    def __str__(self):
+        return f"Signature of {self.module_id}"
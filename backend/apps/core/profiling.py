@@ -0,0 +1,190 @@
+# core/profiling.py
+"""
+On-demand request profiling for staff users (see ``ProfilingMiddleware``).
+
+A profiled request runs under ``cProfile`` and records every SQL
+statement with its duration and the application frames it came from, and
+the time each serializer field spends producing its value.
+
+SQL and serializer timing need hooks in Django and DRF. They are patched
+in only while at least one profiled request is running and removed again
+afterwards, so requests pay nothing for them while profiling is off.
+Requests that overlap with a profiled one only pay for a context variable
+lookup per query and per serialized object.
+"""
+import cProfile
+import contextvars
+import os
+import pstats
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.backends.utils import CursorWrapper
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.serializers import Serializer
+
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+APP_ROOT = os.path.join(str(settings.BASE_DIR), 'apps') + os.sep
+
+
+def _short_path(filename):
+    if filename.startswith(str(settings.BASE_DIR)):
+        return os.path.relpath(filename, settings.BASE_DIR)
+    return filename.rpartition('site-packages' + os.sep)[2]
+
+
+def _origin():
+    """The innermost application frames of the current stack."""
+    frames = [
+        frame for frame in traceback.extract_stack()[:-3]
+        if frame.filename.startswith(APP_ROOT) and not frame.filename.endswith('profiling.py')
+    ]
+    return [
+        f'{_short_path(frame.filename)}:{frame.lineno} in {frame.name}'
+        for frame in frames[-getattr(settings, 'PROFILE_STACK_DEPTH', 3):]
+    ]
+
+
+def _profiled_execute(self, sql, params=None):
+    profile = current_profile.get()
+    if profile is None:
+        return _original_execute(self, sql, params)
+    started = time.perf_counter()
+    try:
+        return _original_execute(self, sql, params)
+    finally:
+        profile.add_query(sql, time.perf_counter() - started, many=False)
+
+
+def _profiled_executemany(self, sql, param_list):
+    profile = current_profile.get()
+    if profile is None:
+        return _original_executemany(self, sql, param_list)
+    started = time.perf_counter()
+    try:
+        return _original_executemany(self, sql, param_list)
+    finally:
+        profile.add_query(sql, time.perf_counter() - started, many=True)
+
+
+def _profiled_to_representation(self, instance):
+    profile = current_profile.get()
+    if profile is None:
+        return _original_to_representation(self, instance)
+
+    # Same as Serializer.to_representation, timing each field.
+    ret = OrderedDict()
+    name = type(self).__name__
+    for field in self._readable_fields:
+        started = time.perf_counter()
+        try:
+            attribute = field.get_attribute(instance)
+        except SkipField:
+            continue
+        check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+        if check_for_none is None:
+            ret[field.field_name] = None
+        else:
+            ret[field.field_name] = field.to_representation(attribute)
+        profile.add_field(f'{name}.{field.field_name}', time.perf_counter() - started)
+    return ret
+
+
+_original_execute = CursorWrapper.execute
+_original_executemany = CursorWrapper.executemany
+_original_to_representation = Serializer.to_representation
+_hooks_lock = threading.Lock()
+_active_profiles = 0
+
+
+def _install_hooks():
+    global _active_profiles
+    with _hooks_lock:
+        _active_profiles += 1
+        if _active_profiles == 1:
+            CursorWrapper.execute = _profiled_execute
+            CursorWrapper.executemany = _profiled_executemany
+            Serializer.to_representation = _profiled_to_representation
+
+
+def _remove_hooks():
+    global _active_profiles
+    with _hooks_lock:
+        _active_profiles -= 1
+        if _active_profiles == 0:
+            CursorWrapper.execute = _original_execute
+            CursorWrapper.executemany = _original_executemany
+            Serializer.to_representation = _original_to_representation
+
+
+class RequestProfile:
+    def __init__(self, request):
+        self.id = str(uuid.uuid4())
+        self.method = request.method
+        self.path = request.get_full_path()
+        self.queries = []
+        self.fields = {}
+        self._lock = threading.Lock()
+        self._profiler = cProfile.Profile()
+
+    def add_query(self, sql, duration, many):
+        entry = {'sql': sql, 'duration_ms': round(duration * 1000, 3), 'many': many, 'origin': _origin()}
+        with self._lock:
+            self.queries.append(entry)
+
+    def add_field(self, name, duration):
+        with self._lock:
+            calls, total = self.fields.get(name, (0, 0.0))
+            self.fields[name] = (calls + 1, total + duration)
+
+    def run(self, func, *args):
+        """Call ``func`` with profiling on and return its result."""
+        _install_hooks()
+        token = current_profile.set(self)
+        started = time.perf_counter()
+        try:
+            return self._profiler.runcall(func, *args)
+        finally:
+            self.duration = time.perf_counter() - started
+            current_profile.reset(token)
+            _remove_hooks()
+
+    def report(self, status_code=None):
+        top = getattr(settings, 'PROFILE_TOP_FUNCTIONS', 40)
+        stats = pstats.Stats(self._profiler).stats
+        functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        seen = {}
+        for query in self.queries:
+            seen[query['sql']] = seen.get(query['sql'], 0) + 1
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'status_code': status_code,
+            'duration_ms': round(self.duration * 1000, 2),
+            'functions': [
+                {
+                    'function': f'{_short_path(filename)}:{line}({name})',
+                    'calls': calls,
+                    'tottime_ms': round(tottime * 1000, 3),
+                    'cumtime_ms': round(cumtime * 1000, 3),
+                }
+                for (filename, line, name), (_, calls, tottime, cumtime, _callers) in functions
+            ],
+            'sql': {
+                'count': len(self.queries),
+                'duration_ms': round(sum(query['duration_ms'] for query in self.queries), 3),
+                'duplicates': sum(count - 1 for count in seen.values()),
+                'queries': self.queries,
+            },
+            'serializer_fields': [
+                {'field': name, 'calls': calls, 'total_ms': round(total * 1000, 3)}
+                for name, (calls, total) in sorted(self.fields.items(), key=lambda item: item[1][1], reverse=True)
+            ],
+        }
@@ -0,0 +1,176 @@
+# core/recommendations.py
+"""
+Module recommendations that close a subject's coverage gaps.
+
+The gaps are the evaluation criteria of the subject's competences that no
+module in its learning situations selects, plus the competences without
+criteria that none addresses (see ``coverage.py``). Each competence
+weighs 1, split evenly over its criteria, so a competence with many
+criteria does not outweigh the others.
+
+``candidate_covers`` finds, in SQL, the gaps each module of the library
+would close, so the modules' JSON never leaves the database. The GIN
+index ``mod_competences_gin`` narrows the library to the modules sharing
+a competence with the gaps, which keeps the cost proportional to those
+rather than to the size of the library. Modules closing exactly the same
+gaps are interchangeable and collapse into the best ranked one.
+
+``recommend`` runs the greedy set-cover approximation over them: it
+repeatedly picks the module closing the most remaining gap weight. An
+inverted index from each gap to the modules closing it keeps the gains
+current, since closing a gap only lowers the gain of the modules listed
+under it. A lazy max-heap re-checks a popped module only when its gain
+changed since it was pushed. Picks that later picks made redundant are
+dropped at the end, leaving a minimal set.
+"""
+import heapq
+
+from django.db import connections, router
+
+from .models import LearningSituation, Module, School
+
+COVERS_SQL = """
+WITH gap AS (
+    SELECT * FROM unnest(%(competences)s::text[], %(criteria)s::text[], %(numbers)s::int[])
+        AS gap(competence_id, criterion_id, number)
+),
+candidate AS (
+    SELECT m.id, m.specific_competences::text[] AS competences, m.selected_criteria,
+           CASE WHEN m.subject_id = %(subject)s THEN 0 WHEN m.school_id = %(school)s THEN 1 ELSE 2 END AS rank
+    FROM {module} m
+    WHERE m.specific_competences && %(gap_competences)s::uuid[]
+      AND {scope}
+      AND m.id NOT IN (
+          SELECT lm.module_id FROM {situation_modules} lm
+          JOIN {situation} ls ON ls.id = lm.learningsituation_id
+          WHERE ls.subject_id = %(subject)s
+      )
+),
+addressed AS MATERIALIZED (
+    SELECT candidate.id, candidate.rank, competence.id AS competence_id,
+           candidate.selected_criteria -> competence.id AS criteria
+    FROM candidate
+    CROSS JOIN LATERAL unnest(candidate.competences) AS competence(id)
+    WHERE competence.id = ANY(%(gap_competences)s::text[])
+)
+SELECT addressed.id, array_agg(gap.number), addressed.rank
+FROM addressed
+JOIN gap ON gap.competence_id = addressed.competence_id
+WHERE gap.criterion_id = '' OR (jsonb_typeof(addressed.criteria) = 'array' AND addressed.criteria ? gap.criterion_id)
+GROUP BY addressed.id, addressed.rank
+"""
+
+SCOPES = {
+    'school': 'm.school_id = %(school)s',
+    'region': 'm.school_id IN (SELECT id FROM {school} WHERE region_id = %(region)s)',
+}
+
+
+def coverage_gaps(competences, module_counts, criterion_counts):
+    """``{(competence_id, criterion_id): weight}`` of what the counts leave uncovered."""
+    gaps = {}
+    for competence in competences:
+        competence_id = str(competence.id)
+        criteria = [str(criterion.get('id')) for criterion in competence.evaluation_criteria or []]
+        if not criteria:
+            if competence_id not in module_counts:
+                gaps[(competence_id, '')] = 1.0
+            continue
+        for criterion_id in criteria:
+            if not criterion_counts.get((competence_id, criterion_id)):
+                gaps[(competence_id, criterion_id)] = 1 / len(criteria)
+    return gaps
+
+
+def candidate_covers(keys, subject, scope):
+    """
+    ``(module_id, gap_numbers, rank)`` for the modules in ``scope`` (school
+    or region of ``subject``, a dict with ``id``, ``school_id`` and
+    ``school__region_id``) that would close any of the gaps ``keys``;
+    ``gap_numbers`` are positions in ``keys``. Modules already used by the
+    subject are left out. Rank 0 is a module of the subject itself, 1 one
+    of its school, 2 one of another school.
+    """
+    if not keys:
+        return []
+    tables = {
+        'module': Module._meta.db_table,
+        'situation': LearningSituation._meta.db_table,
+        'situation_modules': LearningSituation.modules.through._meta.db_table,
+        'school': School._meta.db_table,
+    }
+    sql = COVERS_SQL.format(scope=SCOPES[scope].format(**tables), **tables)
+    with connections[router.db_for_read(Module)].cursor() as cursor:
+        cursor.execute(sql, {
+            'competences': [competence_id for competence_id, _ in keys],
+            'gap_competences': sorted({competence_id for competence_id, _ in keys}),
+            'criteria': [criterion_id for _, criterion_id in keys],
+            'numbers': list(range(len(keys))),
+            'subject': subject['id'],
+            'school': subject['school_id'],
+            'region': subject['school__region_id'],
+        })
+        return cursor.fetchall()
+
+
+def recommend(candidates, weights, limit):
+    """
+    Greedy weighted set cover of the gaps numbered like ``weights`` by
+    ``candidates`` (``(module_id, gap_numbers, rank)``; among modules with
+    the same gain the lowest rank wins). Returns at most ``limit``
+    ``(module_id, gained_weight, gap_numbers)`` picks in the order chosen.
+    """
+    best = {}
+    for module_id, numbers, rank in candidates:
+        numbers = frozenset(numbers)
+        if numbers not in best or (rank, module_id) < best[numbers]:
+            best[numbers] = (rank, module_id)
+
+    modules, ranks, covers, gain = [], [], [], []
+    index = [[] for _ in weights]
+    for numbers, (rank, module_id) in best.items():
+        position = len(modules)
+        modules.append(module_id)
+        ranks.append(rank)
+        covers.append(numbers)
+        gain.append(sum(weights[number] for number in numbers))
+        for number in numbers:
+            index[number].append(position)
+
+    heap = [(-gain[position], ranks[position], position) for position in range(len(modules))]
+    heapq.heapify(heap)
+    uncovered = {number for number, positions in enumerate(index) if positions}
+    picks = []
+    while heap and uncovered and len(picks) < limit:
+        negative_gain, rank, position = heapq.heappop(heap)
+        if -negative_gain != gain[position]:
+            # Stale entry: the module lost gain since it was pushed.
+            if gain[position] > 1e-9:
+                heapq.heappush(heap, (-gain[position], rank, position))
+            continue
+        closed = covers[position] & uncovered
+        if not closed:
+            continue
+        picks.append(position)
+        uncovered -= closed
+        for number in closed:
+            for other in index[number]:
+                gain[other] -= weights[number]
+
+    # Drop picks whose gaps the other picks close as well, latest first.
+    closing = {}
+    for position in picks:
+        for number in covers[position]:
+            closing[number] = closing.get(number, 0) + 1
+    for position in reversed(picks[:]):
+        if all(closing[number] > 1 for number in covers[position]):
+            picks.remove(position)
+            for number in covers[position]:
+                closing[number] -= 1
+
+    result, uncovered = [], set(range(len(weights)))
+    for position in picks:
+        closed = sorted(covers[position] & uncovered)
+        uncovered.difference_update(closed)
+        result.append((modules[position], sum(weights[number] for number in closed), closed))
+    return result
@@ -0,0 +1,101 @@
+# core/reference_cache.py
+"""
+Two-level cache for reference catalogs (regions, years, competences).
+
+Entries are keyed by a per-catalog version number kept in the shared
+``default`` cache; model signals bump the version, which orphans every
+entry built from the old data. Each process keeps a small LRU in front of
+the shared cache and only re-reads the version numbers every
+``REFERENCE_CACHE_VERSION_TTL`` seconds, so a hit costs no database or
+cache round trip. Changes made in another process become visible within
+that interval.
+
+A catalog that depends on one school's data is versioned per school with
+``school_catalog`` (``years:<school_id>``), so writes in one school leave
+the other schools' entries alone.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import record_cache
+
+
+class ReferenceCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+
+    @property
+    def maxsize(self):
+        return getattr(settings, 'REFERENCE_CACHE_SIZE', 512)
+
+    def version(self, catalog):
+        now = time.monotonic()
+        with self._lock:
+            local = self._versions.get(catalog)
+        if local and now - local[1] < getattr(settings, 'REFERENCE_CACHE_VERSION_TTL', 2):
+            return local[0]
+
+        key = f'refcache:version:{catalog}'
+        version = cache.get(key)
+        if version is None:
+            # Start from the clock so a lost counter never reuses old keys.
+            cache.add(key, time.time_ns(), timeout=None)
+            version = cache.get(key, time.time_ns())
+        with self._lock:
+            self._versions[catalog] = (version, now)
+        return version
+
+    def bump(self, catalog):
+        key = f'refcache:version:{catalog}'
+        try:
+            version = cache.incr(key)
+        except ValueError:
+            version = time.time_ns()
+            cache.set(key, version, timeout=None)
+        with self._lock:
+            self._versions[catalog] = (version, time.monotonic())
+
+    def get(self, catalog, key):
+        full_key = f'refcache:{catalog}:{self.version(catalog)}:{key}'
+        with self._lock:
+            if full_key in self._entries:
+                self._entries.move_to_end(full_key)
+                record_cache('reference', 'local', hit=True)
+                return self._entries[full_key]
+        record_cache('reference', 'local', hit=False)
+        value = cache.get(full_key)
+        record_cache('reference', 'shared', hit=value is not None)
+        if value is not None:
+            self._remember(full_key, value)
+        return value
+
+    def set(self, catalog, key, value):
+        full_key = f'refcache:{catalog}:{self.version(catalog)}:{key}'
+        cache.set(full_key, value, timeout=getattr(settings, 'REFERENCE_CACHE_TIMEOUT', 24 * 60 * 60))
+        self._remember(full_key, value)
+
+    def clear_local(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def _remember(self, full_key, value):
+        with self._lock:
+            self._entries[full_key] = value
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def school_catalog(catalog, school_id):
+    """The part of ``catalog`` that changes with one school's data only."""
+    return f'{catalog}:{school_id}'
+
+
+reference_cache = ReferenceCache()
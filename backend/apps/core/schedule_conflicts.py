@@ -0,0 +1,178 @@
+# core/schedule_conflicts.py
+"""
+Schedule conflicts of a school: overlapping items and items outside the
+school's terms.
+
+Scheduled learning situations, planning units, modules and terms carry a
+``period`` column, the inclusive ``daterange`` of their dates generated
+by Postgres (see ``models.date_range``). ``conflicts`` reports, in one
+query:
+
+* overlaps: two scheduled situations of the same subject in the same
+  term, two planning units of the same subject, or two modules of the
+  same subject whose periods share a day;
+* ``outside_term``: a scheduled situation not within its own term, or a
+  planning unit or module not within the school's terms (a unit may span
+  consecutive terms, not the holidays between them);
+* ``invalid_range``: an item ending before it starts.
+
+Items without both dates are not planned yet and never reported. The
+school's items are found through the indexes on school and subject and
+only compared within a subject, so the cost follows the size of one
+school rather than the whole database; ``period`` needs no index of its
+own.
+
+Schools that want the database to refuse overlaps can add the exclusion
+constraints in ``CONSTRAINTS`` with ``manage.py schedule_constraints``.
+They need the ``btree_gist`` extension to compare the term or subject in
+a GiST index, so they are not part of the migrations.
+"""
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import RangeOperators
+from django.db import connections, router
+
+from .models import (
+    LearningSituation, Module, PlanningUnit, ScheduledLearningSituation, SchoolCalendar, Subject, Term,
+)
+
+KINDS = ('scheduled_situation', 'planning_unit', 'module')
+
+ITEMS_SQL = {
+    'scheduled_situation': """
+scheduled_situation AS (
+    SELECT s.id, ls.subject_id, s.term_id, ls.title, s.start_date, s.end_date, s.period
+    FROM {scheduled} s JOIN {situation} ls ON ls.id = s.learning_situation_id
+    WHERE ls.school_id = %(school)s {subject_filter}
+)""",
+    'planning_unit': """
+planning_unit AS (
+    SELECT u.id, u.subject_id, NULL::uuid AS term_id,
+           COALESCE(NULLIF(u.title, ''), ls.title, 'Unit ' || u.unit_number) AS title,
+           u.start_date, u.end_date, u.period
+    FROM {unit} u
+    JOIN {subject} subject ON subject.id = u.subject_id
+    LEFT JOIN {situation} ls ON ls.id = u.learning_situation_id
+    WHERE subject.school_id = %(school)s {subject_filter}
+      AND u.start_date IS NOT NULL AND u.end_date IS NOT NULL
+)""",
+    'module': """
+module AS (
+    SELECT m.id, m.subject_id, NULL::uuid AS term_id, m.title, m.date_start AS start_date,
+           m.date_end AS end_date, m.period
+    FROM {module} m
+    WHERE m.school_id = %(school)s {subject_filter}
+      AND m.date_start IS NOT NULL AND m.date_end IS NOT NULL
+)""",
+}
+
+TERMS_SQL = """
+school_terms AS (
+    SELECT COALESCE(range_agg(t.period), '{{}}'::datemultirange) AS periods
+    FROM {term} t JOIN {calendar} c ON c.id = t.calendar_id
+    WHERE c.school_id = %(school)s
+)"""
+
+SELECT_SQL = "SELECT '{issue}', '{kind}', a.subject_id, a.term_id, a.id, a.title, a.start_date, a.end_date, {other}"
+OTHER = 'b.id, b.title, b.start_date, b.end_date'
+NO_OTHER = 'NULL::uuid, NULL::text, NULL::date, NULL::date'
+
+CHECKS_SQL = {
+    'scheduled_situation': {
+        'overlap': """FROM scheduled_situation a JOIN scheduled_situation b
+  ON b.term_id = a.term_id AND b.subject_id = a.subject_id AND b.id > a.id AND b.period && a.period""",
+        'outside_term': """FROM scheduled_situation a JOIN {term} t ON t.id = a.term_id
+WHERE a.period IS NOT NULL AND NOT COALESCE(t.period @> a.period, false)""",
+        'invalid_range': 'FROM scheduled_situation a WHERE a.period IS NULL',
+    },
+    'planning_unit': {
+        'overlap': """FROM planning_unit a JOIN planning_unit b
+  ON b.subject_id = a.subject_id AND b.id > a.id AND b.period && a.period""",
+        'outside_term': """FROM planning_unit a CROSS JOIN school_terms
+WHERE a.period IS NOT NULL AND NOT school_terms.periods @> a.period""",
+        'invalid_range': 'FROM planning_unit a WHERE a.period IS NULL',
+    },
+    'module': {
+        'overlap': """FROM module a JOIN module b
+  ON b.subject_id = a.subject_id AND b.id > a.id AND b.period && a.period""",
+        'outside_term': """FROM module a CROSS JOIN school_terms
+WHERE a.period IS NOT NULL AND NOT school_terms.periods @> a.period""",
+        'invalid_range': 'FROM module a WHERE a.period IS NULL',
+    },
+}
+
+
+def _tables():
+    return {
+        'scheduled': ScheduledLearningSituation._meta.db_table,
+        'situation': LearningSituation._meta.db_table,
+        'unit': PlanningUnit._meta.db_table,
+        'subject': Subject._meta.db_table,
+        'module': Module._meta.db_table,
+        'term': Term._meta.db_table,
+        'calendar': SchoolCalendar._meta.db_table,
+    }
+
+
+def conflicts(school_id, subject_id=None, kinds=KINDS):
+    """
+    Rows ``(issue, kind, subject_id, term_id, id, title, start_date,
+    end_date, other_id, other_title, other_start_date, other_end_date)``
+    for the school's items of ``kinds``, optionally of one subject.
+    ``issue`` is ``overlap``, ``outside_term`` or ``invalid_range``; the
+    ``other_`` columns are set for overlaps only.
+    """
+    kinds = [kind for kind in KINDS if kind in kinds]
+    if not kinds:
+        return []
+    tables = _tables()
+    aliases = {'scheduled_situation': 'ls', 'planning_unit': 'u', 'module': 'm'}
+    ctes = [
+        ITEMS_SQL[kind].format(
+            subject_filter=f'AND {aliases[kind]}.subject_id = %(subject)s' if subject_id else '', **tables,
+        )
+        for kind in kinds
+    ]
+    if set(kinds) - {'scheduled_situation'}:
+        ctes.append(TERMS_SQL.format(**tables))
+    checks = [
+        SELECT_SQL.format(issue=issue, kind=kind, other=OTHER if issue == 'overlap' else NO_OTHER)
+        + '\n' + check.format(**tables)
+        for kind in kinds for issue, check in CHECKS_SQL[kind].items()
+    ]
+    sql = (
+        'WITH ' + ','.join(ctes) + '\n' + '\nUNION ALL\n'.join(checks)
+        + '\nORDER BY 1, 2, 3, 7, 5'
+    )
+    with connections[router.db_for_read(ScheduledLearningSituation)].cursor() as cursor:
+        cursor.execute(sql, {'school': school_id, 'subject': subject_id})
+        return cursor.fetchall()
+
+
+CONSTRAINTS = {
+    # No two scheduled situations of a term overlap: the term is one
+    # ordered sequence. Stricter than the report, which compares the
+    # situations of each subject only.
+    'scheduled_situations': (ScheduledLearningSituation, ExclusionConstraint(
+        name='sls_term_period_excl',
+        expressions=[('term', RangeOperators.EQUAL), ('period', RangeOperators.OVERLAPS)],
+    )),
+    # The planning units of a subject do not overlap.
+    'planning_units': (PlanningUnit, ExclusionConstraint(
+        name='pu_subject_period_excl',
+        expressions=[('subject', RangeOperators.EQUAL), ('period', RangeOperators.OVERLAPS)],
+    )),
+}
+
+
+def constraint_violations(name, using=None):
+    """Number of overlapping pairs that keep constraint ``name`` from being added."""
+    model, constraint = CONSTRAINTS[name]
+    table = model._meta.db_table
+    column = model._meta.get_field(constraint.expressions[0][0]).column
+    using = using or router.db_for_write(model)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT count(*) FROM {table} a JOIN {table} b "
+            f"ON b.{column} = a.{column} AND b.id > a.id AND b.period && a.period"
+        )
+        return cursor.fetchone()[0]
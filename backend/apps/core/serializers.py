@@ -1,9 +1,82 @@
 # core/serializers.py
 from rest_framework import serializers
-from .models import School, Year, Subject, LearningSituation, Module, Region, SchoolType, Term, SchoolCalendar, ScheduledLearningSituation, PlanningUnit, SpecificCompetences
+from .models import School, Year, Subject, LearningSituation, Module, Region, SchoolType, Term, SchoolCalendar, NonTeachingDay, ScheduledLearningSituation, PlanningUnit, SpecificCompetences
 
 
-class SubjectSerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets and opt-in relation expansion for model serializers.
+
+    ``fields`` limits the output to the given field names and ``expand``
+    replaces primary-key relations with nested representations. Expandable
+    relations are declared on ``Meta.expandable_fields`` as
+    ``{name: (serializer_class_name, extra_kwargs)}``; dotted names such as
+    ``modules.subject`` expand nested serializers too. Many-to-many fields
+    rendered as primary keys are listed on ``Meta.prefetch_related_fields``
+    so views can prefetch them up front; ``Meta.field_relations`` maps
+    method fields to the relation they read, so selecting them with
+    ``fields`` keeps that prefetch.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+
+        expansions = self.split_expand(expand)
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name, nested_expand in expansions.items():
+            if name not in expandable:
+                continue
+            serializer_name, extra_kwargs = expandable[name]
+            serializer_class = globals()[serializer_name]
+            self.fields[name] = serializer_class(
+                read_only=True, expand=nested_expand, **extra_kwargs
+            )
+
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @staticmethod
+    def split_expand(expand):
+        """Group ``['modules', 'modules.subject']`` into ``{'modules': ['subject']}``."""
+        expansions = {}
+        for path in expand or []:
+            name, _, rest = path.partition('.')
+            nested = expansions.setdefault(name, [])
+            if rest:
+                nested.append(rest)
+        return expansions
+
+    @classmethod
+    def get_prefetch_lookups(cls, expand=None, prefix='', fields=None):
+        """
+        Return the ``prefetch_related`` lookups needed to render ``expand``,
+        limited to the relations in ``fields`` when given.
+        """
+        if fields:
+            relations = getattr(cls.Meta, 'field_relations', {})
+            fields = set(fields) | {relations[name] for name in fields if name in relations}
+        lookups = [
+            prefix + name for name in getattr(cls.Meta, 'prefetch_related_fields', ())
+            if not fields or name in fields
+        ]
+        expandable = getattr(cls.Meta, 'expandable_fields', {})
+        for name, nested_expand in cls.split_expand(expand).items():
+            if name not in expandable or (fields and name not in fields):
+                continue
+            serializer_name, extra_kwargs = expandable[name]
+            source = extra_kwargs.get('source', name)
+            lookups.append(prefix + source)
+            serializer_class = globals()[serializer_name]
+            lookups.extend(serializer_class.get_prefetch_lookups(
+                nested_expand, prefix=f'{prefix}{source}__'
+            ))
+        return lookups
+
+
+class SubjectSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Subject
         fields = (
@@ -15,9 +88,19 @@ class SubjectSerializer(serializers.ModelSerializer):
             'school',
             'teaching_staff',
             'specific_competences',
+            'weekly_sessions',
+            'learning_situation_count',
+            'module_count',
+            'planning_unit_count',
+            'file_count',
         )
         # Make school read-only so that it isn't expected from the payload.
         read_only_fields = ('school',)
+        prefetch_related_fields = ('teaching_staff', 'specific_competences')
+        expandable_fields = {
+            'region': ('RegionSerializer', {}),
+            'specific_competences': ('SpecificCompetencesSerializer', {'many': True}),
+        }
     
     def create(self, validated_data):
         request = self.context.get('request')
@@ -37,7 +120,14 @@ class YearSerializer(serializers.ModelSerializer):
         model = Year
         fields = ('id', 'name', 'division', 'subjects')
 
-class LearningSituationSerializer(serializers.ModelSerializer):
+class YearCountSerializer(serializers.ModelSerializer):
+    subject_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Year
+        fields = ('id', 'name', 'division', 'subject_count')
+
+class LearningSituationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     modules = serializers.PrimaryKeyRelatedField(
         many=True,
         queryset=Module.objects.all(),
@@ -62,6 +152,13 @@ class LearningSituationSerializer(serializers.ModelSerializer):
             'modules'
         ]
         read_only_fields = ['id']
+        prefetch_related_fields = ('teaching_staff', 'specific_competences', 'modules')
+        expandable_fields = {
+            'region': ('RegionSerializer', {}),
+            'subject': ('SubjectSerializer', {}),
+            'modules': ('ModuleSerializer', {'many': True}),
+            'specific_competences': ('SpecificCompetencesSerializer', {'many': True}),
+        }
 
     def validate(self, data):
         print("Validating data:", data)
@@ -91,14 +188,15 @@ class LearningSituationSerializer(serializers.ModelSerializer):
         try:
             representation = super().to_representation(instance)
             # Ensure modules is always a list
-            representation['modules'] = representation.get('modules', [])
+            if 'modules' in self.fields:
+                representation['modules'] = representation.get('modules', [])
             print("Final representation:", representation)
             return representation
         except Exception as e:
             print("Error in to_representation:", str(e))
             raise
 
-class ModuleSerializer(serializers.ModelSerializer):
+class ModuleSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Module
         fields = [
@@ -119,33 +217,43 @@ class ModuleSerializer(serializers.ModelSerializer):
             'content',
             'files'
         ]
+        prefetch_related_fields = ('teaching_staff',)
+        expandable_fields = {
+            'subject': ('SubjectSerializer', {}),
+        }
 
-class RegionSerializer(serializers.ModelSerializer):
+class RegionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Region
         fields = ('id', 'name', 'description')
 
-class SchoolTypeSerializer(serializers.ModelSerializer):
+class SchoolTypeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = SchoolType
         fields = ('id', 'name', 'description')
 
 
-class SchoolSerializer(serializers.ModelSerializer):
+class SchoolSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     region = RegionSerializer(read_only=True)
     school_type = SchoolTypeSerializer(read_only=True)
     years = serializers.SerializerMethodField()
 
     class Meta:
         model = School
-        fields = ('id', 'name', 'address', 'phone_number', 'region', 'school_type', 'years')
+        fields = (
+            'id', 'name', 'address', 'phone_number', 'region', 'school_type', 'years',
+            'learning_situation_count', 'module_count', 'planning_unit_count', 'file_count',
+        )
 
     def get_years(self, obj):
         years = obj.years.all()
+        # Load the school's subjects once and group them by year.
+        subjects_by_year = {}
+        for subject in obj.subjects.prefetch_related(*SubjectSerializer.get_prefetch_lookups()):
+            subjects_by_year.setdefault(subject.year_id, []).append(subject)
         result = []
         for year in years:
-            # Filter subjects that belong to the current school and are linked to this year
-            subjects = year.subjects.filter(school=obj)
+            subjects = subjects_by_year.get(year.id, [])
             result.append({
                 "id": year.id,
                 "name": year.name,
@@ -166,6 +274,11 @@ class SchoolCalendarSerializer(serializers.ModelSerializer):
         model = SchoolCalendar
         fields = ['id', 'academic_year', 'start_date', 'end_date', 'terms']
 
+class NonTeachingDaySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NonTeachingDay
+        fields = ['id', 'calendar', 'date', 'name']
+
 class ScheduledLearningSituationSerializer(serializers.ModelSerializer):
     learning_situation = LearningSituationSerializer(read_only=True)
     learning_situation_id = serializers.UUIDField(write_only=True)
@@ -174,7 +287,7 @@ class ScheduledLearningSituationSerializer(serializers.ModelSerializer):
         model = ScheduledLearningSituation
         fields = ['id', 'learning_situation', 'learning_situation_id', 'term', 'start_date', 'end_date', 'order']
 
-class PlanningUnitSerializer(serializers.ModelSerializer):
+class PlanningUnitSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = PlanningUnit
         fields = [
@@ -188,6 +301,11 @@ class PlanningUnitSerializer(serializers.ModelSerializer):
             'notes'
         ]
         read_only_fields = ['id']
+        prefetch_related_fields = ('learning_situation',)
+        expandable_fields = {
+            'subject': ('SubjectSerializer', {}),
+            'learning_situation': ('LearningSituationSerializer', {}),
+        }
     
     def validate(self, data):
         # Validate that the learning_situation belongs to the same subject
@@ -204,14 +322,14 @@ class PlanningUnitSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         # Include the learning situation details if available
-        if instance.learning_situation:
+        if 'learning_situation' in self.fields and instance.learning_situation:
             representation['learning_situation_details'] = {
                 'title': instance.learning_situation.title,
                 'description': instance.learning_situation.description
             }
         return representation
 
-class SpecificCompetencesSerializer(serializers.ModelSerializer):
+class SpecificCompetencesSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     subject_name = serializers.SerializerMethodField()
     year_name = serializers.SerializerMethodField()
     
@@ -229,6 +347,11 @@ class SpecificCompetencesSerializer(serializers.ModelSerializer):
             'evaluation_criteria'
         ]
         read_only_fields = ['id']
+        prefetch_related_fields = ('subject', 'year')
+        field_relations = {'subject_name': 'subject', 'year_name': 'year'}
+        expandable_fields = {
+            'region': ('RegionSerializer', {}),
+        }
     
     def get_subject_name(self, obj):
         return obj.subject.name if obj.subject else None
@@ -1,6 +1,24 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import School, User
+from . import counters, coverage_summary, duplicates
+from .events import publish_change
+from .models import (
+    CoverageSummary, School, User, LearningSituation, Module, PlanningUnit, ScheduledLearningSituation, Subject, Region,
+    Year, SpecificCompetences,
+)
+from .reference_cache import reference_cache
+
+# Reference catalogs whose cached responses depend on each model.
+REFERENCE_CATALOGS = {
+    Region: ('regions',),
+    Year: ('years', 'competences'),
+    Subject: ('years', 'competences'),
+    Subject.teaching_staff.through: ('years',),
+    Subject.specific_competences.through: ('years',),
+    SpecificCompetences: ('competences',),
+}
 
 
 @receiver(post_save, sender=School)
@@ -10,3 +28,149 @@ def populate_default_years(sender, instance, created, **kwargs):
         default_years = instance.school_type.default_years.all()
         if default_years:
             instance.years.set(default_years)
+
+
+@receiver(post_init, sender=LearningSituation)
+@receiver(post_init, sender=Module)
+@receiver(post_init, sender=PlanningUnit)
+def remember_loaded_state(sender, instance, **kwargs):
+    instance._counted_state = counters.state(instance)
+    values = instance.__dict__
+    if sender is Module:
+        instance._coverage_state = coverage_summary.module_state(instance)
+    elif sender is LearningSituation:
+        instance._coverage_state = values.get('subject_id')
+
+
+@receiver(post_save, sender=LearningSituation)
+@receiver(post_save, sender=Module)
+@receiver(post_save, sender=PlanningUnit)
+def count_saved_content(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new = counters.state(instance)
+    counters.apply(sender, None if created else instance._counted_state, new)
+    instance._counted_state = new
+
+
+@receiver(post_delete, sender=LearningSituation)
+@receiver(post_delete, sender=Module)
+@receiver(post_delete, sender=PlanningUnit)
+def count_deleted_content(sender, instance, **kwargs):
+    counters.apply(sender, counters.state(instance), None)
+
+
+def _parent_deleted(origin):
+    """Whether a delete cascades from a subject or school, whose summary rows go with it."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (Subject, School)
+
+
+@receiver(post_save, sender=Module)
+def rebuild_coverage_for_module(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    old, new = instance._coverage_state, coverage_summary.module_state(instance)
+    instance._coverage_state = new
+    # Deferred fields are not written by the save.
+    if all(b is coverage_summary.NOT_LOADED or a == b for a, b in zip(old, new)):
+        return
+    coverage_summary.rebuild_subjects(coverage_summary.subjects_using_module(instance.pk))
+
+
+@receiver(post_save, sender=LearningSituation)
+def rebuild_coverage_for_moved_situation(sender, instance, created, raw=False, **kwargs):
+    old_subject_id, instance._coverage_state = instance._coverage_state, instance.subject_id
+    if not created and not raw and old_subject_id != instance.subject_id:
+        coverage_summary.rebuild_subjects([old_subject_id, instance.subject_id])
+
+
+@receiver(pre_delete, sender=Module)
+def remember_coverage_subjects(sender, instance, origin=None, **kwargs):
+    if not _parent_deleted(origin):
+        instance._coverage_subjects = coverage_summary.subjects_using_module(instance.pk)
+
+
+@receiver(post_delete, sender=Module)
+@receiver(post_delete, sender=LearningSituation)
+def rebuild_coverage_after_delete(sender, instance, origin=None, **kwargs):
+    if _parent_deleted(origin):
+        return
+    if sender is Module:
+        coverage_summary.rebuild_subjects(getattr(instance, '_coverage_subjects', ()))
+    else:
+        coverage_summary.rebuild_subjects([instance.subject_id])
+
+
+@receiver(m2m_changed, sender=LearningSituation.modules.through)
+def rebuild_coverage_for_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._coverage_subjects = coverage_summary.subjects_using_module(instance.pk)
+    if action not in ('post_add', 'post_remove', 'post_clear') or (action != 'post_clear' and not pk_set):
+        return
+    if not reverse:
+        subjects = [instance.subject_id]
+    elif action == 'post_clear':
+        subjects = getattr(instance, '_coverage_subjects', ())
+    else:
+        subjects = coverage_summary.subjects_of_situations(pk_set)
+    coverage_summary.rebuild_subjects(subjects)
+
+
+@receiver(post_save, sender=Subject)
+def move_coverage_summary(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        CoverageSummary.objects.filter(subject=instance).exclude(
+            school_id=instance.school_id, year_id=instance.year_id,
+        ).update(school_id=instance.school_id, year_id=instance.year_id)
+
+
+@receiver(post_save, sender=Module)
+def update_module_signature(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not {'title', 'description', 'specific_competences'} & set(update_fields)):
+        return
+    duplicates.update_signatures([instance])
+
+
+@receiver(post_save, sender=LearningSituation)
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=LearningSituation)
+@receiver(post_delete, sender=Module)
+def publish_subject_content_change(sender, instance, **kwargs):
+    action = 'saved' if 'created' in kwargs else 'deleted'
+    publish_change(sender._meta.model_name, action, instance.pk, instance.school_id, instance.subject_id)
+
+
+@receiver(post_save, sender=PlanningUnit)
+@receiver(post_delete, sender=PlanningUnit)
+def publish_planning_unit_change(sender, instance, **kwargs):
+    action = 'saved' if 'created' in kwargs else 'deleted'
+    school_id = Subject.objects.filter(pk=instance.subject_id).values_list('school_id', flat=True).first()
+    publish_change(sender._meta.model_name, action, instance.pk, school_id, instance.subject_id)
+
+
+@receiver(post_save, sender=ScheduledLearningSituation)
+@receiver(post_delete, sender=ScheduledLearningSituation)
+def publish_schedule_change(sender, instance, **kwargs):
+    action = 'saved' if 'created' in kwargs else 'deleted'
+    situation = LearningSituation.objects.filter(pk=instance.learning_situation_id).values('school_id', 'subject_id').first()
+    if situation:
+        publish_change(sender._meta.model_name, action, instance.pk, situation['school_id'], situation['subject_id'])
+
+
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+@receiver(post_save, sender=Year)
+@receiver(post_delete, sender=Year)
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+@receiver(post_save, sender=SpecificCompetences)
+@receiver(post_delete, sender=SpecificCompetences)
+@receiver(m2m_changed, sender=Subject.teaching_staff.through)
+@receiver(m2m_changed, sender=Subject.specific_competences.through)
+def bump_reference_catalogs(sender, **kwargs):
+    if not kwargs.get('action', 'post').startswith('post'):
+        return
+    for catalog in REFERENCE_CATALOGS[sender]:
+        # Bump after commit so no other process caches pre-commit data under the new version.
+        transaction.on_commit(lambda catalog=catalog: reference_cache.bump(catalog))
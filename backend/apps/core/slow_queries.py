@@ -0,0 +1,162 @@
+# core/slow_queries.py
+"""
+Slow-query log.
+
+``SlowQueryLogger`` is installed as an execute wrapper on every database
+connection (see ``CoreConfig.ready``). Queries that take at least
+``SLOW_QUERY_THRESHOLD_MS`` are grouped by a normalized SQL fingerprint
+together with the view that ran them (``current_view``, set by
+``ViewNameMiddleware``) and the application frame that issued them, e.g.
+``apps/core/serializers.py:212 SchoolSerializer.get_years``.
+
+Every ``SLOW_QUERY_FLUSH_SECONDS`` each worker writes one JSON line per
+fingerprint to the ``apps.core.slow_queries`` logger, worst total time
+first, and starts a new window. Parameters of the slowest sample are
+included, redacted to their types unless ``SLOW_QUERY_REDACT_PARAMS`` is
+off. Fast queries only pay for two clock reads.
+"""
+import contextvars
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+current_view = contextvars.ContextVar('current_view', default=None)
+
+APP_ROOT = os.path.join(str(settings.BASE_DIR), 'apps') + os.sep
+# The execute wrappers and hooks of the instrumentation modules sit between
+# the application and the database; a query never comes from them.
+INSTRUMENTATION_FILES = {
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), f'{name}.py')
+    for name in ('metrics', 'profiling', 'slow_queries', 'tracing')
+}
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN \((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_VALUES_RE = re.compile(r'\bVALUES\s*(?:\([^)]*\)\s*,?\s*)+', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """SQL with literals and variable-length lists collapsed."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _VALUES_RE.sub('VALUES (...) ', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def call_site():
+    """The innermost application frame on the stack, outside the instrumentation."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_ROOT) and filename not in INSTRUMENTATION_FILES:
+            code = frame.f_code
+            return f'{os.path.relpath(filename, settings.BASE_DIR)}:{frame.f_lineno} {code.co_qualname}'
+        frame = frame.f_back
+    return None
+
+
+def redact(params):
+    if params is None:
+        return None
+    if getattr(settings, 'SLOW_QUERY_REDACT_PARAMS', True):
+        if isinstance(params, dict):
+            return {key: type(value).__name__ for key, value in params.items()}
+        return [type(value).__name__ for value in params]
+    return params
+
+
+class SlowQueryLogger:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._window_started = time.time()
+        self._flusher = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            if duration >= settings.SLOW_QUERY_THRESHOLD_MS:
+                self.record(sql, params, many, duration)
+
+    def record(self, sql, params, many, duration):
+        key = (fingerprint(sql), current_view.get())
+        origin = call_site()
+        sample = {'sql': sql, 'params': redact(params) if not many else None, 'origin': origin}
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if len(self._entries) >= getattr(settings, 'SLOW_QUERY_MAX_FINGERPRINTS', 500):
+                    return
+                entry = self._entries[key] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'origins': {}}
+            entry['count'] += 1
+            entry['total_ms'] += duration
+            if duration >= entry['max_ms']:
+                entry['max_ms'] = duration
+                entry['sample'] = sample
+            entry['origins'][origin] = entry['origins'].get(origin, 0) + 1
+            self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_periodically, name='slow-query-flush', daemon=True)
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        interval = getattr(settings, 'SLOW_QUERY_FLUSH_SECONDS', 60)
+        while True:
+            time.sleep(interval)
+            if not self.flush():
+                # Nothing slow in a whole window; start again with the next slow query.
+                with self._lock:
+                    if not self._entries:
+                        self._flusher = None
+                        return
+
+    def flush(self):
+        """Log and reset the current window; returns the number of fingerprints written."""
+        with self._lock:
+            entries, self._entries = self._entries, {}
+            window_started, self._window_started = self._window_started, time.time()
+        ranked = sorted(entries.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+        for rank, ((sql_fingerprint, view), entry) in enumerate(ranked, start=1):
+            logger.warning(json.dumps({
+                'event': 'slow_query',
+                'rank': rank,
+                'window_start': round(window_started),
+                'window_s': round(time.time() - window_started),
+                'fingerprint': sql_fingerprint,
+                'view': view,
+                'count': entry['count'],
+                'total_ms': round(entry['total_ms'], 1),
+                'avg_ms': round(entry['total_ms'] / entry['count'], 1),
+                'max_ms': round(entry['max_ms'], 1),
+                'origins': dict(sorted(entry['origins'].items(), key=lambda item: item[1], reverse=True)),
+                'sample': entry['sample'],
+            }, default=str))
+        return len(ranked)
+
+
+slow_query_logger = SlowQueryLogger()
+
+
+def install(connection, **kwargs):
+    """``connection_created`` receiver adding the slow-query wrapper once."""
+    if slow_query_logger not in connection.execute_wrappers:
+        # First in the list, so ``connection.execute_wrapper()`` blocks that
+        # are open while the connection is made still pop their own wrapper.
+        connection.execute_wrappers.insert(0, slow_query_logger)
@@ -0,0 +1,151 @@
+# core/teaching_hours.py
+"""
+Teaching hours of modules, subjects and teachers.
+
+A module is taught on the teaching days between its ``date_start`` and
+``date_end``: the weekdays inside a term of one of the school's
+calendars that are not a ``NonTeachingDay`` of that calendar. A day
+taught in several calendars (a school's calendars may overlap) counts
+once. Its subject meets ``weekly_sessions`` times a week, so the module
+holds ``teaching_days * weekly_sessions / 5`` sessions (an average, hence
+possibly fractional) of ``session_length`` hours. Modules without dates
+or session length count no hours.
+
+``teaching_days`` counts the days of every module at once with NumPy: it
+marks the teaching days of all calendars in one boolean array over the
+calendars' span (``numpy.is_busday`` with each calendar's non-teaching
+days as holidays), takes its running total, and gets each module's count
+as the difference of two lookups in it. ``school_workload`` loads a
+school in a few queries and adds the hours up per subject and per
+teacher with ``numpy.bincount``.
+"""
+import numpy as np
+
+from .models import Module, NonTeachingDay, SchoolCalendar, Subject, Term
+from .unit_allocation import DAYS_PER_WEEK, term_spans
+
+
+def teaching_days(starts, ends, calendars, window=(None, None)):
+    """
+    Teaching days of each date range (``starts`` and ``ends`` inclusive,
+    ``datetime64[D]`` arrays, NaT when unknown) over ``calendars``, a list
+    of ``(terms, non_teaching_days)`` with ``terms`` as ``(start_date,
+    end_date)`` pairs. ``window`` clips the ranges to ``(start, end)``.
+    """
+    valid = ~np.isnat(starts) & ~np.isnat(ends) & (starts <= ends)
+    spans = [(start, end) for terms, _ in calendars for start, end in term_spans(terms)]
+    if not spans:
+        return np.zeros(len(starts), dtype=np.int64)
+    origin = np.datetime64(min(start for start, _ in spans), 'D')
+    days = np.arange(origin, np.datetime64(max(end for _, end in spans), 'D') + np.timedelta64(1, 'D'))
+
+    teaching = np.zeros(len(days), dtype=bool)
+    for terms, non_teaching_days in calendars:
+        in_term = np.zeros(len(days), dtype=bool)
+        for start, end in term_spans(terms):
+            offset = (np.datetime64(start, 'D') - origin).astype(np.int64)
+            in_term[offset:offset + (end - start).days + 1] = True
+        holidays = np.array(sorted(non_teaching_days), dtype='datetime64[D]')
+        teaching |= in_term & np.is_busday(days, holidays=holidays)
+    # total[i] is the number of teaching days before days[i].
+    total = np.concatenate(([0], np.cumsum(teaching)))
+
+    first = np.where(valid, starts, origin)
+    stop = np.where(valid, ends + np.timedelta64(1, 'D'), origin)
+    if window[0] is not None:
+        first = np.maximum(first, np.datetime64(window[0], 'D'))
+    if window[1] is not None:
+        stop = np.minimum(stop, np.datetime64(window[1], 'D') + np.timedelta64(1, 'D'))
+    first = np.clip((first - origin).astype(np.int64), 0, len(days))
+    stop = np.clip((stop - origin).astype(np.int64), first, len(days))
+    return np.where(valid, total[stop] - total[first], 0)
+
+
+def school_calendars(school_id):
+    """``[(terms, non_teaching_days)]`` of the school's calendars, for ``teaching_days``."""
+    terms, holidays = {}, {}
+    for calendar_id, start, end in Term.objects.filter(calendar__school_id=school_id) \
+            .values_list('calendar_id', 'start_date', 'end_date'):
+        terms.setdefault(calendar_id, []).append((start, end))
+    for calendar_id, day in NonTeachingDay.objects.filter(calendar__school_id=school_id) \
+            .values_list('calendar_id', 'date'):
+        holidays.setdefault(calendar_id, []).append(day)
+    return [
+        (terms.get(calendar_id, []), holidays.get(calendar_id, []))
+        for calendar_id in SchoolCalendar.objects.filter(school_id=school_id).values_list('id', flat=True)
+    ]
+
+
+def school_workload(school_id, window=(None, None)):
+    """
+    Teaching days, sessions and hours of the school's modules added up per
+    subject and per teacher (a module taught by several teachers counts in
+    full for each), optionally within ``window``. Returns ``(subjects,
+    teachers)``, lists of dicts sorted by name.
+    """
+    rows = list(
+        Module.objects.filter(school_id=school_id)
+        .values_list('id', 'subject_id', 'date_start', 'date_end', 'session_length', 'subject__weekly_sessions')
+    )
+    staff = list(
+        Module.teaching_staff.through.objects.filter(module__school_id=school_id)
+        .values_list('module_id', 'user_id', 'user__username', 'user__first_name', 'user__last_name')
+    )
+    subjects = list(Subject.objects.filter(school_id=school_id).values('id', 'name', 'year_id', 'year__name'))
+
+    module_index = {row[0]: position for position, row in enumerate(rows)}
+    subject_index = {subject['id']: position for position, subject in enumerate(subjects)}
+    days = teaching_days(
+        np.array([row[2] for row in rows], dtype='datetime64[D]'),
+        np.array([row[3] for row in rows], dtype='datetime64[D]'),
+        school_calendars(school_id),
+        window,
+    )
+    sessions = days * np.array([row[5] for row in rows], dtype=np.float64) / DAYS_PER_WEEK
+    hours = sessions * np.array([row[4] or 0 for row in rows], dtype=np.float64)
+    scheduled = (days > 0).astype(np.float64)
+
+    def totals(index, positions, size):
+        return {
+            'modules': np.bincount(index, minlength=size),
+            'scheduled_modules': np.bincount(index, weights=scheduled[positions], minlength=size),
+            'teaching_days': np.bincount(index, weights=days[positions], minlength=size),
+            'sessions': np.bincount(index, weights=sessions[positions], minlength=size),
+            'hours': np.bincount(index, weights=hours[positions], minlength=size),
+        }
+
+    def report(items, sums):
+        for position, item in enumerate(items):
+            item.update({
+                'modules': int(sums['modules'][position]),
+                'scheduled_modules': int(sums['scheduled_modules'][position]),
+                'teaching_days': int(sums['teaching_days'][position]),
+                'sessions': round(float(sums['sessions'][position]), 2),
+                'hours': round(float(sums['hours'][position]), 2),
+            })
+        return items
+
+    positions = np.arange(len(rows))
+    subject_sums = totals(
+        np.array([subject_index[row[1]] for row in rows], dtype=np.int64), positions, len(subjects),
+    )
+    subject_rows = report([
+        {'id': subject['id'], 'name': subject['name'], 'year': subject['year_id'], 'year_name': subject['year__name']}
+        for subject in subjects
+    ], subject_sums)
+
+    teachers, teacher_index = [], {}
+    for _, user_id, username, first_name, last_name in staff:
+        if user_id not in teacher_index:
+            teacher_index[user_id] = len(teachers)
+            teachers.append({'id': user_id, 'name': f'{first_name} {last_name}'.strip() or username})
+    teacher_sums = totals(
+        np.array([teacher_index[user_id] for _, user_id, *_ in staff], dtype=np.int64),
+        np.array([module_index[module_id] for module_id, *_ in staff], dtype=np.int64),
+        len(teachers),
+    )
+    teacher_rows = report(teachers, teacher_sums)
+
+    subject_rows.sort(key=lambda row: (row['year_name'] or '', row['name']))
+    teacher_rows.sort(key=lambda row: row['name'])
+    return subject_rows, teacher_rows
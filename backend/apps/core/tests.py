@@ -1,3 +1,1915 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date
 
-# Create your tests here.
+import numpy as np
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.backends.utils import CursorWrapper
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from prometheus_client import REGISTRY
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from apps.accounts.models import User
+from . import duplicates, events, metrics, profiling, slow_queries, tracing
+from .middleware import StaticFilesMiddleware
+from .async_utils import authenticate_request, fan_out
+from .coverage import count_coverage
+from .dbpool import pool_stats
+from .events import InProcessBroker, PostgresBroker, channels_for, get_broker
+from .models import (
+    CoverageSummary, LearningSituation, Module, ModuleSignature, PlanningUnit, Region, ScheduledLearningSituation,
+    School, SchoolCalendar, SchoolType, SpecificCompetences, Subject, Term, Year,
+)
+from .recommendations import recommend
+from .schedule_conflicts import conflicts
+from .serializers import LearningSituationSerializer, PlanningUnitSerializer, SubjectSerializer
+from .views import change_event_stream
+from .teaching_hours import school_workload, teaching_days
+from .unit_allocation import allocate, allocate_school, teaching_blocks
+from .reference_cache import reference_cache, school_catalog
+
+
+@tag('query_plans')
+class QueryPlanTests(TestCase):
+    """
+    Run the hot list endpoints against a ``seed_synthetic`` dataset and EXPLAIN
+    every SELECT they issue. A sequential scan over a table holding more
+    than ``SEQ_SCAN_ROW_THRESHOLD`` rows is planned again with
+    ``enable_seqscan`` off; if Postgres still has to scan the table there is
+    no index that serves the query and the test fails. That keeps the check
+    independent of the planner's cost choices at test-sized volumes while a
+    new filter without a supporting index still shows up here instead of in
+    production.
+    """
+    SEQ_SCAN_ROW_THRESHOLD = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'seed_synthetic', seed=1, schools=20, years=4, teachers=2, subjects_per_year=5,
+            competences_per_subject=5, modules_per_subject=10, situations_per_subject=5,
+            units_per_subject=10, workers=1, stdout=io.StringIO(),
+        )
+        cls.school = School.objects.get(name='Synthetic School 1-0')
+        cls.subject = cls.school.subjects.select_related('year').first()
+        cls.year = cls.subject.year
+        cls.user = User.objects.create_user('planner', password='planner', school=cls.school, role='teacher')
+        cls.user.user_permissions.set(Permission.objects.all())
+        cls.school.teaching_staff.add(cls.user)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        reference_cache.clear_local()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def explain(self, sql, seqscan=True):
+        with connection.cursor() as cursor:
+            if not seqscan:
+                cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+            finally:
+                if not seqscan:
+                    cursor.execute('RESET enable_seqscan')
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        return plan[0]['Plan']
+
+    def table_rows(self, relation):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [relation])
+            row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def large_seq_scans(self, node):
+        if node.get('Node Type') == 'Seq Scan' and self.table_rows(node['Relation Name']) > self.SEQ_SCAN_ROW_THRESHOLD:
+            yield node['Relation Name']
+        for child in node.get('Plans', []):
+            yield from self.large_seq_scans(child)
+
+    def assertIndexedPlans(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+        selects = [query['sql'] for query in ctx.captured_queries if query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertTrue(selects, url)
+        for sql in selects:
+            if not any(self.large_seq_scans(self.explain(sql))):
+                continue
+            unindexed = sorted(set(self.large_seq_scans(self.explain(sql, seqscan=False))))
+            if unindexed:
+                self.fail(f'{url}: sequential scan on {", ".join(unindexed)} with no usable index\n{sql}')
+
+    def test_learning_situation_list(self):
+        self.assertIndexedPlans('/api/core/learning-situations/')
+        self.assertIndexedPlans(f'/api/core/learning-situations/?subject={self.subject.id}')
+        self.assertIndexedPlans(f'/api/core/learning-situations/?year={self.year.id}&expand=modules')
+
+    def test_module_list(self):
+        self.assertIndexedPlans('/api/core/modules/')
+        self.assertIndexedPlans(f'/api/core/modules/?subject={self.subject.id}')
+        self.assertIndexedPlans(f'/api/core/modules/?year={self.year.id}')
+
+    def test_specific_competences_list(self):
+        self.assertIndexedPlans(f'/api/core/specific-competences/?subject={self.subject.id}')
+        self.assertIndexedPlans(f'/api/core/specific-competences/?subject={self.subject.id}&year={self.year.id}')
+
+    def test_planning_unit_list(self):
+        self.assertIndexedPlans(f'/api/core/planning-units/?subject={self.subject.id}')
+
+    def test_scheduled_situation_list(self):
+        self.assertIndexedPlans('/api/core/scheduled-situations/')
+
+
+class ProfilingTests(TestCase):
+    """``?__profile=1`` profiles staff requests and stores the report."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        school = School.objects.create(name='School', region=region, school_type=SchoolType.objects.create(name='Type'))
+        year = Year.objects.create(name='1')
+        subject = Subject.objects.create(name='Math', description='', year=year, region=region, school=school)
+        LearningSituation.objects.create(school=school, subject=subject, year=year, region=region, title='Situation')
+        cls.staff = User.objects.create_user('staff', password='x', school=school, is_staff=True)
+        cls.teacher = User.objects.create_user('teacher', password='x', school=school, role='teacher')
+        for user in (cls.staff, cls.teacher):
+            user.user_permissions.set(Permission.objects.all())
+
+    def get(self, user, url):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=user)[0].key}')
+        return client.get(url)
+
+    def test_non_staff_ignored(self):
+        response = self.get(self.teacher, '/api/core/learning-situations/?__profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.get(self.teacher, '/api/core/learning-situations/?__profile=inline').json()[0]['title'],
+                         'Situation')
+
+    def test_report_stored(self):
+        response = self.get(self.staff, '/api/core/learning-situations/?__profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['title'], 'Situation')
+        report = self.get(self.staff, f'/api/core/profiles/{response["X-Profile-Id"]}/').json()
+        self.assertEqual((report['method'], report['status_code']), ('GET', 200))
+        self.assertGreater(report['sql']['count'], 0)
+        self.assertTrue(any('FROM "core_learningsituation"' in query['sql'] for query in report['sql']['queries']))
+        self.assertIn('LearningSituationSerializer.title', [field['field'] for field in report['serializer_fields']])
+        self.assertTrue(report['functions'])
+        self.assertEqual(self.get(self.teacher, f'/api/core/profiles/{response["X-Profile-Id"]}/').status_code, 403)
+        self.assertEqual(self.get(self.staff, f'/api/core/profiles/{uuid.uuid4()}/').status_code, 404)
+
+    def test_hooks_restored_after_overlapping_profiles(self):
+        def current():
+            return CursorWrapper.execute, CursorWrapper.executemany, serializers.Serializer.to_representation
+
+        originals = current()
+        request = RequestFactory().get('/')
+        started, release = threading.Event(), threading.Event()
+
+        def hooked():
+            return (CursorWrapper.execute, serializers.Serializer.to_representation) == (
+                profiling._profiled_execute, profiling._profiled_to_representation,
+            )
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return hooked()
+
+        thread_result = []
+        thread = threading.Thread(target=lambda: thread_result.append(profiling.RequestProfile(request).run(slow)))
+        thread.start()
+        started.wait(5)
+        self.assertTrue(profiling.RequestProfile(request).run(hooked))
+        # The other profile is still running, so its hooks stay.
+        self.assertTrue(hooked())
+        release.set()
+        thread.join(5)
+        self.assertEqual(thread_result, [True])
+        self.assertEqual(current(), originals)
+
+    def test_to_representation_matches_drf(self):
+        situation = LearningSituation.objects.get()
+        unit = PlanningUnit.objects.create(subject=situation.subject, unit_number=1, learning_situation=situation)
+
+        class Plain(serializers.Serializer):
+            name = serializers.CharField()
+            missing = serializers.CharField(required=False)
+            empty = serializers.IntegerField(allow_null=True)
+            items = serializers.ListField(child=serializers.IntegerField())
+
+        cases = [
+            (Plain(), {'name': 'a', 'empty': None, 'items': [1, 2]}),
+            (SubjectSerializer(), situation.subject),
+            (LearningSituationSerializer(expand=['modules']), situation),
+            (PlanningUnitSerializer(), unit),
+            (PlanningUnitSerializer(), PlanningUnit(subject=situation.subject, unit_number=2)),
+        ]
+        profile = profiling.RequestProfile(RequestFactory().get('/'))
+        for serializer, instance in cases:
+            expected = serializers.Serializer.to_representation(serializer, instance)
+            token = profiling.current_profile.set(profile)
+            try:
+                actual = profiling._profiled_to_representation(serializer, instance)
+            finally:
+                profiling.current_profile.reset(token)
+            self.assertEqual(actual, expected)
+            self.assertEqual(list(actual), list(expected))
+        self.assertIn('Plain.name', profile.fields)
+
+
+class MetricsTests(TestCase):
+    """``/metrics`` is only served to the scraper token and staff, and the counters move per view."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        school = School.objects.create(name='School', region=region, school_type=SchoolType.objects.create(name='Type'))
+        cls.user = User.objects.create_user('teacher', password='x', school=school, role='teacher')
+        cls.user.user_permissions.set(Permission.objects.all())
+        cls.admin = User.objects.create_user('admin', password='x', school=school, is_staff=True)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_access(self):
+        client = APIClient()
+        self.assertEqual(client.get('/metrics').status_code, 401)
+        self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        user_token = Token.objects.create(user=self.user).key
+        self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION=f'Token {user_token}').status_code, 403)
+
+        response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'sofia_http_requests_total', response.content)
+        admin_token = Token.objects.create(user=self.admin).key
+        self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION=f'Token {admin_token}').status_code, 200)
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 401)
+
+    def test_counters_per_view(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        view = 'region-list-create'
+        requests = self.sample('sofia_http_requests_total', view=view, method='GET', status='200')
+        queries = self.sample('sofia_db_queries_total', view=view, alias='default')
+        hits = self.sample('sofia_cache_requests_total', cache='reference', layer='local', result='hit')
+        reference_cache.bump('regions')
+        for _ in range(2):
+            self.assertEqual(client.get('/api/core/regions/').status_code, 200)
+        self.assertEqual(self.sample('sofia_http_requests_total', view=view, method='GET', status='200'), requests + 2)
+        self.assertGreater(self.sample('sofia_db_queries_total', view=view, alias='default'), queries)
+        self.assertEqual(self.sample('sofia_cache_requests_total', cache='reference', layer='local', result='hit'), hits + 1)
+        self.assertGreater(self.sample('sofia_http_request_duration_seconds_count', view=view, method='GET'), 0)
+
+    def test_unresolved(self):
+        requests = self.sample('sofia_http_requests_total', view=metrics.UNRESOLVED, method='GET', status='404')
+        queries = self.sample('sofia_db_queries_total', view=metrics.UNRESOLVED, alias='default')
+        self.assertEqual(APIClient().get('/no-such-page/').status_code, 404)
+        Region.objects.count()
+        self.assertEqual(self.sample('sofia_http_requests_total', view=metrics.UNRESOLVED, method='GET', status='404'),
+                         requests + 1)
+        self.assertEqual(self.sample('sofia_db_queries_total', view=metrics.UNRESOLVED, alias='default'), queries + 1)
+
+
+class DatabasePoolStatsTests(TestCase):
+    """``/api/core/db-pool-stats/`` is admin only and reports the pools of this process."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        school = School.objects.create(name='School', region=region, school_type=SchoolType.objects.create(name='Type'))
+        cls.user = User.objects.create_user('teacher', password='x', school=school, role='teacher')
+        cls.admin = User.objects.create_user('admin', password='x', school=school, is_staff=True)
+
+    def get(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get('/api/core/db-pool-stats/')
+
+    def test_admin_only(self):
+        self.assertEqual(APIClient().get('/api/core/db-pool-stats/').status_code, 401)
+        self.assertEqual(self.get(self.user).status_code, 403)
+
+    def test_with_pool(self):
+        if connection.pool is None:
+            self.skipTest('the default database has no pool')
+        response = self.get(self.admin)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {alias for alias in connections if connections[alias].pool is not None})
+        counters = response.data['default']
+        for key in ('pool_min', 'pool_max', 'pool_size', 'pool_available', 'requests_num', 'avg_wait_ms', 'avg_usage_ms'):
+            self.assertIn(key, counters)
+        self.assertEqual(counters['pool_max'], connection.pool.max_size)
+        self.assertGreaterEqual(counters['avg_wait_ms'], 0)
+
+    def test_without_pool(self):
+        options = connection.settings_dict['OPTIONS']
+        if 'pool' in options:
+            self.addCleanup(options.__setitem__, 'pool', options.pop('pool'))
+        self.assertIsNone(connection.pool)
+        self.assertNotIn('default', pool_stats())
+        response = self.get(self.admin)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('default', response.data)
+
+
+class SlowQueryLogTests(TestCase):
+    """Slow queries are grouped by fingerprint and view and attributed to application code."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        school = School.objects.create(name='School', region=region, school_type=SchoolType.objects.create(name='Type'))
+        year = Year.objects.create(name='1')
+        subject = Subject.objects.create(name='Math', description='', year=year, region=region, school=school)
+        LearningSituation.objects.create(school=school, subject=subject, year=year, region=region, title='Situation')
+        cls.user = User.objects.create_user('teacher', password='x', school=school, role='teacher')
+        cls.user.user_permissions.set(Permission.objects.all())
+
+    def flushed(self, logger):
+        with self.assertLogs('apps.core.slow_queries', 'WARNING') as logs:
+            logger.flush()
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            slow_queries.fingerprint("SELECT * FROM t WHERE a = 'it''s'\n  AND b = 4.5 AND c IN (%s, %s, %s) LIMIT 21"),
+            'SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...) LIMIT ?',
+        )
+        self.assertEqual(
+            slow_queries.fingerprint('SELECT * FROM t WHERE c IN (%s)'),
+            slow_queries.fingerprint('SELECT * FROM t WHERE c IN (%s, %s)'),
+        )
+        self.assertEqual(
+            slow_queries.fingerprint('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s) RETURNING "t"."id"'),
+            'INSERT INTO t (a, b) VALUES (...) RETURNING "t"."id"',
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=20, SLOW_QUERY_REDACT_PARAMS=True)
+    def test_threshold(self):
+        logger = slow_queries.SlowQueryLogger()
+        with connection.execute_wrapper(logger), connection.cursor() as cursor:
+            for _ in range(2):
+                cursor.execute('SELECT pg_sleep(%s)', [0.03])
+            cursor.execute('SELECT 1')
+        [entry] = self.flushed(logger)
+        self.assertEqual((entry['fingerprint'], entry['count']), ('SELECT pg_sleep(?)', 2))
+        self.assertEqual(entry['sample']['params'], ['float'])
+        self.assertGreaterEqual(entry['max_ms'], 20)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_call_site_and_view(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.assertLogs('apps.core.slow_queries', 'WARNING') as logs:
+            self.assertEqual(client.get('/api/core/learning-situations/').status_code, 200)
+            slow_queries.slow_query_logger.flush()
+        [entry] = [
+            entry for entry in map(json.loads, (record.getMessage() for record in logs.records))
+            if entry['fingerprint'].startswith('SELECT "core_learningsituation"."id"')
+        ]
+        self.assertEqual(entry['view'], 'learning-situation-list-create')
+        [origin] = entry['origins']
+        self.assertTrue(origin.startswith('apps/core/'), origin)
+        self.assertNotRegex(origin, r'/(metrics|profiling|slow_queries|tracing)\.py:')
+
+    def test_install_once_per_connection(self):
+        reused = connections.create_connection('default')
+        try:
+            for _ in range(2):
+                # A pooled connection is handed out again: connection_created fires again.
+                reused.ensure_connection()
+                reused.close()
+            slow_queries.install(reused)
+            self.assertEqual(reused.execute_wrappers.count(slow_queries.slow_query_logger), 1)
+            self.assertEqual(reused.execute_wrappers.count(tracing.trace_query), 1)
+        finally:
+            reused.close()
+
+
+class RecordingExporter(tracing.Exporter):
+    """Keeps finished traces instead of writing them."""
+
+    def __init__(self):
+        super().__init__()
+        self.traces = []
+
+    def export(self, trace):
+        self.traces.append(trace)
+
+
+@override_settings(TRACING_SAMPLE_RATE=1.0, TRACING_TRUST_TRACEPARENT=False)
+class TracingTests(TestCase):
+    """Sampled requests export one trace of nested spans; others go through untouched."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        school = School.objects.create(name='School', region=region, school_type=SchoolType.objects.create(name='Type'))
+        year = Year.objects.create(name='1')
+        subject = Subject.objects.create(name='Math', description='', year=year, region=region, school=school)
+        for number in range(2):
+            LearningSituation.objects.create(
+                school=school, subject=subject, year=year, region=region, title=f'Situation {number}',
+            )
+        cls.user = User.objects.create_user('teacher', password='x', school=school, role='teacher')
+        cls.user.user_permissions.set(Permission.objects.all())
+
+    def setUp(self):
+        previous, tracing.exporter = tracing.exporter, RecordingExporter()
+        self.addCleanup(setattr, tracing, 'exporter', previous)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, **headers):
+        return self.client.get('/api/core/learning-situations/?fields=id,title', headers=headers)
+
+    def spans(self):
+        self.assertEqual(len(tracing.exporter.traces), 1)
+        return tracing.exporter.traces[0].spans
+
+    def test_nesting(self):
+        response = self.get()
+        spans = self.spans()
+        by_id = {item.span_id: item for item in spans}
+        root = spans[0]
+        self.assertEqual(root.name, 'GET api/core/learning-situations/')
+        self.assertEqual(root.kind, tracing.SERVER)
+        self.assertEqual(response['X-Trace-Id'], root.trace.trace_id)
+        self.assertEqual(response['traceparent'], root.traceparent())
+
+        def parent(name):
+            return {by_id[item.parent_id].name for item in spans if item.name == name}
+
+        self.assertEqual(parent('view LearningSituationListCreateAPIView'), {root.name})
+        self.assertEqual(parent('authentication'), {'view LearningSituationListCreateAPIView'})
+        self.assertEqual(parent('LearningSituationSerializer[].to_representation'), {'view LearningSituationListCreateAPIView'})
+        self.assertEqual(parent('LearningSituationSerializer.to_representation'), {'LearningSituationSerializer[].to_representation'})
+        self.assertEqual(len([item for item in spans if item.name == 'LearningSituationSerializer.to_representation']), 2)
+        # The list query runs when the serializer iterates the queryset.
+        self.assertEqual(parent('db.query'), {'LearningSituationSerializer[].to_representation'})
+        self.assertEqual(parent('middleware'), {root.name})
+        self.assertTrue(all(item.end_ns for item in spans))
+
+    @override_settings(AGGREGATE_QUERY_FAN_OUT=True)
+    def test_fan_out_threads(self):
+        root = tracing.Span(tracing.Trace('0' * 32), 'root')
+        root.trace.add(root)
+
+        def work():
+            with tracing.span('work') as child:
+                return child.parent_id, threading.get_ident()
+
+        token = tracing.current_span.set(root)
+        try:
+            results = async_to_sync(fan_out)(work, work)
+        finally:
+            tracing.current_span.reset(token)
+        self.assertEqual([parent_id for parent_id, _ in results], [root.span_id] * 2)
+        self.assertNotIn(threading.get_ident(), {thread for _, thread in results})
+        self.assertEqual([item.name for item in root.trace.spans], ['root', 'work', 'work'])
+
+    def test_traceparent_continued(self):
+        trace_id, parent_id = 'a' * 32, 'b' * 16
+        self.get(traceparent=f'00-{trace_id}-{parent_id}-01')
+        root = self.spans()[0]
+        self.assertEqual((root.trace.trace_id, root.parent_id), (trace_id, parent_id))
+
+    @override_settings(TRACING_SAMPLE_RATE=0.0)
+    def test_untrusted_sampling_flag_ignored(self):
+        response = self.get(traceparent=f'00-{"a" * 32}-{"b" * 16}-01')
+        self.assertNotIn('traceparent', response)
+        self.assertEqual(tracing.exporter.traces, [])
+        with self.settings(TRACING_TRUST_TRACEPARENT=True):
+            response = self.get(traceparent=f'00-{"a" * 32}-{"b" * 16}-01')
+        self.assertEqual(response['X-Trace-Id'], 'a' * 32)
+        self.assertEqual(len(tracing.exporter.traces), 1)
+
+    @override_settings(TRACING_MAX_SPANS=5)
+    def test_max_spans(self):
+        self.get()
+        spans = self.spans()
+        self.assertEqual(len(spans), 5)
+        self.assertGreater(spans[0].attributes['tracing.dropped_spans'], 0)
+        self.assertEqual(spans[0].attributes['tracing.dropped_spans'], tracing.exporter.traces[0].dropped)
+
+    @override_settings(TRACING_SAMPLE_RATE=0.0)
+    def test_unsampled(self):
+        self.assertTrue(getattr(APIView.dispatch, '__traced__', False))
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Trace-Id', response)
+        self.assertEqual(tracing.exporter.traces, [])
+        with tracing.span('outside') as child:
+            self.assertIsNone(child)
+
+    def test_file_rotation(self):
+        root = tracing.Span(tracing.Trace('c' * 32), 'root')
+        root.trace.add(root)
+        root.end()
+        line = json.dumps(tracing.otlp_request([root.trace]), separators=(',', ':')) + '\n'
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'traces.jsonl')
+            with self.settings(TRACING_EXPORTER='file', TRACING_FILE=path, TRACING_FILE_MAX_BYTES=len(line) * 2):
+                exporter = tracing.Exporter()
+                for _ in range(3):
+                    exporter.write([root.trace])
+            with open(path) as current, open(f'{path}.1') as rotated:
+                current_lines, rotated_lines = current.readlines(), rotated.readlines()
+        self.assertEqual((len(current_lines), len(rotated_lines)), (1, 2))
+        spans = json.loads(current_lines[0])['resourceSpans'][0]['scopeSpans'][0]['spans']
+        self.assertEqual([item['traceId'] for item in spans], ['c' * 32])
+
+
+class AsyncMiddlewareTests(TestCase):
+    """Under ASGI the whole middleware stack runs async, with the same behaviour as under WSGI."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        school = School.objects.create(name='School', region=region, school_type=SchoolType.objects.create(name='Type'))
+        cls.admin = User.objects.create_user('admin', password='x', school=school, is_staff=True)
+        cls.token = Token.objects.create(user=cls.admin).key
+
+    def test_no_adapters(self):
+        # With DEBUG on, Django logs every sync/async switch it puts between middleware.
+        with self.settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            handler = ASGIHandler()
+        self.assertTrue(iscoroutinefunction(handler._middleware_chain))
+
+    @override_settings(TRACING_SAMPLE_RATE=1.0)
+    async def test_request(self):
+        previous, tracing.exporter = tracing.exporter, RecordingExporter()
+        self.addCleanup(setattr, tracing, 'exporter', previous)
+        view = 'region-list-create'
+        requests = REGISTRY.get_sample_value(
+            'sofia_http_requests_total', {'view': view, 'method': 'GET', 'status': '200'},
+        ) or 0
+        response = await AsyncClient().get('/api/core/regions/', headers={'Authorization': f'Token {self.token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(REGISTRY.get_sample_value(
+            'sofia_http_requests_total', {'view': view, 'method': 'GET', 'status': '200'},
+        ), requests + 1)
+        [trace] = tracing.exporter.traces
+        self.assertEqual(response['X-Trace-Id'], trace.trace_id)
+        self.assertIn('GET api/core/regions/', {span.name for span in trace.spans})
+        self.assertIsNone(slow_queries.current_view.get())
+
+    async def test_profile(self):
+        response = await AsyncClient().get(
+            '/api/core/regions/?__profile=inline', headers={'Authorization': f'Token {self.token}'},
+        )
+        report = response.json()
+        self.assertEqual(report['status_code'], 200)
+        self.assertTrue(any('core_region' in query['sql'] for query in report['sql']['queries']))
+        # The view ran on the profiled thread.
+        self.assertTrue(any('(list)' in function['function'] for function in report['functions']))
+
+    async def test_static_files(self):
+        async def get_response(request):
+            return HttpResponse('view')
+
+        middleware = StaticFilesMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(root, 'app.js'), 'w') as file:
+                file.write('static')
+            middleware.autorefresh = False
+            middleware.add_files(root, prefix='/static/')
+            response = await middleware(RequestFactory().get('/static/app.js'))
+            self.assertEqual(b''.join(response.streaming_content), b'static')
+        response = await middleware(RequestFactory().get('/api/core/regions/'))
+        self.assertEqual(response.content, b'view')
+
+
+class ContentCounterTests(TestCase):
+    """The counters on ``Subject`` and ``School`` follow content writes, and ``reconcile_counters`` repairs drift."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.region = Region.objects.create(name='Region')
+        cls.year = Year.objects.create(name='1')
+        cls.school = School.objects.create(name='School', region=cls.region, school_type=SchoolType.objects.create(name='Type'))
+        cls.math = Subject.objects.create(name='Math', description='', year=cls.year, region=cls.region, school=cls.school)
+        cls.art = Subject.objects.create(name='Art', description='', year=cls.year, region=cls.region, school=cls.school)
+
+    def module(self, subject, **fields):
+        return Module.objects.create(year=self.year, school=self.school, subject=subject, title='Module', **fields)
+
+    def assertCounts(self, instance, **counts):
+        instance.refresh_from_db()
+        self.assertEqual({field: getattr(instance, field) for field in counts}, counts)
+
+    def test_increment(self):
+        module = self.module(self.math, files=[{'name': 'a.pdf'}, {'name': 'b.pdf'}])
+        situation = LearningSituation.objects.create(
+            school=self.school, subject=self.math, year=self.year, region=self.region, title='Situation',
+        )
+        PlanningUnit.objects.create(subject=self.math, unit_number=1, learning_situation=situation)
+
+        counts = {'learning_situation_count': 1, 'module_count': 1, 'planning_unit_count': 1, 'file_count': 2}
+        self.assertCounts(self.math, **counts)
+        self.assertCounts(self.school, **counts)
+        self.assertCounts(self.art, module_count=0, file_count=0)
+
+        module.files = [{'name': 'a.pdf'}]
+        module.save()
+        self.assertCounts(self.math, file_count=1)
+        self.assertCounts(self.school, file_count=1)
+
+    def test_decrement(self):
+        keep, drop = self.module(self.math), self.module(self.math, files=[{'name': 'a.pdf'}])
+        drop.delete()
+        self.assertCounts(self.math, module_count=1, file_count=0)
+        self.assertCounts(self.school, module_count=1, file_count=0)
+        keep.delete()
+        self.assertCounts(self.math, module_count=0)
+
+    def test_move_between_subjects(self):
+        module = self.module(self.math, files=[{'name': 'a.pdf'}])
+        module.subject = self.art
+        module.save()
+        self.assertCounts(self.math, module_count=0, file_count=0)
+        self.assertCounts(self.art, module_count=1, file_count=1)
+        self.assertCounts(self.school, module_count=1, file_count=1)
+
+    def test_save_keeps_concurrent_counts(self):
+        stale = Subject.objects.get(pk=self.math.pk)
+        self.module(self.math)
+        stale.name = 'Mathematics'
+        stale.save()
+        stale.save(update_fields=['name', 'module_count'])
+        self.assertCounts(self.math, name='Mathematics', module_count=1)
+
+    def test_reconcile_counters(self):
+        self.module(self.math, files=[{'name': 'a.pdf'}])
+        Subject.objects.filter(pk=self.math.pk).update(module_count=5, file_count=0)
+        School.objects.filter(pk=self.school.pk).update(module_count=0)
+
+        out = io.StringIO()
+        call_command('reconcile_counters', dry_run=True, stdout=out)
+        self.assertIn('Found stale counters on 1 subjects and 1 schools', out.getvalue())
+        self.assertCounts(self.math, module_count=5)
+
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.assertCounts(self.math, module_count=1, file_count=1)
+        self.assertCounts(self.art, module_count=0)
+        self.assertCounts(self.school, module_count=1, file_count=1)
+
+
+class ReferenceCacheScopeTests(TestCase):
+    """Cached reference lists are never served to a user who may see something else."""
+
+    @classmethod
+    def setUpTestData(cls):
+        school_type = SchoolType.objects.create(name='Type')
+        cls.year = Year.objects.create(name='1')
+        cls.teachers = []
+        for name in ('North', 'South'):
+            region = Region.objects.create(name=name)
+            school = School.objects.create(name=name, region=region, school_type=school_type)
+            subject = Subject.objects.create(name=name, description='', year=cls.year, region=region, school=school)
+            SpecificCompetences.objects.create(region=region, subject=subject, year=cls.year, code=name, description='')
+            teacher = User.objects.create_user(name.lower(), password='x', school=school, role='teacher')
+            cls.teachers.append(teacher)
+        cls.admin = User.objects.create_superuser('admin', password='x', school=cls.teachers[0].school)
+
+    def setUp(self):
+        for catalog in ('years', 'competences'):
+            reference_cache.bump(catalog)
+        reference_cache.clear_local()
+
+    def get(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        return data['results'] if isinstance(data, dict) else data
+
+    def competence_codes(self, user):
+        return sorted(competence['code'] for competence in self.get(user, '/api/core/specific-competences/'))
+
+    def subject_names(self, user):
+        return sorted(subject['name'] for year in self.get(user, '/api/core/years/') for subject in year['subjects'])
+
+    def test_competences(self):
+        north, south = self.teachers
+        self.assertEqual(self.competence_codes(self.admin), ['North', 'South'])
+        self.assertEqual(self.competence_codes(north), ['North'])
+        self.assertEqual(self.competence_codes(south), ['South'])
+        self.assertEqual(self.competence_codes(self.admin), ['North', 'South'])
+
+    def test_years(self):
+        north, south = self.teachers
+        self.assertEqual(self.subject_names(north), ['North'])
+        self.assertEqual(self.subject_names(south), ['South'])
+        self.assertEqual(self.subject_names(self.admin), ['North'])
+
+    def test_years_versioned_per_school(self):
+        north, south = self.teachers
+        subject = Subject.objects.get(school=north.school)
+        catalogs = [school_catalog('years', teacher.school_id) for teacher in self.teachers]
+        self.subject_names(north)
+        self.subject_names(south)
+        versions = [reference_cache.version(catalog) for catalog in catalogs]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Module.objects.create(year=self.year, school=north.school, subject=subject, title='Module')
+            PlanningUnit.objects.create(subject=subject, unit_number=1)
+        north_version, south_version = [reference_cache.version(catalog) for catalog in catalogs]
+        self.assertNotEqual(north_version, versions[0])
+        self.assertEqual(south_version, versions[1])
+        tree = self.get(north, '/api/core/years/')
+        counts = [(item['module_count'], item['planning_unit_count']) for year in tree for item in year['subjects']]
+        self.assertEqual(counts, [(1, 1)])
+        with self.assertNumQueries(0):
+            self.subject_names(south)
+
+        # Year changes still reach every school.
+        with self.captureOnCommitCallbacks(execute=True):
+            Year.objects.create(name='2')
+        self.assertEqual(len(self.get(south, '/api/core/years/')), 2)
+
+
+class SchoolWriteScopeTests(TestCase):
+    """Writes cannot point at another school's rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        school_type = SchoolType.objects.create(name='Type')
+        cls.year = Year.objects.create(name='1')
+        cls.schools, cls.subjects, cls.situations, cls.terms = [], [], [], []
+        for name in ('Own', 'Other'):
+            school = School.objects.create(name=name, region=region, school_type=school_type)
+            subject = Subject.objects.create(name=name, description='', year=cls.year, region=region, school=school)
+            cls.schools.append(school)
+            cls.subjects.append(subject)
+            cls.situations.append(LearningSituation.objects.create(
+                school=school, subject=subject, year=cls.year, region=region, title=name,
+            ))
+            calendar = SchoolCalendar.objects.create(
+                school=school, academic_year='2026-2027', start_date='2026-09-01', end_date='2027-06-30',
+            )
+            cls.terms.append(Term.objects.create(
+                calendar=calendar, name='First', start_date='2026-09-01', end_date='2026-12-20',
+            ))
+        cls.other_module = Module.objects.create(
+            year=cls.year, school=cls.schools[1], subject=cls.subjects[1], title='Other',
+        )
+        cls.user = User.objects.create_user('teacher', password='x', school=cls.schools[0], role='teacher')
+        cls.user.user_permissions.set(Permission.objects.all())
+        cls.schools[0].teaching_staff.add(cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def module_payload(self, school, subject):
+        return {'year': self.year.pk, 'school': school.pk, 'subject': subject.pk, 'title': 'New', 'session_length': 1}
+
+    def test_module_create(self):
+        own, other = self.schools
+        for url in ('/api/core/modules/', '/api/core/modules/create/'):
+            response = self.client.post(url, self.module_payload(own, self.subjects[1]), format='json')
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn('subject', response.data)
+            response = self.client.post(url, self.module_payload(other, self.subjects[0]), format='json')
+            self.assertIn('school', response.data)
+            response = self.client.post(url, self.module_payload(own, self.subjects[0]), format='json')
+            self.assertEqual(response.status_code, 201, url)
+        self.assertFalse(Module.objects.filter(school=other, title='New').exists())
+
+    def test_learning_situation_modules(self):
+        url = f'/api/core/learning-situations/{self.situations[0].pk}/'
+        response = self.client.patch(url, {'modules': [self.other_module.pk]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.situations[0].modules.exists())
+
+    def test_planning_unit(self):
+        response = self.client.post('/api/core/planning-units/', {
+            'subject': self.subjects[1].pk, 'unit_number': 1, 'learning_situation': self.situations[1].pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/core/planning-units/bulk-update/', {
+            'subject': self.subjects[0].pk, 'units': [{'unit_number': 1, 'learning_situation': str(self.situations[1].pk)}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PlanningUnit.objects.exists())
+
+    def test_scheduled_situation(self):
+        response = self.client.post('/api/core/scheduled-situations/', {
+            'learning_situation_id': str(self.situations[0].pk), 'term': self.terms[1].pk,
+            'start_date': '2026-09-10', 'end_date': '2026-09-20', 'order': 0,
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post('/api/core/scheduled-situations/', {
+            'learning_situation_id': str(self.situations[1].pk), 'term': self.terms[0].pk,
+            'start_date': '2026-09-10', 'end_date': '2026-09-20', 'order': 0,
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_superuser_unscoped(self):
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x', school=self.schools[0]))
+        response = self.client.post('/api/core/modules/', self.module_payload(*self.schools[1:], self.subjects[1]), format='json')
+        self.assertEqual(response.status_code, 201)
+
+
+class FetchByIdsTests(TestCase):
+    """``?ids=`` and the ``fetch/`` POST return the user's rows in request order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        school_type = SchoolType.objects.create(name='Type')
+        year = Year.objects.create(name='1')
+        cls.modules = []
+        for name in ('Mine', 'Other'):
+            school = School.objects.create(name=name, region=region, school_type=school_type)
+            subject = Subject.objects.create(name=name, description='', year=year, region=region, school=school)
+            cls.modules.append([
+                Module.objects.create(year=year, school=school, subject=subject, title=f'{name} {number}')
+                for number in range(3)
+            ])
+        cls.user = User.objects.create_user('teacher', password='x', school=cls.modules[0][0].school, role='teacher')
+        cls.user.user_permissions.set(Permission.objects.all())
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, *ids, query=''):
+        return self.client.get(f'/api/core/modules/?ids={",".join(str(pk) for pk in ids)}{query}')
+
+    def post(self, ids, query=''):
+        return self.client.post(f'/api/core/modules/fetch/{query}', {'ids': ids}, format='json')
+
+    def test_request_order(self):
+        mine = self.modules[0]
+        response = self.get(mine[2].pk, mine[0].pk, mine[1].pk, mine[2].pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['title'] for row in response.data['results']], ['Mine 2', 'Mine 0', 'Mine 1'])
+        self.assertEqual(response.data['missing'], [])
+
+    def test_missing_and_other_school(self):
+        unknown, foreign = uuid.uuid4(), self.modules[1][0].pk
+        with self.assertNumQueries(1):
+            response = self.get(foreign, self.modules[0][1].pk, unknown, query='&fields=id,title')
+        self.assertEqual([row['title'] for row in response.data['results']], ['Mine 1'])
+        self.assertEqual(response.data['missing'], [str(foreign), str(unknown)])
+
+    def test_invalid_ids(self):
+        response = self.get(self.modules[0][0].pk, 'not-a-uuid')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post([str(self.modules[0][0].pk), 42]).status_code, 400)
+
+    def test_too_many_ids(self):
+        ids = [str(uuid.uuid4()) for _ in range(1001)]
+        self.assertEqual(self.post(ids).status_code, 400)
+        response = self.post(ids[:1000])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['missing']), 1000)
+
+    def test_post(self):
+        mine = self.modules[0]
+        response = self.post([str(mine[1].pk), str(self.modules[1][1].pk), str(mine[0].pk)], query='?fields=id,title')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'id': str(mine[1].pk), 'title': 'Mine 1'}, {'id': str(mine[0].pk), 'title': 'Mine 0'},
+        ])
+        self.assertEqual(response.data['missing'], [str(self.modules[1][1].pk)])
+        self.assertEqual(self.post(str(mine[0].pk)).status_code, 400)
+        self.assertEqual(Module.objects.count(), 6)
+
+
+class RecordingBroker(InProcessBroker):
+    """An in-process broker that also keeps what was published."""
+
+    def __init__(self):
+        super().__init__()
+        self.published = []
+
+    def publish(self, channels, event):
+        self.published.append((channels, event))
+        super().publish(channels, event)
+
+
+class BrokerMixin:
+    """Swap the process-wide broker for a fresh ``RecordingBroker``."""
+
+    def setUp(self):
+        super().setUp()
+        previous, events._broker = events._broker, RecordingBroker()
+        self.addCleanup(setattr, events, '_broker', previous)
+
+
+class InProcessBrokerTests(SimpleTestCase):
+    """Subscribers get the events of their own channel, from any thread."""
+
+    def test_channel_scoping(self):
+        broker = InProcessBroker()
+
+        async def run():
+            school = broker.subscribe('school:1')
+            subject = broker.subscribe('school:1:subject:2')
+            other = broker.subscribe('school:1:subject:3')
+            await asyncio.to_thread(broker.publish, channels_for(1, 2), {'id': 'a'})
+            await asyncio.to_thread(broker.publish, channels_for(1), {'id': 'b'})
+            await asyncio.sleep(0)
+            return [[queue.get_nowait() for _ in range(queue.qsize())] for queue in (school, subject, other)]
+
+        self.assertEqual(async_to_sync(run)(), [[{'id': 'a'}, {'id': 'b'}], [{'id': 'a'}], []])
+        self.assertEqual(channels_for(1, 2), ['school:1', 'school:1:subject:2'])
+
+    @override_settings(EVENTS_QUEUE_SIZE=2)
+    def test_full_queue_and_unsubscribe(self):
+        broker = InProcessBroker()
+
+        async def run():
+            queue = broker.subscribe('school:1')
+            for number in range(3):
+                broker.publish(['school:1'], {'id': number})
+            await asyncio.sleep(0)
+            received = [queue.get_nowait() for _ in range(queue.qsize())]
+            broker.unsubscribe('school:1', queue)
+            broker.publish(['school:1'], {'id': 3})
+            await asyncio.sleep(0)
+            return received, queue.qsize()
+
+        # A client that stops reading loses the newest events.
+        self.assertEqual(async_to_sync(run)(), ([{'id': 0}, {'id': 1}], 0))
+
+
+class ChangeEventSignalTests(BrokerMixin, TestCase):
+    """Saving and deleting planner content publishes an event after commit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.region = Region.objects.create(name='Region')
+        cls.school = School.objects.create(name='School', region=cls.region, school_type=SchoolType.objects.create(name='Type'))
+        cls.year = Year.objects.create(name='1')
+        cls.subject = Subject.objects.create(name='Math', description='', year=cls.year, region=cls.region, school=cls.school)
+        cls.situation = LearningSituation.objects.create(
+            school=cls.school, subject=cls.subject, year=cls.year, region=cls.region, title='Situation',
+        )
+        cls.term = Term.objects.filter(calendar__school=cls.school).first()
+
+    def published(self, model):
+        return [
+            (channels, event['action'], event['id'])
+            for channels, event in events._broker.published if event['model'] == model
+        ]
+
+    def test_published_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            module = Module.objects.create(year=self.year, school=self.school, subject=self.subject, title='Module')
+        self.assertEqual(self.published('module'), [])
+        for callback in callbacks:
+            callback()
+        channels = channels_for(self.school.pk, self.subject.pk)
+        self.assertEqual(self.published('module'), [(channels, 'saved', str(module.pk))])
+        self.assertEqual(events._broker.published[-1][1]['subject'], str(self.subject.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            module_id = module.pk
+            module.delete()
+        self.assertEqual(self.published('module')[-1], (channels, 'deleted', str(module_id)))
+
+    def test_related_models(self):
+        channels = channels_for(self.school.pk, self.subject.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            unit = PlanningUnit.objects.create(subject=self.subject, unit_number=1)
+            scheduled = ScheduledLearningSituation.objects.create(
+                learning_situation=self.situation, term=self.term, start_date='2026-09-07', end_date='2026-09-18',
+            )
+        self.assertEqual(self.published('planningunit'), [(channels, 'saved', str(unit.pk))])
+        self.assertEqual(self.published('scheduledlearningsituation'), [(channels, 'saved', str(scheduled.pk))])
+
+
+class ChangeEventStreamTests(BrokerMixin, TestCase):
+    """``/api/core/events/`` checks the token, school and subject, then streams the channel."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        school_type = SchoolType.objects.create(name='Type')
+        cls.school = School.objects.create(name='School', region=region, school_type=school_type)
+        other_school = School.objects.create(name='Other', region=region, school_type=school_type)
+        year = Year.objects.create(name='1')
+        cls.subject = Subject.objects.create(name='Math', description='', year=year, region=region, school=cls.school)
+        cls.other_subject = Subject.objects.create(name='Art', description='', year=year, region=region, school=cls.school)
+        cls.foreign_subject = Subject.objects.create(name='Math', description='', year=year, region=region, school=other_school)
+        cls.token = Token.objects.create(user=User.objects.create_user('teacher', password='x', school=cls.school))
+        cls.homeless_token = Token.objects.create(user=User.objects.create_user('visitor', password='x'))
+
+    def get(self, token=None, **params):
+        if token:
+            params['token'] = token.key
+        return RequestFactory().get('/api/core/events/', params)
+
+    def test_rejected(self):
+        for request, status_code in (
+            (self.get(), 401),
+            (RequestFactory().get('/api/core/events/', {'token': 'nope'}), 401),
+            (self.get(self.homeless_token), 400),
+            (self.get(self.token, subject=self.foreign_subject.pk), 404),
+            (self.get(self.token, subject='not-a-uuid'), 404),
+        ):
+            response = async_to_sync(change_event_stream)(request)
+            self.assertEqual(response.status_code, status_code)
+            self.assertFalse(response.streaming)
+
+    def test_stream(self):
+        request = self.get(self.token, subject=self.subject.pk)
+
+        async def read():
+            response = await change_event_stream(request)
+            chunks = response.streaming_content
+            first = await anext(chunks)
+            get_broker().publish(channels_for(self.school.pk, self.other_subject.pk), {'id': 'other'})
+            get_broker().publish(channels_for(self.school.pk, self.subject.pk), {'id': 'mine'})
+            return response, first, await asyncio.wait_for(anext(chunks), 5)
+
+        response, first, event = async_to_sync(read)()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(first, b'retry: 5000\n\n')
+        self.assertEqual(event, b'event: change\ndata: {"id": "mine"}\n\n')
+
+
+class ChangeEventConnectionTests(TransactionTestCase):
+    """Outside a test transaction: the stream's connection and Postgres relay."""
+
+    def test_stream_releases_connection(self):
+        school = School.objects.create(name='School', school_type=SchoolType.objects.create(name='Type'))
+        token = Token.objects.create(user=User.objects.create_user('teacher', password='x', school=school))
+        request = RequestFactory().get('/api/core/events/', {'token': token.key})
+        response = async_to_sync(change_event_stream)(request)
+        self.assertTrue(response.streaming)
+        self.assertIsNone(connection.connection)
+
+    def test_postgres_relay(self):
+        broker = PostgresBroker()
+        self.addCleanup(broker.stop)
+
+        async def receive():
+            queue = broker.subscribe('school:1')
+            # The listener thread may not be listening yet; publish until it is.
+            for _ in range(50):
+                await sync_to_async(broker.publish)(['school:1'], {'id': 'a'})
+                try:
+                    return await asyncio.wait_for(queue.get(), 0.2)
+                except asyncio.TimeoutError:
+                    pass
+
+        self.assertEqual(async_to_sync(receive)(), {'id': 'a'})
+        with self.assertLogs('apps.core.events', 'WARNING'):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [broker.notify_channel, 'not json'])
+            broker.stop()
+        self.assertFalse(broker._listener.is_alive())
+
+
+@override_settings(AGGREGATE_QUERY_FAN_OUT=False)
+class FanOutTests(SimpleTestCase):
+    """``fan_out`` keeps the results in order and caps how many callables run at once."""
+
+    @override_settings(AGGREGATE_QUERY_FAN_OUT=True, AGGREGATE_QUERY_CONCURRENCY=2)
+    def test_concurrency(self):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def work(number):
+            with lock:
+                running.append(number)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(number)
+            return number
+
+        results = async_to_sync(fan_out)(*(lambda number=number: work(number) for number in range(5)))
+        self.assertEqual(results, [0, 1, 2, 3, 4])
+        self.assertEqual(max(peak), 2)
+
+
+class AsyncAuthenticationTests(TestCase):
+    """Async endpoints take the token from the header; ``?token=`` only where allowed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='School', school_type=SchoolType.objects.create(name='Type'))
+        cls.user = User.objects.create_user('teacher', password='x', school=cls.school, role='teacher')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def test_header(self):
+        response = self.client.get(
+            f'/api/core/schools/{self.school.pk}/teaching-hours/', HTTP_AUTHORIZATION=f'Token {self.token.key}',
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_query_token_rejected(self):
+        response = self.client.get(f'/api/core/schools/{self.school.pk}/teaching-hours/?token={self.token.key}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_query_token_opt_in(self):
+        request = RequestFactory().get('/api/core/events/', {'token': self.token.key})
+        self.assertIsNone(async_to_sync(authenticate_request)(request))
+        self.assertEqual(async_to_sync(authenticate_request)(request, allow_query_token=True), self.user)
+
+
+class SparseFieldsetTests(TestCase):
+    """``?fields=`` and ``?expand=`` prefetch only the relations they render."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        cls.school = School.objects.create(name='School', region=region, school_type=SchoolType.objects.create(name='Type'))
+        year = Year.objects.create(name='1')
+        subject = Subject.objects.create(name='Math', description='', year=year, region=region, school=cls.school)
+        cls.user = User.objects.create_user('teacher', password='x', school=cls.school, role='teacher')
+        cls.user.user_permissions.set(Permission.objects.all())
+        modules = [
+            Module.objects.create(year=year, school=cls.school, subject=subject, title=f'Module {number}')
+            for number in range(3)
+        ]
+        for number in range(3):
+            situation = LearningSituation.objects.create(
+                school=cls.school, subject=subject, year=year, region=region, title=f'Situation {number}',
+            )
+            situation.modules.set(modules[number:])
+            situation.teaching_staff.add(cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, query):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/core/learning-situations/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data, [query['sql'] for query in ctx.captured_queries]
+
+    def prefetched_tables(self, queries):
+        tables = ('core_learningsituation_modules', 'core_learningsituation_teaching_staff',
+                  'core_learningsituation_specific_competences')
+        return {table for table in tables for sql in queries if f'"{table}"' in sql}
+
+    def test_unselected_relations_not_prefetched(self):
+        data, queries = self.get('fields=id,title')
+        self.assertEqual(set(data[0]), {'id', 'title'})
+        self.assertEqual(self.prefetched_tables(queries), set())
+
+    def test_selected_relation_prefetched(self):
+        data, queries = self.get('fields=id,modules')
+        self.assertEqual(sorted(len(row['modules']) for row in data), [1, 2, 3])
+        self.assertEqual(self.prefetched_tables(queries), {'core_learningsituation_modules'})
+
+    def test_expanded_relation(self):
+        data, queries = self.get('fields=id,modules&expand=modules')
+        self.assertEqual(sorted(len(row['modules']) for row in data), [1, 2, 3])
+        self.assertIn('title', data[0]['modules'][0])
+        _, without_expand = self.get('fields=id&expand=modules')
+        self.assertLess(len(without_expand), len(queries))
+
+    def test_all_fields(self):
+        _, queries = self.get('')
+        self.assertEqual(len(self.prefetched_tables(queries)), 3)
+
+    def test_method_fields_keep_their_relations(self):
+        region = self.school.region
+        for number in range(3):
+            year = Year.objects.create(name=f'Year {number}')
+            subject = Subject.objects.create(
+                name=f'Subject {number}', description='', year=year, region=region, school=self.school,
+            )
+            SpecificCompetences.objects.create(region=region, subject=subject, year=year, code=f'C{number}', description='')
+        reference_cache.bump('competences')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/core/specific-competences/?fields=id,subject_name,year_name')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(row['year_name'] for row in response.data), ['Year 0', 'Year 1', 'Year 2'])
+        queries = [query['sql'] for query in ctx.captured_queries]
+        for table in ('core_subject', 'core_year'):
+            self.assertEqual(sum(sql.startswith('SELECT') and f'FROM "{table}"' in sql for sql in queries), 1, table)
+
+
+class BatchAPITests(TestCase):
+    """``/batch/`` runs its operations in one transaction."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.region = Region.objects.create(name='Region')
+        cls.school = School.objects.create(
+            name='School', region=cls.region, school_type=SchoolType.objects.create(name='Type'),
+        )
+        cls.year = Year.objects.create(name='1')
+        cls.subject = Subject.objects.create(
+            name='Math', description='', year=cls.year, region=cls.region, school=cls.school,
+        )
+        cls.module = Module.objects.create(year=cls.year, school=cls.school, subject=cls.subject, title='Module')
+        cls.user = User.objects.create_user('teacher', password='x', school=cls.school, role='teacher')
+        cls.user.user_permissions.set(Permission.objects.all())
+        cls.school.teaching_staff.add(cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def situation(self, title):
+        return {
+            'method': 'POST', 'path': 'learning-situations/', 'ref': 'situation',
+            'body': {'year': str(self.year.pk), 'region': str(self.region.pk), 'school': str(self.school.pk),
+                     'subject': str(self.subject.pk), 'title': title, 'modules': [str(self.module.pk)]},
+        }
+
+    def test_batch(self):
+        response = self.client.post('/api/core/batch/', {'operations': [
+            self.situation('Planned'),
+            {'method': 'PATCH', 'path': f'modules/{self.module.pk}/', 'body': {'date_start': '2026-09-15'}},
+            {'method': 'POST', 'path': 'planning-units/bulk-update/', 'body': {
+                'subject': str(self.subject.pk), 'units': [{'unit_number': 1, 'learning_situation': '$situation.id'}],
+            }},
+            {'method': 'GET', 'path': 'learning-situations/$situation.id/?fields=id,title'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 200, 200, 200])
+
+        situation = LearningSituation.objects.get(title='Planned')
+        self.assertEqual(response.data['results'][3]['data'], {'id': str(situation.pk), 'title': 'Planned'})
+        self.assertEqual(list(situation.modules.all()), [self.module])
+        self.module.refresh_from_db()
+        self.assertEqual(str(self.module.date_start), '2026-09-15')
+        self.assertEqual(PlanningUnit.objects.get(subject=self.subject, unit_number=1).learning_situation, situation)
+
+    def test_failure_rolls_back(self):
+        response = self.client.post('/api/core/batch/', {'operations': [
+            self.situation('Rolled back'),
+            {'method': 'PATCH', 'path': f'modules/{self.module.pk}/', 'body': {'date_start': 'soon'}},
+            {'method': 'DELETE', 'path': f'modules/{self.module.pk}/'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['failed_index'], 1)
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 400])
+        self.assertIn('date_start', response.data['results'][1]['data'])
+        self.assertFalse(LearningSituation.objects.filter(title='Rolled back').exists())
+        self.assertTrue(Module.objects.filter(pk=self.module.pk).exists())
+
+    def test_unauthenticated(self):
+        response = APIClient().post('/api/core/batch/', {'operations': [self.situation('Anonymous')]}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(LearningSituation.objects.exists())
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Safe requests read from a replica unless the client wrote recently.
+
+    The replica is an extra ``DATABASES`` alias mirroring the test database,
+    as ``DB_REPLICA_URLS`` entries do. It is added once the test database
+    exists, since the runner has nothing to create for a mirror; a
+    transaction test commits the data so the replica's own connection sees
+    it.
+    """
+    replica = 'replica_test'
+
+    @classmethod
+    def setUpClass(cls):
+        # ``connections`` reads the same dict, so the alias exists for both.
+        settings.DATABASES[cls.replica] = {
+            **connections['default'].settings_dict,
+            'TEST': {**connections['default'].settings_dict['TEST'], 'MIRROR': 'default'},
+        }
+        cls.databases = {'default', cls.replica}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[cls.replica].close()
+        connections[cls.replica].close_pool()
+        del connections[cls.replica]
+        del settings.DATABASES[cls.replica]
+
+    def setUp(self):
+        region = Region.objects.create(name='Region')
+        school = School.objects.create(name='School', region=region, school_type=SchoolType.objects.create(name='Type'))
+        year = Year.objects.create(name='1')
+        subject = Subject.objects.create(name='Math', description='', year=year, region=region, school=school)
+        self.module = Module.objects.create(year=year, school=school, subject=subject, title='Module')
+        self.writer, self.reader = APIClient(), APIClient()
+        for client, name in ((self.writer, 'writer'), (self.reader, 'reader')):
+            user = User.objects.create_user(name, password='x', school=school, role='teacher')
+            user.user_permissions.set(Permission.objects.all())
+            client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+
+    def module_reads(self, client):
+        """The aliases a module list of ``client`` read the modules from."""
+        captured = {alias: CaptureQueriesContext(connections[alias]) for alias in ('default', self.replica)}
+        with captured['default'], captured[self.replica]:
+            response = client.get('/api/core/modules/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([module['title'] for module in response.data], [self.module.title])
+        table = f'FROM "{Module._meta.db_table}"'
+        return {
+            alias for alias, context in captured.items()
+            if any(table in query['sql'] for query in context.captured_queries)
+        }
+
+    def test_routing(self):
+        self.assertEqual(self.module_reads(self.writer), {self.replica})
+
+        response = self.writer.patch(f'/api/core/modules/{self.module.pk}/', {'title': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.module.title = 'Renamed'
+
+        self.assertEqual(self.module_reads(self.writer), {'default'})
+        self.assertEqual(self.module_reads(self.reader), {self.replica})
+
+
+@override_settings(AGGREGATE_QUERY_FAN_OUT=False)
+class CoverageSummaryTests(TestCase):
+    """``CoverageSummary`` stays equal to the coverage counted from scratch."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.region = Region.objects.create(name='Region')
+        cls.school = School.objects.create(
+            name='School', region=cls.region, school_type=SchoolType.objects.create(name='Type'),
+        )
+        cls.year = Year.objects.create(name='1')
+        cls.subjects, cls.competences = [], []
+        for name in ('Math', 'Art'):
+            subject = Subject.objects.create(name=name, description='', year=cls.year, region=cls.region, school=cls.school)
+            competences = [
+                SpecificCompetences.objects.create(
+                    region=cls.region, subject=subject, year=cls.year, code=f'{name} {number}', description='',
+                    evaluation_criteria=[{'id': 'a', 'code': '1', 'description': ''}, {'id': 'b', 'code': '2', 'description': ''}],
+                )
+                for number in range(2)
+            ]
+            subject.specific_competences.set(competences)
+            cls.subjects.append(subject)
+            cls.competences.append(competences)
+        cls.user = User.objects.create_user('teacher', password='x', school=cls.school, role='teacher')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        math = self.competences[0]
+        self.modules = [
+            self.module(self.subjects[0], {math[0]: ['a', 'b'], math[1]: []}),
+            self.module(self.subjects[0], {math[0]: ['a']}),
+            self.module(self.subjects[0], {math[1]: ['b']}),
+        ]
+        self.situations = [self.situation(self.subjects[0], self.modules[:2]), self.situation(self.subjects[0], self.modules[1:])]
+
+    def module(self, subject, criteria):
+        return Module.objects.create(
+            year=self.year, school=self.school, subject=subject, title='Module',
+            specific_competences=[competence.pk for competence in criteria],
+            selected_criteria={str(competence.pk): selected for competence, selected in criteria.items()},
+        )
+
+    def situation(self, subject, modules):
+        situation = LearningSituation.objects.create(
+            school=self.school, subject=subject, year=self.year, region=self.region, title='Situation',
+        )
+        situation.modules.set(modules)
+        return situation
+
+    def assertSummaryFresh(self):
+        for subject in self.subjects:
+            modules = Module.objects.filter(learning_situations__subject=subject).distinct() \
+                .values('specific_competences', 'selected_criteria')
+            module_counts, criterion_counts = count_coverage(modules)
+            expected = {(competence_id, ''): count for competence_id, count in module_counts.items()}
+            expected.update(criterion_counts)
+            stored = {
+                (str(competence_id), criterion_id): count
+                for competence_id, criterion_id, count in CoverageSummary.objects.filter(subject=subject)
+                    .values_list('competence_id', 'criterion_id', 'module_count')
+            }
+            self.assertEqual(stored, expected, subject.name)
+
+    def test_module_create(self):
+        self.assertSummaryFresh()
+        math = self.competences[0]
+        self.situations[0].modules.add(self.module(self.subjects[0], {math[1]: ['a', 'b']}))
+        self.assertSummaryFresh()
+        self.situation(self.subjects[1], [self.module(self.subjects[1], {self.competences[1][0]: ['a']})])
+        self.assertSummaryFresh()
+
+    def test_module_edit(self):
+        module = self.modules[1]
+        competence = self.competences[0][1]
+        module.specific_competences = module.specific_competences + [competence.pk]
+        module.selected_criteria[str(competence.pk)] = ['a']
+        module.save()
+        self.assertSummaryFresh()
+
+        module.selected_criteria[str(competence.pk)].append('b')
+        module.save()
+        self.assertSummaryFresh()
+
+        self.situations[1].subject = self.subjects[1]
+        self.situations[1].save()
+        self.assertSummaryFresh()
+
+    def test_delete(self):
+        self.modules[1].delete()
+        self.assertSummaryFresh()
+        self.situations[0].delete()
+        self.assertSummaryFresh()
+        self.situations[1].modules.remove(self.modules[2])
+        self.assertSummaryFresh()
+        self.assertFalse(CoverageSummary.objects.exists())
+
+    def test_school_coverage_view(self):
+        self.situation(self.subjects[1], [self.module(self.subjects[1], {self.competences[1][0]: ['b']})])
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        response = self.client.get(f'/api/core/schools/{self.school.pk}/coverage/', **auth)
+        self.assertEqual(response.status_code, 200)
+        school = response.json()
+        self.assertEqual(len(school['subjects']), 2)
+        for subject in school['subjects']:
+            fresh = self.client.get(f'/api/core/subjects/{subject["id"]}/coverage/', **auth).json()
+            self.assertEqual(subject['competences'], fresh['competences'], subject['name'])
+            self.assertEqual(subject['stats'], fresh['stats'], subject['name'])
+        self.assertSummaryFresh()
+
+
+class RecommendTests(TestCase):
+    """The greedy set cover in ``recommend``."""
+
+    def test_minimal_cover(self):
+        # Greedy picks the large module first; the two others then make it redundant.
+        candidates = [('large', [0, 1, 2, 3], 0), ('left', [0, 1, 4], 0), ('right', [2, 3, 5], 0)]
+        picks = recommend(candidates, [1.0] * 6, limit=10)
+        self.assertEqual(sorted(module_id for module_id, _, _ in picks), ['left', 'right'])
+        self.assertEqual(sorted(number for _, _, numbers in picks for number in numbers), [0, 1, 2, 3, 4, 5])
+        self.assertEqual(sum(gain for _, gain, _ in picks), 6.0)
+
+    def test_weights_rank_and_limit(self):
+        candidates = [('other school', [0], 2), ('same subject', [0], 0), ('light', [1, 2], 1)]
+        picks = recommend(candidates, [1.0, 0.25, 0.25], limit=1)
+        self.assertEqual(picks, [('same subject', 1.0, [0])])
+        self.assertEqual(recommend(candidates, [1.0, 0.25, 0.25], limit=5)[1], ('light', 0.5, [1, 2]))
+        self.assertEqual(recommend([], [1.0], limit=5), [])
+
+
+@override_settings(AGGREGATE_QUERY_FAN_OUT=False)
+class CoverageRecommendationsViewTests(TestCase):
+    """``?year=`` picks the competences and ``?scope=`` the module library."""
+
+    @classmethod
+    def setUpTestData(cls):
+        school_type = SchoolType.objects.create(name='Type')
+        cls.year, cls.next_year = Year.objects.create(name='1'), Year.objects.create(name='2')
+        region, far_region = Region.objects.create(name='Region'), Region.objects.create(name='Far')
+        schools = [
+            School.objects.create(name=name, region=school_region, school_type=school_type)
+            for name, school_region in (('Own', region), ('Neighbour', region), ('Far', far_region))
+        ]
+        subjects = [
+            Subject.objects.create(name='Math', description='', year=cls.year, region=school.region, school=school)
+            for school in schools
+        ]
+        cls.subject = subjects[0]
+        criteria = [{'id': criterion, 'code': criterion.upper(), 'description': ''} for criterion in 'abc']
+        cls.competence = SpecificCompetences.objects.create(
+            region=region, subject=cls.subject, year=cls.year, code='C1', description='', evaluation_criteria=criteria,
+        )
+        cls.next_competence = SpecificCompetences.objects.create(
+            region=region, subject=cls.subject, year=cls.next_year, code='C2', description='',
+            evaluation_criteria=[{'id': 'x', 'code': 'X', 'description': ''}],
+        )
+        cls.subject.specific_competences.set([cls.competence])
+
+        def module(subject, title, competence, selected):
+            return Module.objects.create(
+                year=subject.year, school=subject.school, subject=subject, title=title,
+                specific_competences=[competence.pk], selected_criteria={str(competence.pk): selected},
+            )
+
+        LearningSituation.objects.create(
+            school=schools[0], subject=cls.subject, year=cls.year, region=region, title='Situation',
+        ).modules.set([module(cls.subject, 'In use', cls.competence, ['a'])])
+        module(cls.subject, 'School', cls.competence, ['b'])
+        module(subjects[1], 'Region', cls.competence, ['c'])
+        module(subjects[2], 'Far', cls.competence, ['b', 'c'])
+        module(cls.subject, 'Next year', cls.next_competence, ['x'])
+
+        user = User.objects.create_user('teacher', password='x', school=schools[0], role='teacher')
+        cls.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=user).key}'}
+
+    def get(self, query=''):
+        response = self.client.get(f'/api/core/subjects/{self.subject.pk}/coverage/recommendations/?{query}', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def recommended(self, data):
+        return sorted(item['title'] for item in data['recommendations'])
+
+    def test_school_scope(self):
+        data = self.get()
+        self.assertEqual(data['scope'], 'school')
+        self.assertEqual(data['gaps'], 2)
+        self.assertEqual(self.recommended(data), ['School'])
+        self.assertAlmostEqual(data['remaining_weight'], 1 / 3)
+
+    def test_region_scope(self):
+        data = self.get('scope=region')
+        self.assertEqual(self.recommended(data), ['Region', 'School'])
+        self.assertAlmostEqual(data['remaining_weight'], 0)
+        response = self.client.get(
+            f'/api/core/subjects/{self.subject.pk}/coverage/recommendations/?scope=planet', **self.auth,
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_year(self):
+        data = self.get(f'year={self.next_year.pk}&scope=region')
+        self.assertEqual(data['year'], str(self.next_year.pk))
+        self.assertEqual(data['gaps'], 1)
+        self.assertEqual(self.recommended(data), ['Next year'])
+        self.assertEqual(data['recommendations'][0]['covers'][0]['criterion_code'], 'X')
+
+
+class DuplicateModuleTests(TestCase):
+    """MinHash signatures group copied modules and follow module edits."""
+
+    DESCRIPTION = (
+        'Students measure the length of the school corridor with informal units, compare their results in '
+        'groups, convert them to metres and present a short report explaining the differences they found.'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        cls.school = School.objects.create(name='School', region=region, school_type=SchoolType.objects.create(name='Type'))
+        cls.year = Year.objects.create(name='1')
+        cls.subject = Subject.objects.create(name='Math', description='', year=cls.year, region=region, school=cls.school)
+        cls.competences = [
+            SpecificCompetences.objects.create(region=region, subject=cls.subject, year=cls.year, code=f'C{number}', description='')
+            for number in range(2)
+        ]
+
+    def module(self, title, description=DESCRIPTION, competences=None):
+        competences = [self.competences[0].pk] if competences is None else competences
+        return Module.objects.create(
+            year=self.year, school=self.school, subject=self.subject, title=title, description=description,
+            specific_competences=competences,
+        )
+
+    def groups(self):
+        signatures = duplicates.library('school', self.school.pk, None)
+        return [(set(members), score) for members, score in duplicates.duplicate_groups(signatures)]
+
+    def test_copies_grouped(self):
+        original = self.module('Measuring the corridor')
+        copy = self.module('Measuring the corridor')
+        near = self.module('Measuring the corridor', self.DESCRIPTION.replace('short report', 'brief report'))
+        unrelated = self.module(
+            'Fractions with recipes', 'Halve and double the quantities of a recipe and write them as fractions.',
+            [self.competences[1].pk],
+        )
+        groups = self.groups()
+        self.assertEqual(len(groups), 1)
+        members, score = groups[0]
+        self.assertEqual(members, {original.pk, copy.pk, near.pk})
+        self.assertEqual(score, 1.0)
+        self.assertNotIn(unrelated.pk, members)
+
+        similar = duplicates.similar_to(
+            duplicates.signature_for(near), duplicates.library('school', self.school.pk, None), exclude=near.pk,
+        )
+        self.assertEqual({module_id for module_id, _ in similar}, {original.pk, copy.pk})
+        self.assertTrue(all(0.7 <= score < 1 for _, score in similar))
+
+    def test_unrelated_not_grouped(self):
+        self.module('Measuring the corridor')
+        self.module('Fractions with recipes', 'Halve and double the quantities of a recipe and write them as fractions.')
+        self.module('Symmetry in the playground', 'Find lines of symmetry in the shapes painted on the playground.')
+        self.assertEqual(self.groups(), [])
+
+    def test_signature_refreshed(self):
+        original = self.module('Measuring the corridor')
+        module = self.module('Fractions with recipes', 'Halve and double the quantities of a recipe.')
+        signature = ModuleSignature.objects.get(module=module).signature
+        self.assertEqual(self.groups(), [])
+
+        module.title, module.description = original.title, original.description
+        module.save(update_fields=['title', 'description'])
+        self.assertNotEqual(ModuleSignature.objects.get(module=module).signature, signature)
+        self.assertEqual(self.groups(), [({original.pk, module.pk}, 1.0)])
+
+        # A short title, so the competence is a large part of the features.
+        module.title, module.description = 'Map', ''
+        module.save()
+        signature = ModuleSignature.objects.get(module=module).signature
+        module.specific_competences = [self.competences[1].pk]
+        module.save(update_fields=['specific_competences'])
+        refreshed = ModuleSignature.objects.get(module=module).signature
+        self.assertNotEqual(refreshed, signature)
+        self.assertEqual(refreshed, duplicates.signature_for(module))
+
+        module.description = 'Unrelated'
+        module.save(update_fields=['session_length'])
+        self.assertEqual(ModuleSignature.objects.get(module=module).signature, refreshed)
+
+
+class ScheduleConflictTests(TestCase):
+    """``conflicts()`` reports overlaps, items outside the terms and inverted ranges."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        cls.school = School.objects.create(name='School', region=region, school_type=SchoolType.objects.create(name='Type'))
+        cls.year = Year.objects.create(name='1')
+        cls.subject = Subject.objects.create(name='Math', description='', year=cls.year, region=region, school=cls.school)
+        cls.other_subject = Subject.objects.create(name='Art', description='', year=cls.year, region=region, school=cls.school)
+        cls.school.calendars.all().delete()   # the default one created with the school
+        calendar = SchoolCalendar.objects.create(
+            school=cls.school, academic_year='2026-2027', start_date='2026-09-01', end_date='2027-06-30',
+        )
+        # The first two terms follow each other; Easter holidays separate the last one.
+        cls.terms = [
+            Term.objects.create(calendar=calendar, name=name, start_date=start, end_date=end)
+            for name, start, end in (
+                ('First', '2026-09-01', '2026-12-18'),
+                ('Second', '2026-12-19', '2027-03-26'),
+                ('Third', '2027-04-06', '2027-06-22'),
+            )
+        ]
+        cls.situation = LearningSituation.objects.create(
+            school=cls.school, subject=cls.subject, year=cls.year, region=region, title='Situation',
+        )
+
+    def unit(self, number, start, end, subject=None):
+        return PlanningUnit.objects.create(
+            subject=subject or self.subject, unit_number=number, title=f'Unit {number}', start_date=start, end_date=end,
+        )
+
+    def issues(self, **kwargs):
+        """``{(issue, kind, id, other_id)}`` of the school's conflicts."""
+        return {(row[0], row[1], row[4], row[8]) for row in conflicts(self.school.pk, **kwargs)}
+
+    def test_overlap(self):
+        first = self.unit(1, '2026-09-01', '2026-09-30')
+        second = self.unit(2, '2026-09-30', '2026-10-20')
+        self.unit(3, '2026-10-21', '2026-11-10')
+        self.unit(1, '2026-09-01', '2026-09-30', subject=self.other_subject)
+        pair = tuple(sorted([first.pk, second.pk], key=str))
+        self.assertEqual(self.issues(), {('overlap', 'planning_unit', *pair)})
+
+        scheduled = [
+            ScheduledLearningSituation.objects.create(
+                learning_situation=self.situation, term=self.terms[0], start_date=start, end_date=end,
+            )
+            for start, end in (('2026-10-01', '2026-10-15'), ('2026-10-10', '2026-10-30'))
+        ]
+        pair = tuple(sorted([item.pk for item in scheduled], key=str))
+        self.assertEqual(
+            self.issues(kinds=['scheduled_situation']), {('overlap', 'scheduled_situation', *pair)},
+        )
+        self.assertEqual(self.issues(subject_id=self.other_subject.pk), set())
+
+    def test_outside_term(self):
+        self.unit(1, '2026-12-01', '2027-01-15')          # spans consecutive terms
+        holidays = self.unit(2, '2027-03-20', '2027-04-10')
+        summer = self.unit(3, '2027-06-15', '2027-07-10')
+        module = Module.objects.create(
+            year=self.year, school=self.school, subject=self.subject, title='Early',
+            date_start='2026-08-25', date_end='2026-09-10',
+        )
+        wrong_term = ScheduledLearningSituation.objects.create(
+            learning_situation=self.situation, term=self.terms[0], start_date='2027-01-10', end_date='2027-01-20',
+        )
+        self.assertEqual(self.issues(), {
+            ('outside_term', 'planning_unit', holidays.pk, None),
+            ('outside_term', 'planning_unit', summer.pk, None),
+            ('outside_term', 'module', module.pk, None),
+            ('outside_term', 'scheduled_situation', wrong_term.pk, None),
+        })
+
+    def test_invalid_range(self):
+        unit = self.unit(1, '2026-10-10', '2026-10-01')
+        self.unit(2, '2026-10-01', None)
+        module = Module.objects.create(
+            year=self.year, school=self.school, subject=self.subject, title='Backwards',
+            date_start='2026-11-10', date_end='2026-11-01',
+        )
+        self.assertEqual(self.issues(), {
+            ('invalid_range', 'planning_unit', unit.pk, None),
+            ('invalid_range', 'module', module.pk, None),
+        })
+        row = next(row for row in conflicts(self.school.pk, kinds=['planning_unit']))
+        self.assertEqual((row[5], str(row[6]), str(row[7])), ('Unit 1', '2026-10-10', '2026-10-01'))
+
+
+class AllocateTests(SimpleTestCase):
+    """The pure date allocation in ``allocate``."""
+
+    # Two fortnights of school with a holiday on 9 September; the gap between them is a break.
+    BLOCKS = teaching_blocks(
+        [(date(2026, 9, 7), date(2026, 9, 18)), (date(2026, 10, 5), date(2026, 10, 16))], {date(2026, 9, 9)},
+    )
+
+    def test_blocks(self):
+        self.assertEqual([len(block) for block in self.BLOCKS], [9, 10])
+        self.assertNotIn(date(2026, 9, 9), self.BLOCKS[0])
+        self.assertNotIn(date(2026, 9, 12), self.BLOCKS[0])
+
+    def test_spans_break_when_mostly_before(self):
+        # Three sessions at three a week take five days; four are left before the break.
+        dates = allocate([('first', 3), ('second', 3)], 3, self.BLOCKS)
+        self.assertEqual(dates, {
+            'first': (date(2026, 9, 7), date(2026, 9, 14)),
+            'second': (date(2026, 9, 15), date(2026, 10, 5)),
+        })
+
+    def test_block_skip(self):
+        # Ten days do not mostly fit in the four left: start after the break, the previous unit runs on.
+        dates = allocate([('first', 3), ('long', 6)], 3, self.BLOCKS)
+        self.assertEqual(dates, {
+            'first': (date(2026, 9, 7), date(2026, 9, 18)),
+            'long': (date(2026, 10, 5), date(2026, 10, 16)),
+        })
+
+    def test_carry_over(self):
+        # One session at two a week is two and a half days; the halves alternate instead of drifting.
+        dates = allocate([(number, 1) for number in range(4)], 2, self.BLOCKS[1:])
+        self.assertEqual(dates, {
+            0: (date(2026, 10, 5), date(2026, 10, 7)),
+            1: (date(2026, 10, 8), date(2026, 10, 9)),
+            2: (date(2026, 10, 12), date(2026, 10, 14)),
+            3: (date(2026, 10, 15), date(2026, 10, 16)),
+        })
+
+    def test_does_not_fit(self):
+        dates = allocate([('first', 3), ('too long', 30), ('after', 1)], 3, self.BLOCKS)
+        self.assertEqual(dates['first'], (date(2026, 9, 7), date(2026, 9, 14)))
+        self.assertIsNone(dates['too long'])
+        self.assertIsNone(dates['after'])
+        self.assertEqual(allocate([('unit', 1)], 3, []), {'unit': None})
+
+
+class AllocateSchoolTests(TestCase):
+    """``allocate_school`` reads a school's units and writes their dates unless ``dry_run``."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        cls.school = School.objects.create(name='School', region=region, school_type=SchoolType.objects.create(name='Type'))
+        year = Year.objects.create(name='1')
+        cls.subject = Subject.objects.create(
+            name='Math', description='', year=year, region=region, school=cls.school, weekly_sessions=5,
+        )
+        cls.calendar = SchoolCalendar.objects.create(
+            school=cls.school, academic_year='2026-2027', start_date='2026-09-01', end_date='2027-06-30',
+        )
+        Term.objects.create(calendar=cls.calendar, name='First', start_date='2026-09-07', end_date='2026-12-18')
+        situation = LearningSituation.objects.create(
+            school=cls.school, subject=cls.subject, year=year, region=region, title='Situation',
+        )
+        situation.modules.set([
+            Module.objects.create(year=year, school=cls.school, subject=cls.subject, title=f'Module {number}', session_length=1)
+            for number in range(3)
+        ])
+        cls.units = [
+            PlanningUnit.objects.create(subject=cls.subject, unit_number=1, learning_situation=situation,
+                                        start_date='2027-01-01', end_date='2027-01-31'),
+            PlanningUnit.objects.create(subject=cls.subject, unit_number=2),
+        ]
+
+    def stored(self):
+        return list(PlanningUnit.objects.order_by('unit_number').values_list('start_date', 'end_date'))
+
+    def test_dry_run(self):
+        before = self.stored()
+        calendar, units = allocate_school(self.school.pk, self.calendar, dry_run=True)
+        self.assertEqual(calendar, self.calendar)
+        self.assertEqual(
+            [(unit['unit_number'], unit['sessions'], unit['start_date'], unit['end_date']) for unit in units],
+            # Three modules, then one week of sessions for the unit without any.
+            [(1, 3, date(2026, 9, 7), date(2026, 9, 9)), (2, 5, date(2026, 9, 10), date(2026, 9, 16))],
+        )
+        self.assertEqual(self.stored(), before)
+
+        allocate_school(self.school.pk, self.calendar)
+        self.assertEqual(self.stored(), [(unit['start_date'], unit['end_date']) for unit in units])
+
+
+class TeachingDaysTests(SimpleTestCase):
+    """``teaching_days`` counts the weekdays of the terms without non-teaching days, each day once."""
+
+    # Two weeks of term from Monday 7 September 2026 with Friday the 11th off.
+    first = ([(date(2026, 9, 7), date(2026, 9, 18))], [date(2026, 9, 11)])
+    # A second calendar from Thursday the 10th, without holidays.
+    second = ([(date(2026, 9, 10), date(2026, 9, 25))], [])
+
+    def count(self, ranges, calendars, window=(None, None)):
+        starts = np.array([start for start, _ in ranges], dtype='datetime64[D]')
+        ends = np.array([end for _, end in ranges], dtype='datetime64[D]')
+        return teaching_days(starts, ends, calendars, window).tolist()
+
+    def test_weekdays_and_holidays(self):
+        self.assertEqual(self.count([
+            (date(2026, 9, 7), date(2026, 9, 18)),
+            (date(2026, 9, 5), date(2026, 9, 6)),     # a weekend
+            (date(2026, 9, 11), date(2026, 9, 11)),   # the holiday
+            (date(2026, 8, 1), date(2026, 12, 31)),   # beyond the term
+        ], [self.first]), [9, 0, 0, 9])
+
+    def test_unknown_and_inverted_ranges(self):
+        self.assertEqual(self.count([
+            (None, date(2026, 9, 18)), (date(2026, 9, 7), None), (date(2026, 9, 18), date(2026, 9, 7)),
+        ], [self.first]), [0, 0, 0])
+        self.assertEqual(self.count([(date(2026, 9, 7), date(2026, 9, 18))], []), [0])
+
+    def test_window(self):
+        ranges = [(date(2026, 9, 7), date(2026, 9, 18)), (date(2026, 9, 7), date(2026, 9, 9))]
+        self.assertEqual(self.count(ranges, [self.first], (date(2026, 9, 14), None)), [5, 0])
+        self.assertEqual(self.count(ranges, [self.first], (date(2026, 9, 8), date(2026, 9, 15))), [5, 2])
+
+    def test_overlapping_calendars(self):
+        ranges = [(date(2026, 9, 7), date(2026, 9, 25)), (date(2026, 9, 11), date(2026, 9, 11))]
+        self.assertEqual(self.count(ranges, [self.first]), [9, 0])
+        self.assertEqual(self.count(ranges, [self.second]), [12, 1])
+        # The days of both calendars count once; the 11th is taught in the second.
+        self.assertEqual(self.count(ranges, [self.first, self.second]), [15, 1])
+        self.assertEqual(self.count(ranges, [self.first, self.first]), [9, 0])
+
+
+class SchoolWorkloadTests(TestCase):
+    """``school_workload`` adds the teaching days, sessions and hours up per subject and teacher."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region')
+        cls.school = School.objects.create(name='School', region=region, school_type=SchoolType.objects.create(name='Type'))
+        year = Year.objects.create(name='1')
+        cls.subject = Subject.objects.create(
+            name='Math', description='', year=year, region=region, school=cls.school, weekly_sessions=3,
+        )
+        Subject.objects.create(name='Art', description='', year=year, region=region, school=cls.school)
+        cls.school.calendars.all().delete()   # the default one created with the school
+        # Two calendars sharing their second week.
+        for academic_year, start, end in (('2026-2027', '2026-09-07', '2026-09-18'),
+                                          ('2026-2027', '2026-09-14', '2026-09-25')):
+            calendar = SchoolCalendar.objects.create(
+                school=cls.school, academic_year=academic_year, start_date=start, end_date=end,
+            )
+            Term.objects.create(calendar=calendar, name='First', start_date=start, end_date=end)
+        teacher = User.objects.create_user(username='teacher', first_name='Ana', last_name='Ruiz', school=cls.school)
+        module = Module.objects.create(
+            year=year, school=cls.school, subject=cls.subject, title='Module', session_length='1.5',
+            date_start='2026-09-07', date_end='2026-09-25',
+        )
+        module.teaching_staff.add(teacher)
+        Module.objects.create(year=year, school=cls.school, subject=cls.subject, title='Unplanned', session_length=1)
+
+    def test_totals(self):
+        subjects, teachers = school_workload(self.school.pk)
+        # 15 weekdays, counted once where the calendars overlap; 3 sessions a week of 1.5 hours.
+        totals = {'modules': 2, 'scheduled_modules': 1, 'teaching_days': 15, 'sessions': 9.0, 'hours': 13.5}
+        self.assertEqual([row['name'] for row in subjects], ['Art', 'Math'])
+        self.assertEqual({key: subjects[1][key] for key in totals}, totals)
+        self.assertEqual(subjects[0]['modules'], 0)
+        self.assertEqual(len(teachers), 1)
+        self.assertEqual(teachers[0]['name'], 'Ana Ruiz')
+        self.assertEqual(
+            {key: teachers[0][key] for key in totals},
+            {'modules': 1, 'scheduled_modules': 1, 'teaching_days': 15, 'sessions': 9.0, 'hours': 13.5},
+        )
+
+    def test_window(self):
+        subjects, _ = school_workload(self.school.pk, (date(2026, 9, 21), None))
+        self.assertEqual((subjects[1]['teaching_days'], subjects[1]['hours']), (5, 4.5))
@@ -0,0 +1,322 @@
+# core/tracing.py
+"""
+Request tracing.
+
+``TracingMiddleware`` starts a trace for a sampled request and every
+instrumented layer below it adds a nested span:
+
+- ``middleware`` / ``middleware.response``: time spent in the middleware
+  stack before the view and after it returned
+- ``view <ViewClass>``, ``parse``, ``authentication``, ``permission``,
+  ``permission.object`` and ``render`` for DRF views
+- ``<Serializer>.to_representation`` for every serialized object, and
+  ``<Serializer>.<method>`` for ``SerializerMethodField`` values such as
+  ``SchoolSerializer.get_years``
+- ``db.query`` for every SQL statement, including those run from
+  ``fan_out`` worker threads
+
+An incoming W3C ``traceparent`` header continues the caller's trace.
+Requests are sampled with probability ``TRACING_SAMPLE_RATE``; the
+caller's sampled flag only forces sampling when
+``TRACING_TRUST_TRACEPARENT`` is set (behind a gateway that strips the
+header from outside traffic), so clients cannot flood the exporter.
+Unsampled requests only pay for one context variable lookup per hook. The trace id is returned in the ``traceparent``
+and ``X-Trace-Id`` response headers.
+
+Finished traces are exported from a background thread as OTLP/JSON,
+either appended to ``TRACING_FILE`` (one ``ExportTraceServiceRequest``
+per line, readable by the collector's ``otlpjsonfile`` receiver) or
+posted to the OTLP/HTTP endpoint ``TRACING_OTLP_ENDPOINT``. The file is
+rotated to ``TRACING_FILE.1`` once it exceeds ``TRACING_FILE_MAX_BYTES``,
+so it never holds more than twice that much query text.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+
+from django.conf import settings
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.serializers import ListSerializer, Serializer, SerializerMethodField
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+current_span = contextvars.ContextVar('current_span', default=None)
+
+TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+SERVICE_NAME = 'sofia-backend'
+STATEMENT_MAX_LENGTH = 2000
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+
+class Trace:
+    """Spans of one request, shared by every thread working on it."""
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.spans = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            if len(self.spans) >= getattr(settings, 'TRACING_MAX_SPANS', 2000):
+                self.dropped += 1
+                return False
+            self.spans.append(span)
+            return True
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, trace, name, parent_id=None, kind=INTERNAL, attributes=None, start_ns=None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def end(self, end_ns=None):
+        self.end_ns = end_ns or time.time_ns()
+
+    def traceparent(self):
+        return f'00-{self.trace.trace_id}-{self.span_id}-01'
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or self.start_ns),
+            'attributes': [{'key': key, 'value': otlp_value(value)} for key, value in self.attributes.items()],
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.error:
+            span['status'] = {'code': 2, 'message': self.error}
+        return span
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+@contextlib.contextmanager
+def span(name, kind=INTERNAL, **attributes):
+    """
+    Run the block in a child of the current span. A no-op outside a sampled
+    trace or once the trace holds ``TRACING_MAX_SPANS`` spans.
+    """
+    parent = current_span.get()
+    child = Span(parent.trace, name, parent.span_id, kind, attributes) if parent is not None else None
+    if child is None or not parent.trace.add(child):
+        yield None
+        return
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.error = f'{type(exc).__name__}: {exc}'[:200]
+        raise
+    finally:
+        child.end()
+        current_span.reset(token)
+
+
+def start_trace(request):
+    """The root span for ``request``, or None when it is not sampled."""
+    match = TRACEPARENT_RE.match(request.headers.get('traceparent', ''))
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        forced = settings.TRACING_TRUST_TRACEPARENT and int(flags, 16) & 1
+        sampled = forced or random.random() < settings.TRACING_SAMPLE_RATE
+    else:
+        trace_id, parent_id = None, None
+        sampled = random.random() < settings.TRACING_SAMPLE_RATE
+    if not sampled:
+        return None
+    trace = Trace(trace_id or os.urandom(16).hex())
+    root = Span(trace, f'{request.method} {request.path}', parent_id, SERVER, {
+        'http.method': request.method,
+        'http.target': request.get_full_path(),
+    })
+    trace.add(root)
+    return root
+
+
+def finish_trace(root, view_started_ns=None):
+    """End the root span, add the middleware spans and queue the trace for export."""
+    root.end()
+    trace = root.trace
+    if view_started_ns:
+        view_ended_ns = max(
+            (child.end_ns for child in trace.spans if child.parent_id == root.span_id and child.end_ns), default=None,
+        )
+        middleware = Span(trace, 'middleware', root.span_id, start_ns=root.start_ns)
+        middleware.end(view_started_ns)
+        trace.add(middleware)
+        if view_ended_ns and view_ended_ns < root.end_ns:
+            response_middleware = Span(trace, 'middleware.response', root.span_id, start_ns=view_ended_ns)
+            response_middleware.end(root.end_ns)
+            trace.add(response_middleware)
+    if trace.dropped:
+        root.attributes['tracing.dropped_spans'] = trace.dropped
+    exporter.export(trace)
+
+
+class Exporter:
+    """Queues finished traces and writes them in batches from a daemon thread."""
+
+    def __init__(self, maxsize=1000, interval=2.0):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.interval = interval
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def export(self, trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            logger.warning('Trace export queue is full; dropping trace %s', trace.trace_id)
+            return
+        if self._thread is None or not self._thread.is_alive():
+            with self._thread_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='trace-export', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Exporting traces failed')
+
+    def flush(self):
+        """Write every queued trace now."""
+        with self._write_lock:
+            batch = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch:
+                self.write(batch)
+
+    def write(self, traces):
+        payload = json.dumps(otlp_request(traces), separators=(',', ':'))
+        if settings.TRACING_EXPORTER == 'otlp':
+            request = urllib.request.Request(
+                settings.TRACING_OTLP_ENDPOINT, data=payload.encode(), method='POST',
+                headers={'Content-Type': 'application/json'},
+            )
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+        else:
+            path = settings.TRACING_FILE
+            try:
+                if os.path.getsize(path) + len(payload) > settings.TRACING_FILE_MAX_BYTES:
+                    os.replace(path, f'{path}.1')
+            except FileNotFoundError:
+                pass
+            with open(path, 'a') as handle:
+                handle.write(payload + '\n')
+
+
+def otlp_request(traces):
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}},
+                {'key': 'process.pid', 'value': {'intValue': str(os.getpid())}},
+            ]},
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': [item.to_otlp() for trace in traces for item in trace.spans],
+            }],
+        }],
+    }
+
+
+exporter = Exporter()
+
+
+def trace_query(execute, sql, params, many, context):
+    """Execute wrapper adding a ``db.query`` span inside sampled traces."""
+    if current_span.get() is None:
+        return execute(sql, params, many, context)
+    connection = context['connection']
+    with span('db.query', CLIENT, **{
+        'db.system': connection.vendor,
+        'db.name': connection.alias,
+        'db.statement': sql[:STATEMENT_MAX_LENGTH],
+        'db.executemany': bool(many),
+    }):
+        return execute(sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    """``connection_created`` receiver adding ``trace_query`` once."""
+    if trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, trace_query)
+
+
+def _traced(original, name):
+    """Wrap ``original`` in a span named ``name(self)`` when a trace is active."""
+    @functools.wraps(original)
+    def wrapper(self, *args, **kwargs):
+        if current_span.get() is None:
+            return original(self, *args, **kwargs)
+        with span(name(self)):
+            return original(self, *args, **kwargs)
+    wrapper.__traced__ = True
+    return wrapper
+
+
+_HOOKS = [
+    (APIView, 'dispatch', lambda view: f'view {type(view).__name__}'),
+    (APIView, 'perform_authentication', lambda view: 'authentication'),
+    (APIView, 'check_permissions', lambda view: 'permission'),
+    (APIView, 'check_object_permissions', lambda view: 'permission.object'),
+    (Request, '_parse', lambda request: 'parse'),
+    (Serializer, 'to_representation', lambda serializer: f'{type(serializer).__name__}.to_representation'),
+    (ListSerializer, 'to_representation', lambda serializer: f'{type(serializer.child).__name__}[].to_representation'),
+    (SerializerMethodField, 'to_representation', lambda field: f'{type(field.parent).__name__}.{field.method_name}'),
+    (Response, 'render', lambda response: 'render'),
+]
+
+
+def install_hooks():
+    """Wrap the DRF methods in ``_HOOKS``; called once from ``CoreConfig.ready``."""
+    for cls, attribute, name in _HOOKS:
+        original = getattr(cls, attribute)
+        if not getattr(original, '__traced__', False):
+            setattr(cls, attribute, _traced(original, name))
@@ -0,0 +1,199 @@
+# core/unit_allocation.py
+"""
+Automatic start and end dates for planning units.
+
+A subject's planning units are taught in ``unit_number`` order. Each
+module of a unit's learning situation is one class session of
+``session_length`` hours; a unit without modules is given one week of
+sessions. The subject meets ``weekly_sessions`` times a week, so a unit
+of ``n`` sessions lasts ``n * 5 / weekly_sessions`` teaching days.
+
+Teaching days are the weekdays of the calendar's terms that are not a
+``NonTeachingDay``. Terms that follow each other without a gap form one
+block. Units are laid end to end, the next one starting the teaching day
+after the previous one ends. A unit that would mostly fall after the
+holidays at the end of a block starts after them instead (the previous
+unit then runs until the end of its block); otherwise it spans them.
+Fractional days are carried over, so rounding does not drift over the
+year. Units that do not fit in the calendar at all are left without
+dates.
+
+``allocate_school`` reads a school's units, their module counts and the
+calendar in a handful of queries, allocates every subject in memory and
+writes the changed dates back with a single ``UPDATE ... FROM unnest()``.
+"""
+import math
+from datetime import date, timedelta
+from decimal import Decimal
+from fractions import Fraction
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Sum
+
+from .events import publish_change
+from .models import LearningSituation, NonTeachingDay, PlanningUnit, SchoolCalendar, Subject
+
+DAYS_PER_WEEK = 5
+
+UPDATE_SQL = """
+UPDATE {unit} unit SET start_date = new.start_date, end_date = new.end_date
+FROM unnest(%s::uuid[], %s::date[], %s::date[]) AS new(id, start_date, end_date)
+WHERE unit.id = new.id
+"""
+
+
+def calendar_for(school_id, on=None):
+    """
+    The school calendar to plan in: the one running ``on`` (default
+    today), else the next one to start, else the latest.
+    """
+    on = on or date.today()
+    calendars = SchoolCalendar.objects.filter(school_id=school_id)
+    return (
+        calendars.filter(start_date__lte=on, end_date__gte=on).order_by('-start_date').first()
+        or calendars.filter(start_date__gt=on).order_by('start_date').first()
+        or calendars.order_by('-start_date').first()
+    )
+
+
+def term_spans(terms):
+    """``terms`` (``(start_date, end_date)`` pairs) merged where they overlap or follow each other."""
+    spans = []
+    for start, end in sorted(terms):
+        if start > end:
+            continue
+        if spans and start <= spans[-1][1] + timedelta(days=1):
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([start, end])
+    return [tuple(span) for span in spans]
+
+
+def teaching_blocks(terms, non_teaching_days):
+    """
+    Teaching days of ``terms`` (``(start_date, end_date)`` pairs) without
+    weekends and ``non_teaching_days``, as a list of blocks of consecutive
+    terms, each a list of dates.
+    """
+    blocks = []
+    for start, end in term_spans(terms):
+        days = (start + timedelta(days=offset) for offset in range((end - start).days + 1))
+        block = [day for day in days if day.weekday() < DAYS_PER_WEEK and day not in non_teaching_days]
+        if block:
+            blocks.append(block)
+    return blocks
+
+
+def allocate(units, weekly_sessions, blocks):
+    """
+    ``{unit_id: (start_date, end_date)}`` for ``units`` (``(unit_id,
+    sessions)`` in teaching order), ``None`` for the units that do not fit.
+    """
+    days = [day for block in blocks for day in block]
+    bounds, offset = [], 0
+    for block in blocks:
+        bounds.append((offset, offset + len(block)))
+        offset += len(block)
+
+    dates = {unit_id: None for unit_id, _ in units}
+    placed = []   # [unit_id, start, end] as indexes in days
+    position, block = Fraction(0), 0
+    for unit_id, sessions in units:
+        length = Fraction(sessions * DAYS_PER_WEEK, weekly_sessions)
+        start, previous_end = math.ceil(position), None
+        while block < len(bounds) and start >= bounds[block][1]:
+            block += 1
+        if block + 1 < len(bounds):
+            block_start, block_end = bounds[block]
+            if start > block_start and (block_end - start) * 2 < length:
+                # Start afresh in the next block; the previous unit fills this one.
+                previous_end = block_end - 1
+                block += 1
+                start = bounds[block][0]
+                position = Fraction(start)
+        position += length
+        if math.ceil(position) <= start:
+            # Shorter than what is left of its first day: it still gets the day.
+            position = Fraction(start + 1)
+        end = math.ceil(position) - 1
+        if end >= len(days):
+            break
+        if previous_end is not None and placed:
+            placed[-1][2] = previous_end
+        while end >= bounds[block][1]:
+            block += 1
+        placed.append([unit_id, start, end])
+    for unit_id, start, end in placed:
+        dates[unit_id] = (days[start], days[end])
+    return dates
+
+
+@transaction.atomic
+def allocate_school(school_id, calendar=None, subject_ids=None, dry_run=False):
+    """
+    Allocate the planning units of every subject of the school (or of
+    ``subject_ids``) in ``calendar`` (default ``calendar_for``) and save
+    the dates unless ``dry_run``. Returns ``(calendar, units)``, where
+    ``units`` lists, per unit in subject and unit order, its id, subject,
+    unit number, sessions, hours and new dates (``None`` if it did not
+    fit).
+    """
+    calendar = calendar or calendar_for(school_id)
+    if calendar is None:
+        return None, []
+    subjects = Subject.objects.filter(school_id=school_id)
+    if subject_ids is not None:
+        subjects = subjects.filter(pk__in=subject_ids)
+    weekly_sessions = dict(subjects.values_list('id', 'weekly_sessions'))
+    units = list(
+        PlanningUnit.objects.filter(subject_id__in=list(weekly_sessions)).select_for_update()
+        .order_by('subject_id', 'unit_number').only('id', 'subject_id', 'unit_number', 'learning_situation_id',
+                                                    'start_date', 'end_date')
+    )
+    workload = {
+        row['id']: (row['sessions'], row['hours'] or Decimal(0))
+        for row in LearningSituation.objects.filter(subject_id__in=list(weekly_sessions))
+            .annotate(sessions=Count('modules'), hours=Sum('modules__session_length'))
+            .values('id', 'sessions', 'hours')
+    }
+    blocks = teaching_blocks(
+        calendar.terms.values_list('start_date', 'end_date'),
+        set(NonTeachingDay.objects.filter(calendar=calendar).values_list('date', flat=True)),
+    )
+
+    by_subject = {}
+    for unit in units:
+        by_subject.setdefault(unit.subject_id, []).append(unit)
+    result, changed = [], []
+    for subject_id, subject_units in by_subject.items():
+        sessions = {}
+        for unit in subject_units:
+            count, _ = workload.get(unit.learning_situation_id, (0, 0))
+            sessions[unit.pk] = count or weekly_sessions[subject_id]
+        dates = allocate([(unit.pk, sessions[unit.pk]) for unit in subject_units], weekly_sessions[subject_id], blocks)
+        for unit in subject_units:
+            start_date, end_date = dates[unit.pk] or (None, None)
+            if (unit.start_date, unit.end_date) != (start_date, end_date):
+                unit.start_date, unit.end_date = start_date, end_date
+                changed.append(unit)
+            result.append({
+                'id': unit.pk,
+                'subject': subject_id,
+                'unit_number': unit.unit_number,
+                'sessions': sessions[unit.pk],
+                'hours': workload.get(unit.learning_situation_id, (0, Decimal(0)))[1],
+                'start_date': start_date,
+                'end_date': end_date,
+            })
+
+    if changed and not dry_run:
+        with connections[router.db_for_write(PlanningUnit)].cursor() as cursor:
+            cursor.execute(UPDATE_SQL.format(unit=PlanningUnit._meta.db_table), [
+                [unit.pk for unit in changed],
+                [unit.start_date for unit in changed],
+                [unit.end_date for unit in changed],
+            ])
+        # The update bypasses the post_save signal, so announce the new dates per subject.
+        for subject_id in sorted({unit.subject_id for unit in changed}, key=str):
+            publish_change('planningunit', 'allocated', subject_id, school_id, subject_id)
+    return calendar, result
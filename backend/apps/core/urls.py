@@ -7,10 +7,13 @@ from .views import (
     YearRetrieveUpdateDestroyAPIView,
     SubjectListCreateAPIView,
     SubjectRetrieveUpdateDestroyAPIView,
+    SubjectFetchByIdsAPIView,
     LearningSituationListCreateAPIView,
     LearningSituationRetrieveUpdateDestroyAPIView,
+    LearningSituationFetchByIdsAPIView,
     ModuleListCreateAPIView,
     ModuleRetrieveUpdateDestroyAPIView,
+    ModuleFetchByIdsAPIView,
     SchoolDetailView,
     SubjectCreateAPIView,
     LearningSituationCreateAPIView,
@@ -24,12 +27,27 @@ from .views import (
     PlanningUnitRetrieveUpdateDestroyAPIView,
     PlanningUnitBulkUpdateAPIView,
     SpecificCompetencesListAPIView,
+    SpecificCompetencesFetchByIdsAPIView,
     FileUploadView,
+    BatchAPIView,
+    DatabasePoolStatsAPIView,
+    ProfileReportAPIView,
+    change_event_stream,
+    SubjectPlannerView,
+    SubjectCoverageView,
+    SchoolCoverageView,
+    SubjectCoverageRecommendationsView,
+    SimilarModulesView,
+    SchoolScheduleConflictsView,
+    NonTeachingDayViewSet,
+    PlanningUnitAllocateAPIView,
+    SchoolTeachingHoursView,
 )
 
 router = DefaultRouter()
 router.register(r'school-calendars', SchoolCalendarViewSet, basename='school-calendar')
 router.register(r'terms', TermViewSet, basename='term')
+router.register(r'non-teaching-days', NonTeachingDayViewSet, basename='non-teaching-day')
 router.register(r'scheduled-situations', ScheduledLearningSituationViewSet, basename='scheduled-situation')
 
 urlpatterns = [
@@ -44,6 +62,16 @@ urlpatterns = [
     path('learning-situations/<uuid:pk>/', LearningSituationRetrieveUpdateDestroyAPIView.as_view(), name='learning-situation-detail'),
     path('modules/', ModuleListCreateAPIView.as_view(), name='module-list-create'),
     path('modules/<uuid:pk>/', ModuleRetrieveUpdateDestroyAPIView.as_view(), name='module-detail'),
+    path('modules/<uuid:pk>/similar/', SimilarModulesView.as_view(), name='module-similar'),
+    path('subjects/<uuid:pk>/planner/', SubjectPlannerView.as_view(), name='subject-planner'),
+    path('subjects/<uuid:pk>/coverage/', SubjectCoverageView.as_view(), name='subject-coverage'),
+    path('subjects/<uuid:pk>/coverage/recommendations/', SubjectCoverageRecommendationsView.as_view(), name='subject-coverage-recommendations'),
+    path('schools/<uuid:pk>/coverage/', SchoolCoverageView.as_view(), name='school-coverage'),
+    path('schools/<uuid:pk>/schedule-conflicts/', SchoolScheduleConflictsView.as_view(), name='school-schedule-conflicts'),
+    path('schools/<uuid:pk>/teaching-hours/', SchoolTeachingHoursView.as_view(), name='school-teaching-hours'),
+    path('subjects/fetch/', SubjectFetchByIdsAPIView.as_view(), name='subject-fetch'),
+    path('learning-situations/fetch/', LearningSituationFetchByIdsAPIView.as_view(), name='learning-situation-fetch'),
+    path('modules/fetch/', ModuleFetchByIdsAPIView.as_view(), name='module-fetch'),
     path('subjects/create/', SubjectCreateAPIView.as_view(), name='subject-create'),
     path('learning-situations/create/', LearningSituationCreateAPIView.as_view(), name='learning-situation-create'),
     path('modules/create/', ModuleCreateAPIView.as_view(), name='module-create'),
@@ -54,8 +82,14 @@ urlpatterns = [
     path('planning-units/', PlanningUnitListCreateAPIView.as_view(), name='planning-unit-list-create'),
     path('planning-units/<uuid:pk>/', PlanningUnitRetrieveUpdateDestroyAPIView.as_view(), name='planning-unit-detail'),
     path('planning-units/bulk-update/', PlanningUnitBulkUpdateAPIView.as_view(), name='planning-unit-bulk-update'),
+    path('planning-units/allocate/', PlanningUnitAllocateAPIView.as_view(), name='planning-unit-allocate'),
     
     # Add URLs for specific competences and file upload
     path('specific-competences/', SpecificCompetencesListAPIView.as_view(), name='specific-competences-list'),
+    path('specific-competences/fetch/', SpecificCompetencesFetchByIdsAPIView.as_view(), name='specific-competences-fetch'),
     path('file-upload/', FileUploadView.as_view(), name='file-upload'),
+    path('batch/', BatchAPIView.as_view(), name='batch'),
+    path('db-pool-stats/', DatabasePoolStatsAPIView.as_view(), name='db-pool-stats'),
+    path('profiles/<uuid:pk>/', ProfileReportAPIView.as_view(), name='profile-report'),
+    path('events/', change_event_stream, name='change-events'),
 ]
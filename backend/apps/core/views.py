@@ -1,16 +1,19 @@
 # core/views.py
 from rest_framework import generics
 from django.views.generic.detail import DetailView
-from .models import School, Year, Subject, LearningSituation, Module, Region, SchoolCalendar, Term, ScheduledLearningSituation, PlanningUnit, SpecificCompetences
+from .mixins import DynamicFieldsViewMixin, FetchByIdsMixin, FetchByIdsPostMixin, ReferenceCacheMixin, SchoolScopedMixin
+from .models import School, Year, Subject, LearningSituation, Module, Region, SchoolCalendar, Term, NonTeachingDay, ScheduledLearningSituation, PlanningUnit, SpecificCompetences, CoverageSummary, ModuleSignature
 from .serializers import (
     SchoolSerializer,
     YearSerializer,
+    YearCountSerializer,
     SubjectSerializer,
     LearningSituationSerializer,
     ModuleSerializer,
     RegionSerializer,
     SchoolCalendarSerializer,
     TermSerializer,
+    NonTeachingDaySerializer,
     ScheduledLearningSituationSerializer,
     PlanningUnitSerializer,
     SpecificCompetencesSerializer,
@@ -18,54 +21,119 @@ from .serializers import (
 from django.contrib.auth import authenticate
 
 from rest_framework.generics import CreateAPIView
-from rest_framework.permissions import IsAuthenticated, DjangoModelPermissions
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, DjangoModelPermissions
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from django.db import transaction
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.views import APIView
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db.models import Count, F, Prefetch, Q, Subquery
+from django.urls import Resolver404, resolve
+from django.utils.dateparse import parse_date
+from django.views import View
+from .async_utils import authenticate_request, fan_out, release_connections
+from . import duplicates
+from .coverage import compute_coverage, coverage_report, coverage_stats
+from .dbpool import pool_stats
+from .events import channels_for, get_broker, publish_change
+from .metrics import UPLOAD_SIZE, HasMetricsToken, PrometheusRenderer, exposition
+from .recommendations import candidate_covers, coverage_gaps, recommend
+from .reference_cache import reference_cache, school_catalog
+from .schedule_conflicts import KINDS as SCHEDULE_KINDS, conflicts as schedule_conflicts
+from .teaching_hours import school_workload
+from .unit_allocation import allocate_school
+import asyncio
+import csv
+import io
+import json
 import os
+import re
 from datetime import datetime
 import uuid
 
 # School endpoints
-class SchoolListCreateAPIView(generics.ListCreateAPIView):
+class SchoolListCreateAPIView(DynamicFieldsViewMixin, generics.ListCreateAPIView):
     queryset = School.objects.all()
     serializer_class = SchoolSerializer
 
-class SchoolRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class SchoolRetrieveUpdateDestroyAPIView(DynamicFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = School.objects.all()
     serializer_class = SchoolSerializer
 
 # Year endpoints
-class YearListCreateAPIView(generics.ListCreateAPIView):
-    queryset = Year.objects.all()
-    serializer_class = YearSerializer
+class SchoolYearTreeMixin:
+    """
+    Years with only the requesting user's subjects nested in them.
 
-class YearRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Year.objects.all()
-    serializer_class = YearSerializer
+    ``?counts=true`` returns a subject count per year instead of the
+    subjects themselves.
+    """
+
+    def wants_counts(self):
+        return self.request.query_params.get('counts', '').lower() in ('1', 'true', 'yes')
+
+    def get_queryset(self):
+        school_id = getattr(self.request.user, 'school_id', None)
+        if self.wants_counts():
+            return Year.objects.annotate(
+                subject_count=Count('subjects', filter=Q(subjects__school_id=school_id))
+            )
+        subjects = Subject.objects.filter(school_id=school_id).prefetch_related(
+            *SubjectSerializer.get_prefetch_lookups()
+        )
+        return Year.objects.prefetch_related(Prefetch('subjects', queryset=subjects))
+
+    def get_serializer_class(self):
+        if self.request.method == 'GET' and self.wants_counts():
+            return YearCountSerializer
+        return YearSerializer
+
+class YearListCreateAPIView(SchoolYearTreeMixin, ReferenceCacheMixin, generics.ListCreateAPIView):
+    reference_catalog = 'years'
+
+    def get_reference_catalog(self):
+        # The tree nests the subjects of the user's school, superuser or not,
+        # and their content counters change with every write in that school.
+        return school_catalog('years', getattr(self.request.user, 'school_id', None))
+
+    def get_reference_cache_key(self):
+        # Year and subject changes bump the shared catalog.
+        return f"{reference_cache.version('years')}:{super().get_reference_cache_key()}"
+
+class YearRetrieveUpdateDestroyAPIView(SchoolYearTreeMixin, generics.RetrieveUpdateDestroyAPIView):
+    pass
 
 # Subject endpoints
-class SubjectListCreateAPIView(generics.ListCreateAPIView):
+class SubjectListCreateAPIView(FetchByIdsMixin, SchoolScopedMixin, DynamicFieldsViewMixin, generics.ListCreateAPIView):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
     permission_classes = [IsAuthenticated, DjangoModelPermissions]    
 
-class SubjectRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class SubjectFetchByIdsAPIView(FetchByIdsPostMixin, SubjectListCreateAPIView):
+    pass
+
+class SubjectRetrieveUpdateDestroyAPIView(SchoolScopedMixin, DynamicFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
 
 # Learning Situation endpoints
-class LearningSituationListCreateAPIView(generics.ListCreateAPIView):
+class LearningSituationListCreateAPIView(FetchByIdsMixin, SchoolScopedMixin, DynamicFieldsViewMixin, generics.ListCreateAPIView):
     queryset = LearningSituation.objects.all()
     serializer_class = LearningSituationSerializer
     permission_classes = [IsAuthenticated, DjangoModelPermissions]
 
     def get_queryset(self):
-        queryset = LearningSituation.objects.all().prefetch_related('modules')
+        queryset = LearningSituation.objects.all()
         year = self.request.query_params.get('year', None)
         subject = self.request.query_params.get('subject', None)
 
@@ -74,10 +142,13 @@ class LearningSituationListCreateAPIView(generics.ListCreateAPIView):
         if subject:
             queryset = queryset.filter(subject_id=subject)
 
-        return queryset.order_by('-date_start') if queryset.exists() else queryset
+        return queryset.order_by('-date_start')
 
-class LearningSituationRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = LearningSituation.objects.all().prefetch_related('modules')
+class LearningSituationFetchByIdsAPIView(FetchByIdsPostMixin, LearningSituationListCreateAPIView):
+    pass
+
+class LearningSituationRetrieveUpdateDestroyAPIView(SchoolScopedMixin, DynamicFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = LearningSituation.objects.all()
     serializer_class = LearningSituationSerializer
     permission_classes = [IsAuthenticated, DjangoModelPermissions]
 
@@ -92,7 +163,7 @@ class LearningSituationRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestr
             raise
 
 # Module endpoints
-class ModuleListCreateAPIView(generics.ListCreateAPIView):
+class ModuleListCreateAPIView(FetchByIdsMixin, SchoolScopedMixin, DynamicFieldsViewMixin, generics.ListCreateAPIView):
     queryset = Module.objects.all()
     serializer_class = ModuleSerializer
     permission_classes = [IsAuthenticated, DjangoModelPermissions]
@@ -107,9 +178,12 @@ class ModuleListCreateAPIView(generics.ListCreateAPIView):
         if subject:
             queryset = queryset.filter(subject_id=subject)
 
-        return queryset.order_by('-date_start') if queryset.exists() else queryset
+        return queryset.order_by('-date_start')
+
+class ModuleFetchByIdsAPIView(FetchByIdsPostMixin, ModuleListCreateAPIView):
+    pass
 
-class ModuleRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class ModuleRetrieveUpdateDestroyAPIView(SchoolScopedMixin, DynamicFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Module.objects.all()
     serializer_class = ModuleSerializer
 
@@ -135,28 +209,29 @@ class SchoolDetailView(DetailView):
         return context;
 
 
-class SubjectCreateAPIView(CreateAPIView):
+class SubjectCreateAPIView(SchoolScopedMixin, CreateAPIView):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
     permission_classes = [IsAuthenticated, DjangoModelPermissions]
 
 
-class LearningSituationCreateAPIView(CreateAPIView):
+class LearningSituationCreateAPIView(SchoolScopedMixin, CreateAPIView):
     queryset = LearningSituation.objects.all()
     serializer_class = LearningSituationSerializer
     permission_classes = [IsAuthenticated, DjangoModelPermissions]
 
 
-class ModuleCreateAPIView(CreateAPIView):
+class ModuleCreateAPIView(SchoolScopedMixin, CreateAPIView):
     queryset = Module.objects.all()
     serializer_class = ModuleSerializer
     permission_classes = [IsAuthenticated, DjangoModelPermissions]
 
-class RegionListCreateAPIView(generics.ListCreateAPIView):
+class RegionListCreateAPIView(ReferenceCacheMixin, DynamicFieldsViewMixin, generics.ListCreateAPIView):
     queryset = Region.objects.all()
     serializer_class = RegionSerializer
+    reference_catalog = 'regions'
 
-class RegionRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class RegionRetrieveUpdateDestroyAPIView(DynamicFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Region.objects.all()
     serializer_class = RegionSerializer
 
@@ -174,6 +249,29 @@ class TermViewSet(ModelViewSet):
     def get_queryset(self):
         return Term.objects.filter(calendar__school__teaching_staff=self.request.user)
 
+class NonTeachingDayViewSet(ModelViewSet):
+    serializer_class = NonTeachingDaySerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = NonTeachingDay.objects.filter(calendar__school__teaching_staff=self.request.user)
+        calendar_id = self.request.query_params.get('calendar')
+        if calendar_id:
+            queryset = queryset.filter(calendar_id=calendar_id)
+        return queryset
+
+    def perform_create(self, serializer):
+        self._check_calendar(serializer.validated_data['calendar'])
+        serializer.save()
+
+    def perform_update(self, serializer):
+        self._check_calendar(serializer.validated_data.get('calendar', serializer.instance.calendar))
+        serializer.save()
+
+    def _check_calendar(self, calendar):
+        if not calendar.school.teaching_staff.filter(pk=self.request.user.pk).exists():
+            raise PermissionDenied('Calendar of another school.')
+
 class ScheduledLearningSituationViewSet(ModelViewSet):
     serializer_class = ScheduledLearningSituationSerializer
     permission_classes = [IsAuthenticated]
@@ -183,6 +281,25 @@ class ScheduledLearningSituationViewSet(ModelViewSet):
             learning_situation__school__teaching_staff=self.request.user
         )
 
+    def perform_create(self, serializer):
+        self._check_school(serializer.validated_data)
+        serializer.save()
+
+    def perform_update(self, serializer):
+        self._check_school(serializer.validated_data)
+        serializer.save()
+
+    def _check_school(self, data):
+        user = self.request.user
+        term = data.get('term')
+        if term is not None and not term.calendar.school.teaching_staff.filter(pk=user.pk).exists():
+            raise PermissionDenied('Term of another school.')
+        situation_id = data.get('learning_situation_id')
+        if situation_id is not None and not LearningSituation.objects.filter(
+            pk=situation_id, school__teaching_staff=user
+        ).exists():
+            raise PermissionDenied('Learning situation of another school.')
+
     @action(detail=False, methods=['post'])
     def reorder(self, request):
         term_id = request.data.get('term_id')
@@ -190,13 +307,17 @@ class ScheduledLearningSituationViewSet(ModelViewSet):
         
         with transaction.atomic():
             for index, situation_id in enumerate(new_order):
-                ScheduledLearningSituation.objects.filter(id=situation_id).update(order=index)
+                self.get_queryset().filter(id=situation_id).update(order=index)
+            # update() bypasses the post_save signal, so announce the new order explicitly.
+            school_id = Term.objects.filter(id=term_id).values_list('calendar__school_id', flat=True).first()
+            publish_change('scheduledlearningsituation', 'reordered', term_id, school_id)
         
         return Response({'status': 'success'})
 
-class PlanningUnitListCreateAPIView(generics.ListCreateAPIView):
+class PlanningUnitListCreateAPIView(SchoolScopedMixin, DynamicFieldsViewMixin, generics.ListCreateAPIView):
     serializer_class = PlanningUnitSerializer
     permission_classes = [IsAuthenticated, DjangoModelPermissions]
+    school_lookup = 'subject__school_id'
     
     def get_queryset(self):
         queryset = PlanningUnit.objects.all()
@@ -210,10 +331,11 @@ class PlanningUnitListCreateAPIView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save()
 
-class PlanningUnitRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class PlanningUnitRetrieveUpdateDestroyAPIView(SchoolScopedMixin, DynamicFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = PlanningUnit.objects.all()
     serializer_class = PlanningUnitSerializer
     permission_classes = [IsAuthenticated, DjangoModelPermissions]
+    school_lookup = 'subject__school_id'
 
 class PlanningUnitBulkUpdateAPIView(generics.GenericAPIView):
     serializer_class = PlanningUnitSerializer
@@ -237,12 +359,19 @@ class PlanningUnitBulkUpdateAPIView(generics.GenericAPIView):
             )
         
         try:
-            subject = Subject.objects.get(id=subject_id)
+            subject = Subject.objects.get(id=subject_id, school_id=request.user.school_id)
         except Subject.DoesNotExist:
             return Response(
                 {"error": "Subject not found"}, 
                 status=status.HTTP_404_NOT_FOUND
             )
+
+        situation_ids = {unit_data['learning_situation'] for unit_data in units_data if unit_data.get('learning_situation')}
+        if LearningSituation.objects.filter(pk__in=situation_ids, subject=subject).count() != len(situation_ids):
+            return Response(
+                {"error": "The learning situations must belong to the same subject as the planning units."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
             
         with transaction.atomic():
             updated_units = []
@@ -290,10 +419,60 @@ class PlanningUnitBulkUpdateAPIView(generics.GenericAPIView):
             serializer = self.get_serializer(updated_units, many=True)
             return Response(serializer.data)
 
+
+class PlanningUnitAllocateAPIView(generics.GenericAPIView):
+    """
+    Assign start and end dates to planning units from their sessions, the
+    subjects' ``weekly_sessions``, the terms and the non-teaching days (see
+    ``unit_allocation.py``). Allocates one ``subject`` or, without it, every
+    subject of the user's school; ``calendar`` picks the calendar (default:
+    the current or next one) and ``dry_run`` only returns the dates.
+    """
+    permission_classes = [IsAuthenticated, DjangoModelPermissions]
+
+    def get_queryset(self):
+        return PlanningUnit.objects.all()
+
+    def post(self, request, *args, **kwargs):
+        school_id = request.user.school_id
+        subject_id = request.data.get('subject')
+        calendar_id = request.data.get('calendar')
+        try:
+            if subject_id and not Subject.objects.filter(id=subject_id, school_id=school_id).exists():
+                return Response({"error": "Subject not found"}, status=status.HTTP_404_NOT_FOUND)
+            calendar = None
+            if calendar_id:
+                calendar = SchoolCalendar.objects.filter(id=calendar_id, school_id=school_id).first()
+                if calendar is None:
+                    return Response({"error": "Calendar not found"}, status=status.HTTP_404_NOT_FOUND)
+        except ValidationError:
+            return Response({"error": "Invalid subject or calendar"}, status=status.HTTP_400_BAD_REQUEST)
+
+        calendar, units = allocate_school(
+            school_id, calendar, [subject_id] if subject_id else None, bool(request.data.get('dry_run')),
+        )
+        if calendar is None:
+            return Response({"error": "The school has no calendar"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'calendar': calendar.pk,
+            'dry_run': bool(request.data.get('dry_run')),
+            'units': units,
+            'unallocated': sum(1 for unit in units if unit['start_date'] is None),
+        })
+
+
 # Add a view for specific competences
-class SpecificCompetencesListAPIView(generics.ListAPIView):
+class SpecificCompetencesListAPIView(ReferenceCacheMixin, FetchByIdsMixin, SchoolScopedMixin, DynamicFieldsViewMixin, generics.ListAPIView):
     serializer_class = SpecificCompetencesSerializer
     permission_classes = [IsAuthenticated]
+    reference_catalog = 'competences'
+
+    def get_scope_filter(self, school_id):
+        # Competences are regional: scope them to the region of the user's school.
+        return {'region_id': Subquery(School.objects.filter(id=school_id).values('region_id')[:1])}
+
+    def get_reference_cache_key(self):
+        return f'{self.get_scope_key()}:{super().get_reference_cache_key()}'
     
     def get_queryset(self):
         queryset = SpecificCompetences.objects.all()
@@ -308,15 +487,12 @@ class SpecificCompetencesListAPIView(generics.ListAPIView):
             # Apply filters based on query parameters
             if region:
                 queryset = queryset.filter(region_id=region)
-                print(f"After region filter: {queryset.count()} competences")
             
             if subject:
                 queryset = queryset.filter(subject_id=subject)
-                print(f"After subject filter: {queryset.count()} competences")
                 
             if year:
                 queryset = queryset.filter(year_id=year)
-                print(f"After year filter: {queryset.count()} competences")
                 
             return queryset
         except Exception as e:
@@ -334,6 +510,9 @@ class SpecificCompetencesListAPIView(generics.ListAPIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class SpecificCompetencesFetchByIdsAPIView(FetchByIdsPostMixin, SpecificCompetencesListAPIView):
+    pass
+
 # Add a view for file uploads
 class FileUploadView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
@@ -368,6 +547,7 @@ class FileUploadView(generics.CreateAPIView):
         with open(full_file_path, 'wb+') as destination:
             for chunk in file_obj.chunks():
                 destination.write(chunk)
+        UPLOAD_SIZE.observe(file_obj.size)
         
         # Return the file URL
         file_url = request.build_absolute_uri(settings.MEDIA_URL + file_path)
@@ -377,4 +557,631 @@ class FileUploadView(generics.CreateAPIView):
             'name': file_obj.name,
             'size': file_obj.size,
             'type': file_obj.content_type
-        })
\ No newline at end of file
+        })
+
+
+class DatabasePoolStatsAPIView(APIView):
+    """
+    Connection pool usage of the worker process that serves the request.
+
+    The counters are per process, not global: each poll may land on a
+    different worker (see ``dbpool.pool_stats``).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(pool_stats())
+
+
+class MetricsAPIView(APIView):
+    """
+    Prometheus metrics of all workers (see ``metrics.py``).
+
+    Scrapers authenticate with ``Authorization: Bearer <METRICS_TOKEN>``;
+    staff users can also read it with their API token.
+    """
+    permission_classes = [HasMetricsToken | IsAdminUser]
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request, *args, **kwargs):
+        return Response(exposition(), content_type=PrometheusRenderer.content_type)
+
+
+class ProfileReportAPIView(APIView):
+    """A report stored by ``ProfilingMiddleware``."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, pk, *args, **kwargs):
+        report = cache.get(f'profile:{pk}')
+        if report is None:
+            return Response({'error': 'Profile not found or expired'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(report)
+
+
+class BatchAborted(Exception):
+    def __init__(self, index, response):
+        self.index = index
+        self.response = response
+
+
+class BatchAPIView(APIView):
+    """
+    Run an ordered list of core API calls in one transaction.
+
+    Payload::
+
+        {"operations": [
+            {"method": "POST", "path": "learning-situations/", "body": {...}, "ref": "situation"},
+            {"method": "PATCH", "path": "modules/<uuid>/", "body": {"date_start": "2025-09-15"}},
+            {"method": "POST", "path": "planning-units/bulk-update/",
+             "body": {"subject": "<uuid>", "units": [{"unit_number": 1, "learning_situation": "$situation.id"}]}}
+        ]}
+
+    ``path`` is relative to ``/api/core/``. An operation with a ``ref`` can be
+    referenced by later ones as ``$<ref>.<field>``, either as a whole string
+    value in the body or inside the path. The request is authenticated once
+    and the user is handed to every sub-request; each sub-view still applies
+    its own permission classes. The first operation that fails rolls back
+    the whole batch.
+    """
+    permission_classes = [IsAuthenticated]
+    max_operations = 50
+    allowed_methods = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+    reference_pattern = re.compile(r'\$(\w+)\.(\w+)')
+
+    def post(self, request, *args, **kwargs):
+        operations = request.data.get('operations')
+        if not isinstance(operations, list) or not operations:
+            return Response({"error": "operations must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(operations) > self.max_operations:
+            return Response(
+                {"error": f"At most {self.max_operations} operations are allowed per batch"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        references = {}
+        results = []
+        try:
+            with transaction.atomic():
+                for index, operation in enumerate(operations):
+                    try:
+                        response = self.run_operation(request, operation, references)
+                    except ValueError as e:
+                        response = Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                    results.append({'status': response.status_code, 'data': response.data})
+                    if response.status_code >= 400:
+                        raise BatchAborted(index, response)
+                    if isinstance(operation, dict) and operation.get('ref'):
+                        references[operation['ref']] = response.data
+        except BatchAborted as e:
+            return Response(
+                {'failed_index': e.index, 'results': results},
+                status=e.response.status_code
+            )
+
+        return Response({'results': results})
+
+    def run_operation(self, request, operation, references):
+        if not isinstance(operation, dict):
+            raise ValueError("Each operation must be an object")
+        method = str(operation.get('method', '')).upper()
+        if method not in self.allowed_methods:
+            raise ValueError(f"Unsupported method: {method}")
+
+        path, _, query_string = str(operation.get('path', '')).lstrip('/').partition('?')
+        path = self.reference_pattern.sub(
+            lambda match: str(self.resolve_reference(match, references)), path
+        )
+        full_path = f'/api/core/{path}'
+        try:
+            match = resolve(full_path)
+        except Resolver404:
+            raise ValueError(f"Unknown path: {path}")
+        view_class = getattr(match.func, 'cls', None)
+        if view_class is None or not issubclass(view_class, APIView) or issubclass(view_class, BatchAPIView):
+            raise ValueError(f"Path cannot be used in a batch: {path}")
+
+        body = b''
+        if 'body' in operation:
+            body = json.dumps(
+                self.resolve_body(operation['body'], references), cls=DjangoJSONEncoder
+            ).encode()
+        environ = {
+            key: value for key, value in request.META.items()
+            if isinstance(value, str) and not key.startswith('wsgi.')
+        }
+        environ.update({
+            'REQUEST_METHOD': method,
+            'PATH_INFO': full_path,
+            'SCRIPT_NAME': '',
+            'QUERY_STRING': query_string,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+        })
+        sub_request = WSGIRequest(environ)
+        # Reuse the batch request's credentials instead of authenticating again.
+        sub_request._force_auth_user = request.user
+        sub_request._force_auth_token = request.auth
+        return match.func(sub_request, *match.args, **match.kwargs)
+
+    def resolve_body(self, value, references):
+        if isinstance(value, dict):
+            return {key: self.resolve_body(item, references) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.resolve_body(item, references) for item in value]
+        if isinstance(value, str):
+            match = self.reference_pattern.fullmatch(value)
+            if match:
+                return self.resolve_reference(match, references)
+        return value
+
+    def resolve_reference(self, match, references):
+        ref, field = match.groups()
+        if ref not in references:
+            raise ValueError(f"Unknown reference: {ref}")
+        data = references[ref]
+        if not isinstance(data, dict) or field not in data:
+            raise ValueError(f"Reference {ref} has no field {field}")
+        return data[field]
+
+
+
+async def change_event_stream(request):
+    """
+    Server-sent event stream of changes for the user's school.
+
+    ``?subject=<uuid>`` narrows the stream to one subject. Browsers'
+    ``EventSource`` cannot send headers, so the token may be passed as
+    ``?token=`` as well as in the ``Authorization`` header. Needs the ASGI
+    application; under WSGI the response would never finish.
+    """
+    user = await authenticate_request(request, allow_query_token=True)
+    if user is None:
+        return JsonResponse({'detail': 'Invalid or missing token.'}, status=status.HTTP_401_UNAUTHORIZED)
+    if not user.school_id:
+        return JsonResponse({'error': 'User not associated with any school.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    subject_id = request.GET.get('subject')
+    if subject_id:
+        try:
+            exists = await Subject.objects.filter(id=subject_id, school_id=user.school_id).aexists()
+        except ValidationError:
+            exists = False
+        if not exists:
+            return JsonResponse({'error': 'Subject not found'}, status=status.HTTP_404_NOT_FOUND)
+    # The stream needs no database; don't keep a pooled connection until it ends.
+    await sync_to_async(release_connections)()
+
+    channel = channels_for(user.school_id, subject_id)[-1]
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT_SECONDS', 15)
+    broker = get_broker()
+
+    async def stream():
+        queue = broker.subscribe(channel)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f'event: change\ndata: {json.dumps(event)}\n\n'
+        finally:
+            broker.unsubscribe(channel, queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def subject_competences(subject_id):
+    """Competences of a subject for the subject's own year."""
+    return SpecificCompetences.objects.filter(
+        subject_id=subject_id,
+        year_id=Subquery(Subject.objects.filter(id=subject_id).values('year_id')[:1]),
+    )
+
+
+class SubjectPlannerView(View):
+    """
+    Everything the subject planner screen needs in one response: the
+    subject, its learning situations with their modules, its planning
+    units and the competences for its year. The four queries run
+    concurrently.
+    """
+
+    async def get(self, request, pk):
+        user = await authenticate_request(request)
+        if user is None:
+            return JsonResponse({'detail': 'Invalid or missing token.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        subject, situations, units, competences = await fan_out(
+            lambda: Subject.objects.filter(id=pk, school_id=user.school_id)
+                .prefetch_related(*SubjectSerializer.get_prefetch_lookups()).first(),
+            lambda: list(LearningSituation.objects.filter(subject_id=pk)
+                .prefetch_related(*LearningSituationSerializer.get_prefetch_lookups(['modules']))
+                .order_by('-date_start')),
+            lambda: list(PlanningUnit.objects.filter(subject_id=pk)
+                .select_related('learning_situation').order_by('unit_number')),
+            lambda: list(subject_competences(pk).select_related('subject', 'year')),
+        )
+        if subject is None:
+            return JsonResponse({'error': 'Subject not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        def serialize():
+            return {
+                'subject': SubjectSerializer(subject).data,
+                'learning_situations': LearningSituationSerializer(situations, many=True, expand=['modules']).data,
+                'planning_units': PlanningUnitSerializer(units, many=True).data,
+                'competences': SpecificCompetencesSerializer(competences, many=True).data,
+            }
+
+        return JsonResponse(await sync_to_async(serialize)(), encoder=DjangoJSONEncoder)
+
+
+class SubjectCoverageView(View):
+    """
+    Competence and criteria coverage of a subject by the modules used in
+    its learning situations.
+    """
+
+    async def get(self, request, pk):
+        user = await authenticate_request(request)
+        if user is None:
+            return JsonResponse({'detail': 'Invalid or missing token.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        exists, competences, modules = await fan_out(
+            lambda: Subject.objects.filter(id=pk, school_id=user.school_id).exists(),
+            lambda: list(subject_competences(pk).order_by('code')),
+            lambda: list(Module.objects.filter(
+                id__in=LearningSituation.modules.through.objects
+                    .filter(learningsituation__subject_id=pk).values('module_id')
+            ).values('id', 'specific_competences', 'selected_criteria')),
+        )
+        if not exists:
+            return JsonResponse({'error': 'Subject not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return JsonResponse(compute_coverage(competences, modules), encoder=DjangoJSONEncoder)
+
+
+class SchoolCoverageView(View):
+    """
+    Competence and criteria coverage of every subject of a school, read from
+    the ``CoverageSummary`` table (see ``coverage_summary.py``). Each subject
+    is reported like ``SubjectCoverageView``; ``?year=`` and ``?subject=``
+    narrow the report.
+    """
+
+    async def get(self, request, pk):
+        user = await authenticate_request(request)
+        if user is None:
+            return JsonResponse({'detail': 'Invalid or missing token.'}, status=status.HTTP_401_UNAUTHORIZED)
+        if user.school_id != pk:
+            return JsonResponse({'error': 'School not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        filters = {}
+        for param in ('year', 'subject'):
+            value = request.GET.get(param)
+            if value:
+                try:
+                    filters[f'{param}_id'] = uuid.UUID(value)
+                except ValueError:
+                    return JsonResponse({'error': f'Invalid {param}'}, status=status.HTTP_400_BAD_REQUEST)
+        subject_filters = {('id' if key == 'subject_id' else key): value for key, value in filters.items()}
+
+        subjects, competences, summary = await fan_out(
+            lambda: list(Subject.objects.filter(school_id=pk, **subject_filters)
+                .values('id', 'name', 'year_id', 'year__name').order_by('year__name', 'name')),
+            lambda: list(SpecificCompetences.objects
+                .filter(subject__school_id=pk, year_id=F('subject__year_id'),
+                        **{f'subject__{key}': value for key, value in subject_filters.items()})
+                .only('id', 'code', 'description', 'evaluation_criteria', 'subject_id').order_by('code')),
+            lambda: list(CoverageSummary.objects.filter(school_id=pk, **filters)
+                .values_list('subject_id', 'competence_id', 'criterion_id', 'module_count')),
+        )
+
+        competences_by_subject = {}
+        for competence in competences:
+            competences_by_subject.setdefault(competence.subject_id, []).append(competence)
+        counts = {}
+        for subject_id, competence_id, criterion_id, module_count in summary:
+            module_counts, criterion_counts = counts.setdefault(subject_id, ({}, {}))
+            if criterion_id:
+                criterion_counts[(str(competence_id), criterion_id)] = module_count
+            else:
+                module_counts[str(competence_id)] = module_count
+
+        subject_rows, competence_rows = [], []
+        for subject in subjects:
+            report = coverage_report(competences_by_subject.get(subject['id'], []), *counts.get(subject['id'], ({}, {})))
+            competence_rows.extend(report['competences'])
+            subject_rows.append({
+                'id': subject['id'],
+                'name': subject['name'],
+                'year': subject['year_id'],
+                'year_name': subject['year__name'],
+                **report,
+            })
+        return JsonResponse(
+            {'school': pk, 'subjects': subject_rows, 'stats': coverage_stats(competence_rows)},
+            encoder=DjangoJSONEncoder,
+        )
+
+
+class SubjectCoverageRecommendationsView(View):
+    """
+    Modules that would close the coverage gaps of a subject, ranked by the
+    greedy set cover in ``recommendations.py``.
+
+    ``?year=`` selects the competences (default: the subject's year),
+    ``?scope=school`` (default) or ``?scope=region`` the module library the
+    candidates come from, and ``?limit=`` the number of modules returned.
+    Modules already used in the subject's learning situations are never
+    recommended. Among equally useful modules those of the same subject
+    come first, then those of the same school.
+    """
+
+    MAX_LIMIT = 50
+
+    async def get(self, request, pk):
+        user = await authenticate_request(request)
+        if user is None:
+            return JsonResponse({'detail': 'Invalid or missing token.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        scope = request.GET.get('scope', 'school')
+        if scope not in ('school', 'region'):
+            return JsonResponse({'error': 'scope must be school or region'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.GET.get('limit', 10)), 1), self.MAX_LIMIT)
+            year_id = uuid.UUID(request.GET['year']) if request.GET.get('year') else None
+        except ValueError:
+            return JsonResponse({'error': 'Invalid year or limit'}, status=status.HTTP_400_BAD_REQUEST)
+
+        competences_query = (
+            SpecificCompetences.objects.filter(subject_id=pk, year_id=year_id) if year_id else subject_competences(pk)
+        )
+        subject, competences, summary = await fan_out(
+            lambda: Subject.objects.filter(id=pk, school_id=user.school_id)
+                .values('id', 'year_id', 'school_id', 'school__region_id').first(),
+            lambda: list(competences_query.only('id', 'code', 'evaluation_criteria').order_by('code')),
+            lambda: list(CoverageSummary.objects.filter(subject_id=pk)
+                .values_list('competence_id', 'criterion_id', 'module_count')),
+        )
+        if subject is None:
+            return JsonResponse({'error': 'Subject not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        module_counts, criterion_counts = {}, {}
+        for competence_id, criterion_id, module_count in summary:
+            if criterion_id:
+                criterion_counts[(str(competence_id), criterion_id)] = module_count
+            else:
+                module_counts[str(competence_id)] = module_count
+        gaps = coverage_gaps(competences, module_counts, criterion_counts)
+        keys = list(gaps)
+
+        def run():
+            picks = recommend(candidate_covers(keys, subject, scope), [gaps[key] for key in keys], limit)
+            details = {
+                row['id']: row for row in Module.objects.filter(id__in=[module_id for module_id, _, _ in picks])
+                    .values('id', 'title', 'subject_id', 'subject__name', 'school_id', 'school__name', 'year_id')
+            } if picks else {}
+            return picks, details
+
+        picks, details = await sync_to_async(run)()
+
+        codes = {}
+        for competence in competences:
+            codes[(str(competence.id), '')] = (competence.code, None)
+            for criterion in competence.evaluation_criteria or []:
+                codes[(str(competence.id), str(criterion.get('id')))] = (competence.code, criterion.get('code'))
+        recommendations = []
+        closed_weight = 0
+        for module_id, weight, numbers in picks:
+            module = details[module_id]
+            closed_weight += weight
+            recommendations.append({
+                'id': module_id,
+                'title': module['title'],
+                'subject': module['subject_id'],
+                'subject_name': module['subject__name'],
+                'school': module['school_id'],
+                'school_name': module['school__name'],
+                'year': module['year_id'],
+                'gain': weight,
+                'covers': [
+                    {
+                        'competence': competence_id,
+                        'competence_code': codes[(competence_id, criterion_id)][0],
+                        'criterion': criterion_id or None,
+                        'criterion_code': codes[(competence_id, criterion_id)][1],
+                    }
+                    for competence_id, criterion_id in (keys[number] for number in numbers)
+                ],
+            })
+        total_weight = sum(gaps.values())
+        return JsonResponse({
+            'subject': pk,
+            'year': year_id or subject['year_id'],
+            'scope': scope,
+            'gaps': len(gaps),
+            'gap_weight': total_weight,
+            'closed_gaps': sum(len(item['covers']) for item in recommendations),
+            'remaining_weight': max(total_weight - closed_weight, 0),
+            'recommendations': recommendations,
+        }, encoder=DjangoJSONEncoder)
+
+
+class SimilarModulesView(View):
+    """
+    Near-duplicates of a module, found through the MinHash/LSH signatures
+    in ``duplicates.py``. ``?scope=school`` (default) or ``?scope=region``
+    selects the library searched, ``?threshold=`` the minimum estimated
+    similarity (default 0.7) and ``?limit=`` the number of modules.
+    """
+
+    MAX_LIMIT = 100
+
+    async def get(self, request, pk):
+        user = await authenticate_request(request)
+        if user is None:
+            return JsonResponse({'detail': 'Invalid or missing token.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        scope = request.GET.get('scope', 'school')
+        if scope not in ('school', 'region'):
+            return JsonResponse({'error': 'scope must be school or region'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            threshold = float(request.GET.get('threshold', duplicates.DEFAULT_THRESHOLD))
+            limit = min(max(int(request.GET.get('limit', 20)), 1), self.MAX_LIMIT)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid threshold or limit'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < threshold <= 1:
+            return JsonResponse({'error': 'threshold must be in (0, 1]'}, status=status.HTTP_400_BAD_REQUEST)
+
+        def run():
+            module = (Module.objects.filter(id=pk, school_id=user.school_id)
+                .select_related('signature', 'school').only('id', 'title', 'description', 'specific_competences',
+                    'school__region_id', 'signature__signature').first())
+            if module is None:
+                return None, []
+            try:
+                signature = module.signature.signature
+            except ModuleSignature.DoesNotExist:
+                # Saved without signals; compute it now.
+                signature = duplicates.signature_for(module)
+            if signature is None:
+                return module, []
+            matches = duplicates.similar_to(
+                signature, duplicates.library(scope, user.school_id, module.school.region_id), threshold, exclude=pk,
+            )[:limit]
+            details = {
+                row['id']: row for row in Module.objects.filter(id__in=[module_id for module_id, _ in matches])
+                    .values('id', 'title', 'subject_id', 'subject__name', 'school_id', 'school__name', 'year_id',
+                            'specific_competences')
+            } if matches else {}
+            competences = set(module.specific_competences or ())
+            return module, [
+                {
+                    'id': module_id,
+                    'title': details[module_id]['title'],
+                    'subject': details[module_id]['subject_id'],
+                    'subject_name': details[module_id]['subject__name'],
+                    'school': details[module_id]['school_id'],
+                    'school_name': details[module_id]['school__name'],
+                    'year': details[module_id]['year_id'],
+                    'similarity': score,
+                    'shared_competences': len(competences & set(details[module_id]['specific_competences'] or ())),
+                }
+                for module_id, score in matches
+            ]
+
+        module, similar = await sync_to_async(run)()
+        if module is None:
+            return JsonResponse({'error': 'Module not found'}, status=status.HTTP_404_NOT_FOUND)
+        return JsonResponse(
+            {'module': pk, 'scope': scope, 'threshold': threshold, 'similar': similar},
+            encoder=DjangoJSONEncoder,
+        )
+
+
+class SchoolScheduleConflictsView(View):
+    """
+    Overlapping and out-of-term scheduled learning situations, planning
+    units and modules of a school (see ``schedule_conflicts.py``), in one
+    query. ``?subject=`` narrows the report to one subject and ``?kind=``
+    (repeatable: ``scheduled_situation``, ``planning_unit``, ``module``)
+    to some kinds of items.
+    """
+
+    async def get(self, request, pk):
+        user = await authenticate_request(request)
+        if user is None:
+            return JsonResponse({'detail': 'Invalid or missing token.'}, status=status.HTTP_401_UNAUTHORIZED)
+        if user.school_id != pk:
+            return JsonResponse({'error': 'School not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            subject_id = uuid.UUID(request.GET['subject']) if request.GET.get('subject') else None
+        except ValueError:
+            return JsonResponse({'error': 'Invalid subject'}, status=status.HTTP_400_BAD_REQUEST)
+        kinds = request.GET.getlist('kind') or SCHEDULE_KINDS
+        if set(kinds) - set(SCHEDULE_KINDS):
+            return JsonResponse(
+                {'error': f'kind must be one of {", ".join(SCHEDULE_KINDS)}'}, status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        rows = await sync_to_async(schedule_conflicts)(pk, subject_id, kinds)
+
+        overlaps, out_of_term = [], []
+        for issue, kind, subject, term, *item, other_id, other_title, other_start, other_end in rows:
+            first = dict(zip(('id', 'title', 'start_date', 'end_date'), item))
+            if issue == 'overlap':
+                overlaps.append({
+                    'kind': kind,
+                    'subject': subject,
+                    'term': term,
+                    'items': [first, {'id': other_id, 'title': other_title, 'start_date': other_start, 'end_date': other_end}],
+                    'overlap_start': max(first['start_date'], other_start),
+                    'overlap_end': min(first['end_date'], other_end),
+                })
+            else:
+                out_of_term.append({'kind': kind, 'reason': issue, 'subject': subject, 'term': term, **first})
+        return JsonResponse(
+            {'school': pk, 'overlaps': overlaps, 'out_of_term': out_of_term},
+            encoder=DjangoJSONEncoder,
+        )
+
+
+class SchoolTeachingHoursView(View):
+    """
+    Teaching days, sessions and hours of a school's modules added up per
+    subject and per teacher (see ``teaching_hours.py``). ``?start=`` and
+    ``?end=`` (YYYY-MM-DD) limit the count to a period, e.g. a term;
+    ``?format=csv`` downloads both tables as one CSV file.
+    """
+
+    COLUMNS = ('modules', 'scheduled_modules', 'teaching_days', 'sessions', 'hours')
+
+    async def get(self, request, pk):
+        user = await authenticate_request(request)
+        if user is None:
+            return JsonResponse({'detail': 'Invalid or missing token.'}, status=status.HTTP_401_UNAUTHORIZED)
+        if user.school_id != pk:
+            return JsonResponse({'error': 'School not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        window = []
+        for param in ('start', 'end'):
+            value = request.GET.get(param)
+            try:
+                day = parse_date(value) if value else None
+            except ValueError:
+                day = None
+            if value and day is None:
+                return JsonResponse({'error': f'Invalid {param}'}, status=status.HTTP_400_BAD_REQUEST)
+            window.append(day)
+
+        subjects, teachers = await sync_to_async(school_workload)(pk, tuple(window))
+
+        if request.GET.get('format') == 'csv':
+            response = HttpResponse(content_type='text/csv')
+            response['Content-Disposition'] = f'attachment; filename="teaching-hours-{pk}.csv"'
+            writer = csv.writer(response)
+            writer.writerow(('level', 'id', 'name', 'year') + self.COLUMNS)
+            for subject in subjects:
+                writer.writerow(('subject', subject['id'], subject['name'], subject['year_name'] or '')
+                                + tuple(subject[column] for column in self.COLUMNS))
+            for teacher in teachers:
+                writer.writerow(('teacher', teacher['id'], teacher['name'], '')
+                                + tuple(teacher[column] for column in self.COLUMNS))
+            return response
+
+        return JsonResponse({
+            'school': pk,
+            'start': window[0],
+            'end': window[1],
+            'total_hours': round(sum(subject['hours'] for subject in subjects), 2),
+            'subjects': subjects,
+            'teachers': teachers,
+        }, encoder=DjangoJSONEncoder)
@@ -0,0 +1,49 @@
+"""
+Gunicorn configuration for sofia_project.
+
+SERVER_MODE selects the serving profile:
+
+- ``asgi`` (default): uvicorn workers running ``sofia_project.asgi``. Needed
+  for the async aggregate views to overlap their queries and for the
+  server-sent change events.
+- ``wsgi``: classic synchronous workers running ``sofia_project.wsgi``.
+
+Workers keep their Prometheus metrics in ``PROMETHEUS_MULTIPROC_DIR`` so
+``/metrics`` can report all of them (see ``apps/core/metrics.py``). The
+directory is emptied when gunicorn starts.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+server_mode = os.environ.get('SERVER_MODE', 'asgi')
+
+if server_mode == 'wsgi':
+    wsgi_app = 'sofia_project.wsgi:application'
+    worker_class = 'sync'
+else:
+    wsgi_app = 'sofia_project.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# Keep idle connections open for the browser's sequential API calls.
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+accesslog = '-'
+
+# Set before the workers import prometheus_client, which reads it once.
+prometheus_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'sofia-prometheus'),
+)
+
+
+def on_starting(server):
+    shutil.rmtree(prometheus_dir, ignore_errors=True)
+    os.makedirs(prometheus_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,125 @@
+"""
+Load test for the aggregate endpoints (dashboard, subject planner, coverage).
+
+Runs a fixed number of concurrent clients for a fixed time against a
+running server and prints throughput and latency percentiles as JSON.
+Start the server once per profile and compare the two runs:
+
+    SERVER_MODE=wsgi gunicorn -c gunicorn.conf.py
+    SERVER_MODE=asgi gunicorn -c gunicorn.conf.py
+
+    python perf/aggregate_loadtest.py --base-url http://127.0.0.1:8000 \
+        --token <token> --subject <subject uuid> --label asgi
+
+Any other endpoint can be measured with ``--path`` (repeatable), e.g. to
+compare settings such as ``DB_POOL=True`` and ``DB_POOL=False``.
+
+Only the standard library is used so it runs anywhere the backend does.
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_client(base_url, token, paths, deadline, results, lock):
+    url = urlsplit(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    headers = {'Authorization': f'Token {token}'}
+    latencies = {path: [] for path in paths}
+    errors = 0
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            ok = False
+            conn.close()
+            conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        if ok:
+            latencies[path].append(time.perf_counter() - started)
+        else:
+            errors += 1
+    conn.close()
+    with lock:
+        for path, values in latencies.items():
+            results['latencies'].setdefault(path, []).extend(values)
+        results['errors'] += errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--subject', help='Subject used by the planner and coverage endpoints')
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='Request this path instead of the aggregate endpoints (repeatable)')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds to run')
+    parser.add_argument('--label', default='', help='Free text stored in the output, e.g. wsgi or asgi')
+    args = parser.parse_args()
+
+    if args.paths:
+        paths = args.paths
+    elif args.subject:
+        paths = [
+            '/api/auth/dashboard/',
+            f'/api/core/subjects/{args.subject}/planner/',
+            f'/api/core/subjects/{args.subject}/coverage/',
+        ]
+    else:
+        parser.error('either --subject or --path is required')
+    results = {'latencies': {}, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=run_client, args=(args.base_url, args.token, paths, deadline, results, lock))
+        for _ in range(args.concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in results['latencies'].values() for value in values]
+    summary = {
+        'label': args.label,
+        'concurrency': args.concurrency,
+        'duration_s': round(elapsed, 2),
+        'requests': len(all_latencies),
+        'errors': results['errors'],
+        'throughput_rps': round(len(all_latencies) / elapsed, 1),
+        'p50_ms': round(percentile(all_latencies, 0.50) * 1000, 1) if all_latencies else None,
+        'p95_ms': round(percentile(all_latencies, 0.95) * 1000, 1) if all_latencies else None,
+        'endpoints': {
+            path: {
+                'requests': len(values),
+                'p50_ms': round(percentile(values, 0.50) * 1000, 1) if values else None,
+                'p95_ms': round(percentile(values, 0.95) * 1000, 1) if values else None,
+            }
+            for path, values in results['latencies'].items()
+        },
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,8 @@ Base Django settings for sofia_project.
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
+import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -32,15 +33,22 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "apps.core.middleware.MetricsMiddleware",
+    "apps.core.middleware.TracingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # WhiteNoise with an async path; every entry here must be async capable
+    # or ASGI requests are handed to a thread around it.
+    "apps.core.middleware.StaticFilesMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "apps.core.middleware.ReplicaRoutingMiddleware",
+    "apps.core.middleware.ProfilingMiddleware",
+    "apps.core.middleware.ViewNameMiddleware",
 ]
 
 ROOT_URLCONF = "sofia_project.urls"
@@ -63,6 +71,109 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "sofia_project.wsgi.application"
 
+# Database connection pooling (psycopg 3 pool, per worker process).
+# Pooled connections are checked before being handed out when
+# CONN_HEALTH_CHECKS is on, and CONN_MAX_AGE must stay 0.
+DB_POOL_OPTIONS = {
+    'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+    'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+    # Seconds a request waits for a free connection before failing.
+    'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),
+    'max_idle': config('DB_POOL_MAX_IDLE', default=300, cast=float),
+    'max_lifetime': config('DB_POOL_MAX_LIFETIME', default=3600, cast=float),
+} if config('DB_POOL', default=True, cast=bool) else None
+
+# Queries an async aggregate view runs at once through fan_out, each on a
+# pooled connection of its own on top of the request's. Under ASGI one
+# worker serves many requests from the same pool, so keep
+# DB_POOL_MAX_SIZE well above this times the concurrent aggregate requests.
+AGGREGATE_QUERY_CONCURRENCY = config(
+    'AGGREGATE_QUERY_CONCURRENCY', default=max(1, DB_POOL_OPTIONS['max_size'] // 5) if DB_POOL_OPTIONS else 2, cast=int,
+)
+
+# Read replicas: one alias per URL in DB_REPLICA_URLS (replica_0, replica_1,
+# ...). Safe requests read from them; a client's reads stay on the primary
+# for REPLICA_PIN_SECONDS after it writes.
+DATABASE_ROUTERS = ['apps.core.db_routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
+
+def replica_databases(primary):
+    """Database entries for DB_REPLICA_URLS, sharing the primary's connection settings."""
+    replicas = {}
+    for index, url in enumerate(config('DB_REPLICA_URLS', default='', cast=Csv())):
+        replica = dj_database_url.parse(
+            url,
+            conn_max_age=primary.get('CONN_MAX_AGE', 0),
+            conn_health_checks=primary.get('CONN_HEALTH_CHECKS', False),
+        )
+        replica['OPTIONS'] = {**primary.get('OPTIONS', {}), **replica.get('OPTIONS', {})}
+        # Tests run against the primary only.
+        replica['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica_{index}'] = replica
+    return replicas
+
+
+# Shared cache. Redis when CACHE_REDIS_URL is set (needs the redis
+# package), otherwise the database cache table (manage.py createcachetable).
+if config('CACHE_REDIS_URL', default=''):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config('CACHE_REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
+# Reference catalog cache (apps/core/reference_cache.py): per-process LRU
+# size, how often each process re-reads catalog versions, and entry lifetime.
+REFERENCE_CACHE_SIZE = config('REFERENCE_CACHE_SIZE', default=512, cast=int)
+REFERENCE_CACHE_VERSION_TTL = config('REFERENCE_CACHE_VERSION_TTL', default=2, cast=float)
+REFERENCE_CACHE_TIMEOUT = config('REFERENCE_CACHE_TIMEOUT', default=86400, cast=int)
+
+# On-demand profiling for staff (?__profile=1, see apps/core/profiling.py):
+# how long reports are kept, how many functions they list and how many
+# application frames are recorded per SQL statement.
+PROFILE_REPORT_TIMEOUT = config('PROFILE_REPORT_TIMEOUT', default=3600, cast=int)
+PROFILE_TOP_FUNCTIONS = config('PROFILE_TOP_FUNCTIONS', default=40, cast=int)
+PROFILE_STACK_DEPTH = config('PROFILE_STACK_DEPTH', default=3, cast=int)
+
+# Slow-query log (apps/core/slow_queries.py): queries slower than the
+# threshold are aggregated by fingerprint and written to the
+# apps.core.slow_queries logger every SLOW_QUERY_FLUSH_SECONDS.
+SLOW_QUERY_LOG = config('SLOW_QUERY_LOG', default=True, cast=bool)
+SLOW_QUERY_THRESHOLD_MS = config('SLOW_QUERY_THRESHOLD_MS', default=200, cast=float)
+SLOW_QUERY_REDACT_PARAMS = config('SLOW_QUERY_REDACT_PARAMS', default=True, cast=bool)
+SLOW_QUERY_FLUSH_SECONDS = config('SLOW_QUERY_FLUSH_SECONDS', default=60, cast=float)
+SLOW_QUERY_MAX_FINGERPRINTS = config('SLOW_QUERY_MAX_FINGERPRINTS', default=500, cast=int)
+
+# Prometheus metrics (apps/core/metrics.py) served at /metrics. Scrapers
+# send "Authorization: Bearer <METRICS_TOKEN>"; without a token only staff
+# users can read them. Under gunicorn, PROMETHEUS_MULTIPROC_DIR (set in
+# gunicorn.conf.py) aggregates the workers.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Request tracing (apps/core/tracing.py). A request is traced with
+# probability TRACING_SAMPLE_RATE, or when the caller's traceparent header
+# says so and TRACING_TRUST_TRACEPARENT is set. Traces go as OTLP/JSON to
+# TRACING_FILE (TRACING_EXPORTER=file, rotated past TRACING_FILE_MAX_BYTES)
+# or to an OTLP/HTTP collector (=otlp).
+TRACING_ENABLED = config('TRACING_ENABLED', default=True, cast=bool)
+TRACING_SAMPLE_RATE = config('TRACING_SAMPLE_RATE', default=0.0, cast=float)
+TRACING_TRUST_TRACEPARENT = config('TRACING_TRUST_TRACEPARENT', default=False, cast=bool)
+TRACING_EXPORTER = config('TRACING_EXPORTER', default='file')
+TRACING_FILE = config('TRACING_FILE', default=str(BASE_DIR / 'traces.jsonl'))
+TRACING_FILE_MAX_BYTES = config('TRACING_FILE_MAX_BYTES', default=50 * 1024 * 1024, cast=int)
+TRACING_OTLP_ENDPOINT = config('TRACING_OTLP_ENDPOINT', default='http://localhost:4318/v1/traces')
+TRACING_MAX_SPANS = config('TRACING_MAX_SPANS', default=2000, cast=int)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -101,6 +212,11 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Real-time change events (see apps/core/events.py). Use
+# apps.core.events.PostgresBroker when running more than one worker process.
+EVENTS_BROKER = config('EVENTS_BROKER', default='apps.core.events.InProcessBroker')
+EVENTS_HEARTBEAT_SECONDS = config('EVENTS_HEARTBEAT_SECONDS', default=15, cast=int)
+
 # Static files configuration
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
@@ -19,8 +19,11 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD', default='sofia_password'),
         'HOST': config('DB_HOST', default='localhost'),
         'PORT': config('DB_PORT', default='5432'),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'pool': DB_POOL_OPTIONS} if DB_POOL_OPTIONS else {},
     }
 }
+DATABASES.update(replica_databases(DATABASES['default']))
 
 # CORS settings for development
 CORS_ALLOWED_ORIGINS = [
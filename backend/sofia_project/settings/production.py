@@ -22,9 +22,14 @@ ALLOWED_HOSTS = [host.strip() for sublist in ALLOWED_HOSTS for host in (sublist
 DATABASES = {
     'default': dj_database_url.config(
         default=config('DATABASE_URL', default=''),
-        conn_max_age=600
+        # Persistent connections and the pool are mutually exclusive.
+        conn_max_age=0 if DB_POOL_OPTIONS else 600,
+        conn_health_checks=True,
     )
 }
+if DB_POOL_OPTIONS:
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = DB_POOL_OPTIONS
+DATABASES.update(replica_databases(DATABASES['default']))
 
 # Security settings
 SECURE_BROWSER_XSS_FILTER = True
@@ -85,6 +90,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'apps.core.slow_queries': {
+            'handlers': ['file', 'console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
@@ -17,9 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from apps.core.views import MetricsAPIView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/core/', include('apps.core.urls')),
     path('api/auth/', include('apps.accounts.urls')),
+    path('metrics', MetricsAPIView.as_view(), name='metrics'),
 
 ]